@@ -1,6 +1,8 @@
 import logging
 import logging.config
 import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
@@ -8,9 +10,19 @@ from fastapi.openapi.utils import get_openapi
 from starlette.middleware.cors import CORSMiddleware
 
 from app.config import config as app_config
+from app.core.answer_cache import AnswerCache
+from app.core.collection_registry import CollectionRegistry
+from app.core.embedding_cache import CachedEmbeddings, get_cached_embeddings
 from app.core.environment import get_environment
 from app.core.logger import get_logger
+from app.core.llm_scheduler import LLMScheduler
+from app.core.metrics import CACHE_REQUESTS, CHAIN_RUNS, LOADED_COLLECTIONS
+from app.core.providers import LazyEmbeddings
+from app.core.query_embedder import BatchingQueryEmbeddings
+from app.core.vector_store import VectorStoreHandle
+from app.routers.metrics_router import metrics_router
 from app.routers.status_router import status_router
+from app.services.ingest_job_service import IngestJobService
 from app.routers.ingest_router import ingest_router
 from app.routers.retrieve_router import retrieve_router
 
@@ -41,7 +53,9 @@ def custom_openapi(app: FastAPI):
         "post": {
             "summary": "WebSocket Ingest Endpoint",
             "tags": ["Ingestion"],
-            "description": "WebSocket endpoint for ingesting documents.",
+            "description": "WebSocket endpoint for ingesting documents as a background job. "
+                           "Streams the job's progress; pass `collection` to ingest a named collection "
+                           "or `job_id` to follow an existing job.",
             "responses": {
                 "200": {
                     "description": "Connection established.",
@@ -52,7 +66,10 @@ def custom_openapi(app: FastAPI):
     openapi_schema["paths"]["/retrieve"] = {
         "post": {
             "summary": "WebSocket Retrieve Endpoint",
-            "description": "WebSocket endpoint for retrieving documents.",
+            "description": "WebSocket endpoint for retrieving documents. Clients offering the `rag.v1` "
+                           "subprotocol receive versioned JSON frames (`sources`, `delta`, `end`, `error`) "
+                           "with coalesced tokens; other clients receive plain text frames. Pass "
+                           "`collection` to query a named collection.",
             "tags": ["Chat completions"],
             "responses": {
                 "200": {
@@ -64,6 +81,25 @@ def custom_openapi(app: FastAPI):
     app.openapi_schema = openapi_schema
     return app.openapi_schema
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Start and stop the application's background workers.
+
+    Starting the ingest job worker also resumes jobs interrupted by a previous shutdown.
+    The source directory watcher runs if enabled.
+
+    Args:
+        app (FastAPI): The FastAPI application instance.
+    """
+    await app.state.ingest_jobs.start()
+    if app.state.ingest_watcher is not None:
+        await app.state.ingest_watcher.start()
+    yield
+    if app.state.ingest_watcher is not None:
+        await app.state.ingest_watcher.stop()
+    await app.state.ingest_jobs.stop()
+
 def create_app() -> FastAPI:
     """
     Create and configure an instance of the FastAPI application.
@@ -89,11 +125,24 @@ def create_app() -> FastAPI:
             version=app_config[APP_ENVIRONMENT].APP_VERSION,
             docs_url=None if APP_ENVIRONMENT == "production" else "/docs",
             redoc_url=None if APP_ENVIRONMENT == "production" else "/redoc",
+            lifespan=lifespan,
         )
 
         # Register the custom OpenAPI function
         app.openapi = lambda: custom_openapi(app)
 
+        # Register the shared vector store
+        init_vector_store(app, logger, APP_ENVIRONMENT)
+
+        # Register the background ingestion jobs
+        init_ingest_jobs(app, logger, APP_ENVIRONMENT)
+
+        # Register admission control of LLM calls
+        init_llm_scheduler(app, logger, APP_ENVIRONMENT)
+
+        # Register metrics of the shared caches
+        init_metrics(app, logger)
+
         # Register routers
         init_routers(app, logger)
 
@@ -106,6 +155,131 @@ def create_app() -> FastAPI:
         logger.error(f"An error occurred during app initialization: {e}")
         raise
 
+def init_vector_store(app_: FastAPI, logger: logging.Logger, environment: str) -> None:
+    """
+    Register the application-scoped collections and embeddings.
+
+    The collection registry is stored on `app.state.collections`. Each collection has its own
+    vector store handle, shared by all ingest and retrieve sessions of the collection so it is
+    only opened once per process, and its own answer cache in front of the RAG chain. The
+    embeddings, stored on `app.state.embeddings`, are shared by all collections; the embedding
+    model itself is only built on the first embedding call.
+
+    Args:
+        app_ (FastAPI): The FastAPI application instance.
+        logger (logging.Logger): Logger for logging information and errors.
+        environment (str): The current environment (e.g., "development", "production").
+    """
+    environment_config = app_config[environment]
+    embeddings = BatchingQueryEmbeddings(
+        get_cached_embeddings(
+            LazyEmbeddings(lambda: environment_config.EMBEDDINGS.embeddings),
+            model_name=environment_config.EMBEDDINGS.model_name,
+            cache_path=environment_config.EMBEDDING_CACHE_PATH,
+            max_entries=environment_config.EMBEDDING_CACHE_MAX_ENTRIES
+        ),
+        cache_size=environment_config.QUERY_EMBEDDING_CACHE_SIZE,
+        batch_window_ms=environment_config.QUERY_EMBEDDING_BATCH_WINDOW_MS,
+        max_batch_size=environment_config.QUERY_EMBEDDING_MAX_BATCH_SIZE
+    )
+    app_.state.embeddings = embeddings
+    app_.state.collections = CollectionRegistry(
+        environment_config.PERSIST_DIRECTORY,
+        environment_config.SOURCE_DIRECTORY,
+        environment_config.COLLECTIONS_SOURCE_DIRECTORY,
+        create_vector_store=lambda persist_directory: VectorStoreHandle(
+            persist_directory,
+            embeddings,
+            engine=environment_config.VECTOR_INDEX_ENGINE,
+            engine_params=environment_config.VECTOR_INDEX_PARAMS.get(environment_config.VECTOR_INDEX_ENGINE)
+        ),
+        create_answer_cache=lambda: AnswerCache(
+            max_entries=environment_config.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=environment_config.ANSWER_CACHE_TTL_SECONDS,
+            embeddings=embeddings,
+            similarity_threshold=environment_config.ANSWER_CACHE_SIMILARITY_THRESHOLD
+        ),
+        max_loaded=environment_config.MAX_LOADED_COLLECTIONS,
+        default_name=environment_config.DEFAULT_COLLECTION
+    )
+    logger.info("Registered vector store!")
+
+def init_ingest_jobs(app_: FastAPI, logger: logging.Logger, environment: str) -> None:
+    """
+    Register the background ingestion job service and the source directory watcher.
+
+    The service is stored on `app.state.ingest_jobs` and the watcher, if `INGEST_WATCH` is
+    enabled, on `app.state.ingest_watcher`; both are started and stopped by the application's
+    lifespan.
+
+    Args:
+        app_ (FastAPI): The FastAPI application instance.
+        logger (logging.Logger): Logger for logging information and errors.
+        environment (str): The current environment (e.g., "development", "production").
+    """
+    environment_config = app_config[environment]
+    app_.state.ingest_jobs = IngestJobService(app_.state.collections)
+    app_.state.ingest_watcher = None
+    if environment_config.INGEST_WATCH:
+        from app.services.ingest_watch_service import IngestWatchService
+
+        app_.state.ingest_watcher = IngestWatchService(
+            app_.state.ingest_jobs,
+            app_.state.collections,
+            debounce_ms=environment_config.INGEST_WATCH_DEBOUNCE_MS
+        )
+    logger.info("Registered ingest jobs!")
+
+def init_llm_scheduler(app_: FastAPI, logger: logging.Logger, environment: str) -> None:
+    """
+    Register the scheduler admitting /retrieve chain runs.
+
+    The scheduler is stored on `app.state.llm_scheduler` and shared by the sessions of all
+    collections, since they call the same language model.
+
+    Args:
+        app_ (FastAPI): The FastAPI application instance.
+        logger (logging.Logger): Logger for logging information and errors.
+        environment (str): The current environment (e.g., "development", "production").
+    """
+    environment_config = app_config[environment]
+    app_.state.llm_scheduler = LLMScheduler(
+        max_concurrency=environment_config.LLM_MAX_CONCURRENCY,
+        max_queue=environment_config.LLM_MAX_QUEUE,
+        queue_timeout=environment_config.LLM_QUEUE_TIMEOUT_SECONDS,
+        priorities=environment_config.LLM_PRIORITY_CLASSES
+    )
+    logger.info("Registered LLM scheduler!")
+
+def init_metrics(app_: FastAPI, logger: logging.Logger) -> None:
+    """
+    Register the hit and miss counts of the application's caches, the number of loaded
+    collections and the chain runs of the LLM scheduler as metrics.
+
+    The caches keep their own counts; they are read when `/metrics` is scraped, so lookups
+    pay nothing extra. Answer cache counts are summed over all collections.
+
+    Args:
+        app_ (FastAPI): The FastAPI application instance.
+        logger (logging.Logger): Logger for logging information and errors.
+    """
+    collections = app_.state.collections
+    caches = {"query_embedding": app_.state.embeddings}
+    if isinstance(app_.state.embeddings.embeddings, CachedEmbeddings):
+        caches["embedding"] = app_.state.embeddings.embeddings
+    for name, cache in caches.items():
+        CACHE_REQUESTS.set_callback(name, lambda name=name, cache=cache: {
+            (name, "hit"): cache.hits,
+            (name, "miss"): cache.misses,
+        })
+    CACHE_REQUESTS.set_callback("answer", lambda: dict(zip(
+        [("answer", "hit"), ("answer", "miss")], collections.answer_cache_counts()
+    )))
+    LOADED_COLLECTIONS.set_callback("collections", lambda: {(): len(collections.loaded())})
+    scheduler = app_.state.llm_scheduler
+    CHAIN_RUNS.set_callback("llm_scheduler", lambda: {("running",): scheduler.running, ("queued",): scheduler.queued})
+    logger.info("Registered metrics!")
+
 def init_routers(app_: FastAPI, logger: logging.Logger) -> None:
     """
     Register routers with the FastAPI application.
@@ -121,6 +295,7 @@ def init_routers(app_: FastAPI, logger: logging.Logger) -> None:
     """
     try:
         app_.include_router(status_router)
+        app_.include_router(metrics_router)
         app_.include_router(ingest_router)
         app_.include_router(retrieve_router)
         logger.info("Registered routes for app!")
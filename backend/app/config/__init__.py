@@ -1,12 +1,13 @@
 # Configuration for app environment
 
+import json
 from enum import Enum
-from os import environ, path
-from typing import Final
+from os import cpu_count, environ, path
+from typing import Final, Optional
 
-from app.config.llm_config import LLMConfig, OpenAIConfig
+from app.config.llm_config import FakeLLMConfig, LLMConfig, OpenAIConfig
 from app.config.embedding_config import EmbeddingConfig, \
-    OpenAIEmbeddingConfig
+    FakeEmbeddingConfig, OpenAIEmbeddingConfig
 
 basedir = path.abspath(path.join(path.dirname(__file__), '../../'))
 
@@ -24,6 +25,112 @@ class BaseConfig(object):
     # Embedding configuration
     EMBEDDINGS: EmbeddingConfig = OpenAIEmbeddingConfig()
 
+    # Vector store
+    PERSIST_DIRECTORY: str = environ.get('PERSIST_DIRECTORY') or path.join(basedir, 'chroma_db')
+    # Vector index engine, 'chroma' (HNSW) or 'numpy' (exact or IVF, for small collections)
+    VECTOR_INDEX_ENGINE: str = environ.get('VECTOR_INDEX_ENGINE') or 'chroma'
+    # Engine settings; Chroma applies HNSW settings only when the collection is created
+    VECTOR_INDEX_PARAMS: dict = {
+        'chroma': {
+            'hnsw:construction_ef': int(environ.get('HNSW_CONSTRUCTION_EF') or 100),
+            'hnsw:search_ef': int(environ.get('HNSW_SEARCH_EF') or 10),
+            'hnsw:M': int(environ.get('HNSW_M') or 16),
+        },
+        'numpy': {
+            'n_lists': int(environ.get('IVF_N_LISTS') or 0),
+            'n_probe': int(environ.get('IVF_N_PROBE') or 8),
+        },
+    }
+
+    # Collections: the default collection reads SOURCE_DIRECTORY and is persisted in PERSIST_DIRECTORY,
+    # collection <name> reads COLLECTIONS_SOURCE_DIRECTORY/<name> and is persisted in
+    # PERSIST_DIRECTORY/collections/<name>. Collections are loaded on first use; the least
+    # recently used idle ones are evicted beyond MAX_LOADED_COLLECTIONS
+    DEFAULT_COLLECTION: Final = 'default'
+    SOURCE_DIRECTORY: str = environ.get('SOURCE_DIRECTORY') or 'source_documents/'
+    COLLECTIONS_SOURCE_DIRECTORY: str = environ.get('COLLECTIONS_SOURCE_DIRECTORY') or 'collections/'
+    MAX_LOADED_COLLECTIONS: int = int(environ.get('MAX_LOADED_COLLECTIONS') or 8)
+
+    # Retrieval
+    RETRIEVER_K: int = int(environ.get('RETRIEVER_K') or 4)
+    RETRIEVER_SCORE_THRESHOLD: float = float(environ.get('RETRIEVER_SCORE_THRESHOLD') or 0.3)
+    # Retrieval mode, 'hybrid' (BM25 keyword and vector search, fused by reciprocal rank) or 'vector'
+    RETRIEVAL_MODE: str = environ.get('RETRIEVAL_MODE') or 'hybrid'
+    # Candidates fetched per search for fusion, and the reciprocal rank fusion constant
+    HYBRID_FETCH_K: int = int(environ.get('HYBRID_FETCH_K') or 20)
+    HYBRID_RRF_K: int = int(environ.get('HYBRID_RRF_K') or 60)
+    # Queries of up to this many terms, all known to the keyword index, skip vector search; 0 disables
+    KEYWORD_QUERY_MAX_TERMS: int = int(environ.get('KEYWORD_QUERY_MAX_TERMS') or 3)
+    # Re-ranking, 'lexical' (query term statistics, CPU only), 'cross-encoder' (needs
+    # sentence-transformers) or 'none'. RERANK_CANDIDATES are fetched, re-ranked and the best
+    # RETRIEVER_K kept as long as they fit in CONTEXT_TOKEN_BUDGET tokens. The prompt context is
+    # deduplicated and packed into the same budget
+    RERANKER: str = environ.get('RERANKER') or 'lexical'
+    RERANK_CANDIDATES: int = int(environ.get('RERANK_CANDIDATES') or 20)
+    RERANKER_MODEL: str = environ.get('RERANKER_MODEL') or 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+    RERANK_BATCH_SIZE: int = int(environ.get('RERANK_BATCH_SIZE') or 32)
+    CONTEXT_TOKEN_BUDGET: int = int(environ.get('CONTEXT_TOKEN_BUDGET') or 1000)
+
+    # Ingestion
+    LOADER_MAX_WORKERS: int = int(environ.get('LOADER_MAX_WORKERS') or cpu_count() or 1)
+    INGEST_BATCH_SIZE: int = int(environ.get('INGEST_BATCH_SIZE') or 256)
+    # Watch the source directories and ingest created, modified and deleted files automatically
+    # (needs watchfiles); changes are collected for INGEST_WATCH_DEBOUNCE_MS before ingesting
+    INGEST_WATCH: bool = (environ.get('INGEST_WATCH') or 'false').lower() in ('1', 'true', 'yes')
+    INGEST_WATCH_DEBOUNCE_MS: int = int(environ.get('INGEST_WATCH_DEBOUNCE_MS') or 1000)
+    # PDFs with more pages are loaded in page ranges of this size on several loader workers
+    PDF_PAGES_PER_TASK: int = int(environ.get('PDF_PAGES_PER_TASK') or 50)
+
+    # Chunking; sizes are in tokens. Strategies per file extension: 'records' (JSON records,
+    # other text is split recursively), 'markdown' and 'html' (headings) and 'recursive' (default)
+    CHUNK_SIZE: int = int(environ.get('CHUNK_SIZE') or 200)
+    CHUNK_OVERLAP: int = int(environ.get('CHUNK_OVERLAP') or 20)
+    CHUNKING_STRATEGIES: dict = {
+        '.txt': 'records',
+        '.md': 'markdown',
+        '.html': 'html',
+    }
+
+    # Metadata extracted from every chunk at ingest time, which /retrieve requests can filter on:
+    # `field: value` lines such as the maintenance log records, and regular expressions per field
+    # whose first group is the value, given as a JSON object, e.g. {"ticket": "(TCK-\\d+)"}.
+    # ISO dates are stored as YYYYMMDD numbers for range filters
+    METADATA_FIELDS: list = (environ.get('METADATA_FIELDS') or 'machine,date,issue,technician').split(',')
+    METADATA_PATTERNS: dict = json.loads(environ.get('METADATA_PATTERNS') or '{}')
+
+    # Embedding requests; INGEST_BATCH_SIZE should cover EMBEDDING_BATCH_SIZE * EMBEDDING_MAX_CONCURRENCY
+    EMBEDDING_BATCH_SIZE: int = int(environ.get('EMBEDDING_BATCH_SIZE') or 64)
+    EMBEDDING_MAX_CONCURRENCY: int = int(environ.get('EMBEDDING_MAX_CONCURRENCY') or 4)
+    EMBEDDING_MAX_RETRIES: int = int(environ.get('EMBEDDING_MAX_RETRIES') or 6)
+
+    # Persistent embedding cache, set EMBEDDING_CACHE_MAX_ENTRIES=0 to disable
+    EMBEDDING_CACHE_PATH: str = environ.get('EMBEDDING_CACHE_PATH') or path.join(PERSIST_DIRECTORY, 'embedding_cache.sqlite3')
+    EMBEDDING_CACHE_MAX_ENTRIES: int = int(environ.get('EMBEDDING_CACHE_MAX_ENTRIES') or 50000)
+
+    # Query embeddings: in-process LRU cache and micro-batching across sessions
+    QUERY_EMBEDDING_CACHE_SIZE: int = int(environ.get('QUERY_EMBEDDING_CACHE_SIZE') or 1024)
+    QUERY_EMBEDDING_BATCH_WINDOW_MS: float = float(environ.get('QUERY_EMBEDDING_BATCH_WINDOW_MS') or 5)
+    QUERY_EMBEDDING_MAX_BATCH_SIZE: int = int(environ.get('QUERY_EMBEDDING_MAX_BATCH_SIZE') or 32)
+
+    # Framed /retrieve protocol: tokens are coalesced into frames of up to this window or size
+    STREAM_COALESCE_WINDOW_MS: float = float(environ.get('STREAM_COALESCE_WINDOW_MS') or 100)
+    STREAM_COALESCE_MAX_CHARS: int = int(environ.get('STREAM_COALESCE_MAX_CHARS') or 512)
+
+    # Answer cache for /retrieve, one per collection; set ANSWER_CACHE_MAX_ENTRIES=0 to disable
+    ANSWER_CACHE_MAX_ENTRIES: int = int(environ.get('ANSWER_CACHE_MAX_ENTRIES') or 1000)
+    ANSWER_CACHE_TTL_SECONDS: float = float(environ.get('ANSWER_CACHE_TTL_SECONDS') or 3600)
+    # Minimum cosine similarity for semantic hits, leave empty to only serve exact matches
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: Optional[float] = float(environ['ANSWER_CACHE_SIMILARITY_THRESHOLD']) \
+        if environ.get('ANSWER_CACHE_SIMILARITY_THRESHOLD') else None
+
+    # Admission control of /retrieve chain runs, per process: runs beyond LLM_MAX_CONCURRENCY wait
+    # in a queue of LLM_MAX_QUEUE runs for at most LLM_QUEUE_TIMEOUT_SECONDS, served by priority
+    # class (highest first); set LLM_MAX_CONCURRENCY=0 to disable
+    LLM_MAX_CONCURRENCY: int = int(environ.get('LLM_MAX_CONCURRENCY') or 16)
+    LLM_MAX_QUEUE: int = int(environ.get('LLM_MAX_QUEUE') or 64)
+    LLM_QUEUE_TIMEOUT_SECONDS: float = float(environ.get('LLM_QUEUE_TIMEOUT_SECONDS') or 10)
+    LLM_PRIORITY_CLASSES: list = (environ.get('LLM_PRIORITY_CLASSES') or 'interactive,batch').split(',')
+
     # Logging
     LOGGING: dict = {
         'version': 1,
@@ -77,8 +184,19 @@ class Production(BaseConfig):
     TESTING = False
     ENV = 'production'
 
+class Benchmark(BaseConfig):
+    """ Benchmark config, runs offline against fake models. """
+
+    DEBUG = False
+    TESTING = True
+    ENV = 'benchmark'
+
+    LLM: LLMConfig = FakeLLMConfig()
+    EMBEDDINGS: EmbeddingConfig = FakeEmbeddingConfig()
+
 config = {
     'development': Development,
     'testing': Testing,
     'production': Production,
+    'benchmark': Benchmark,
 }
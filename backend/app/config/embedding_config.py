@@ -1,12 +1,39 @@
-from langchain_openai import OpenAIEmbeddings
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+from app.core.providers import import_string
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
 
 class EmbeddingConfig(object):
-    """ Backend embedding configuration parameters. """
-    pass
+    """
+    Backend embedding configuration parameters.
+
+    The embeddings class is given as an import path and only imported when `embeddings`
+    is first accessed; the client is then reused for the life of the process.
+    """
+    model_name: str
+    provider: str
 
 class OpenAIEmbeddingConfig(EmbeddingConfig):
     """ Configuration for OpenAI embeddings. """
     model_name = "text-embedding-ada-002"
-    embeddings = OpenAIEmbeddings(
-        model=model_name
-    )
+    provider = "langchain_openai:OpenAIEmbeddings"
+
+    @cached_property
+    def embeddings(self) -> "Embeddings":
+        return import_string(self.provider)(
+            model=self.model_name
+        )
+
+class FakeEmbeddingConfig(EmbeddingConfig):
+    """ Configuration for deterministic offline embeddings, used for testing. """
+    model_name = "hashing-embedding"
+    provider = "app.core.fake_models:HashingEmbeddings"
+
+    @cached_property
+    def embeddings(self) -> "Embeddings":
+        return import_string(self.provider)(
+            size=1536
+        )
@@ -1,16 +1,45 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.callbacks import StreamingStdOutCallbackHandler
+from functools import cached_property
+from os import environ
+from typing import TYPE_CHECKING
+
+from app.core.providers import import_string
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
 
 class LLMConfig(object):
-    """ Backend LLM configuration parameters. """
-    pass
+    """
+    Backend LLM configuration parameters.
+
+    The model class is given as an import path and only imported when `llm` is first
+    accessed; the model is then reused for the life of the process.
+    """
+    model_name: str
+    provider: str
 
 class OpenAIConfig(LLMConfig):
     """ Configuration for OpenAI LLM. """
     model_name = "gpt-4o-mini"
-    llm = ChatOpenAI(
-        model_name=model_name,
-        streaming=True,
-        callbacks=[StreamingStdOutCallbackHandler()],
-        temperature=0
-    )
+    provider = "langchain_openai:ChatOpenAI"
+
+    @cached_property
+    def llm(self) -> "BaseChatModel":
+        streaming_handler = import_string("langchain_core.callbacks:StreamingStdOutCallbackHandler")
+        return import_string(self.provider)(
+            model_name=self.model_name,
+            streaming=True,
+            callbacks=[streaming_handler()],
+            temperature=0
+        )
+
+class FakeLLMConfig(LLMConfig):
+    """ Configuration for an offline fake LLM with injectable latency, used for testing. """
+    model_name = "fake-streaming-chat"
+    provider = "app.core.fake_models:FakeStreamingChatModel"
+
+    @cached_property
+    def llm(self) -> "BaseChatModel":
+        return import_string(self.provider)(
+            first_token_latency=float(environ.get('FAKE_LLM_FIRST_TOKEN_LATENCY') or 0.2),
+            token_latency=float(environ.get('FAKE_LLM_TOKEN_LATENCY') or 0.02)
+        )
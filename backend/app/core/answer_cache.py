@@ -0,0 +1,169 @@
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """ Normalizes a query for exact-match lookups. """
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+def split_answer(answer: str) -> List[str]:
+    """ Splits a cached answer into word-sized pieces for streaming. """
+    return re.findall(r"\s*\S+\s*", answer) or [answer]
+
+
+@dataclass
+class CachedAnswer:
+    """ An answer stored in the cache. """
+    answer: str
+    embedding: Optional[np.ndarray]
+    expires_at: float
+    scope: str = ""
+
+
+class AnswerCache:
+    """
+    In-process cache of answers in front of the RAG chain.
+
+    Lookups first try an exact match on the normalized query and then, if a
+    similarity threshold is configured, the cached query whose embedding is most
+    similar. Entries expire after `ttl_seconds` and the least recently used entry
+    is evicted when the cache is full. The cache is cleared whenever the
+    collection version changes, so answers never outlive the data they came from.
+    Answers are only served to queries of the same scope, e.g. the same retrieval filter.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        embeddings: Embeddings,
+        similarity_threshold: Optional[float] = None
+    ):
+        """
+        Initializes the AnswerCache.
+
+        Args:
+            max_entries (int): The maximum number of cached answers; 0 disables the cache.
+            ttl_seconds (float): How long an answer stays valid.
+            embeddings (Embeddings): The embeddings used for semantic lookups.
+            similarity_threshold (Optional[float]): The minimum cosine similarity for a semantic
+                hit, or None to only serve exact matches.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.version = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        """ Whether the cache stores answers at all. """
+        return self.max_entries > 0
+
+    def _sync_version(self, version: int) -> None:
+        """ Clears the cache if the collection changed since the entries were stored. """
+        if version != self.version:
+            if self._entries:
+                logger.info(f"Collection changed to version {version}; clearing {len(self._entries)} cached answers")
+            self._entries.clear()
+            self.version = version
+
+    def _evict_expired(self) -> None:
+        """ Drops expired entries. """
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            del self._entries[key]
+
+    async def _embed(self, query: str) -> Optional[np.ndarray]:
+        """ Returns the normalized query embedding used for semantic lookups, if enabled. """
+        if self.similarity_threshold is None:
+            return None
+        vector = np.asarray(await self.embeddings.aembed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _key(query: str, scope: str) -> str:
+        """ Returns the exact-match key of a query within a scope. """
+        key = normalize_query(query)
+        return f"{scope}\0{key}" if scope else key
+
+    async def get(self, query: str, version: int, scope: str = "") -> Optional[str]:
+        """
+        Looks up the answer to a query.
+
+        Args:
+            query (str): The query.
+            version (int): The current collection version.
+            scope (str): The scope of the query, e.g. its retrieval filter.
+
+        Returns:
+            Optional[str]: The cached answer, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        self._sync_version(version)
+        self._evict_expired()
+
+        key = self._key(query, scope)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.answer
+
+        candidates = [(key, entry) for key, entry in self._entries.items() if entry.embedding is not None and entry.scope == scope]
+        if candidates:
+            embedding = await self._embed(query)
+            if embedding is not None and version == self.version:
+                similarities = np.stack([entry.embedding for _, entry in candidates]) @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    best_key, best_entry = candidates[best]
+                    if best_key in self._entries:
+                        self._entries.move_to_end(best_key)
+                        self.hits += 1
+                        self.semantic_hits += 1
+                        logger.debug(f"Semantic answer cache hit ({similarities[best]:.3f}) for '{query}'")
+                        return best_entry.answer
+
+        self.misses += 1
+        return None
+
+    async def put(self, query: str, answer: str, version: int, scope: str = "") -> None:
+        """
+        Stores the answer to a query.
+
+        Args:
+            query (str): The query.
+            answer (str): The complete answer.
+            version (int): The collection version the answer was generated from.
+            scope (str): The scope of the query, e.g. its retrieval filter.
+        """
+        if not self.enabled or not answer:
+            return
+        embedding = await self._embed(query)
+        if self.version is not None and version < self.version:
+            # The collection changed while the answer was generated
+            return
+        self._sync_version(version)
+        key = self._key(query, scope)
+        self._entries[key] = CachedAnswer(answer, embedding, time.monotonic() + self.ttl_seconds, scope)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,213 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket
+
+from app.core.answer_cache import split_answer
+from app.core.context import Passage
+
+# WebSocket subprotocol of the framed /retrieve protocol; its version is also sent in every frame
+PROTOCOL = "rag.v1"
+PROTOCOL_VERSION = 1
+
+
+def negotiate_protocol(websocket: WebSocket) -> Optional[str]:
+    """
+    Picks the /retrieve protocol from the subprotocols offered by the client.
+
+    Args:
+        websocket (WebSocket): The connection, not yet accepted.
+
+    Returns:
+        Optional[str]: `PROTOCOL` if the client offered it, or None for the plain text protocol.
+    """
+    return PROTOCOL if PROTOCOL in websocket.scope.get("subprotocols", []) else None
+
+
+class AnswerStream(ABC):
+    """ Sends the parts of an answer to a /retrieve client. """
+
+    def __init__(self, websocket: WebSocket):
+        """
+        Initializes the stream.
+
+        Args:
+            websocket (WebSocket): The accepted connection.
+        """
+        self.websocket = websocket
+
+    @abstractmethod
+    async def sources(self, passages: List[Passage]) -> None:
+        """ Sends the sources of the context passages, numbered as in the prompt. """
+
+    @abstractmethod
+    async def delta(self, text: str) -> None:
+        """ Sends the next piece of the answer. """
+
+    async def cached(self, answer: str) -> None:
+        """ Sends a complete answer taken from the answer cache. """
+        for piece in split_answer(answer):
+            await self.delta(piece)
+
+    @abstractmethod
+    async def end(self, answer: str, timings: Dict[str, float], cached: bool = False) -> None:
+        """
+        Ends the answer.
+
+        Args:
+            answer (str): The complete answer.
+            timings (Dict[str, float]): Milliseconds spent per stage.
+            cached (bool): Whether the answer came from the answer cache.
+        """
+
+    @abstractmethod
+    async def error(self, message: str, retry_after: Optional[int] = None) -> None:
+        """ Reports an error that ended the answer, with the seconds to wait before retrying if the server is busy. """
+
+
+class TextAnswerStream(AnswerStream):
+    """
+    The original plain text protocol, kept for clients that do not negotiate `PROTOCOL`.
+
+    Every token is its own text frame and the answer is repeated in a final
+    `Full response: ...` frame. Sources and timings are not sent.
+    """
+
+    async def sources(self, passages: List[Passage]) -> None:
+        pass
+
+    async def delta(self, text: str) -> None:
+        await self.websocket.send_text(text)
+
+    async def end(self, answer: str, timings: Dict[str, float], cached: bool = False) -> None:
+        await self.websocket.send_text(f"Full response: {answer}")
+
+    async def error(self, message: str, retry_after: Optional[int] = None) -> None:
+        error = {"error": message}
+        if retry_after is not None:
+            error["retry_after"] = retry_after
+        await self.websocket.send_text(json.dumps(error))
+
+
+class FramedAnswerStream(AnswerStream):
+    """
+    Versioned JSON framing for /retrieve, negotiated as the `rag.v1` WebSocket subprotocol.
+
+    Every frame is a JSON object with the protocol version `v` and a `type`:
+
+    - `sources`: `{"sources": [{"id": 1, "source": "file.txt"}, ...]}`, the passages of the
+      context, sent once retrieval is done,
+    - `delta`: `{"text": "..."}`, the next piece of the answer,
+    - `end`: `{"cached": false, "length": 123, "timings": {...}}`, the single frame ending an
+      answer, with the answer length in characters and the milliseconds spent per stage,
+    - `error`: `{"message": "..."}`, ends the answer instead of `end`; when the server is too
+      busy to answer, `retry_after` suggests how many seconds to wait before asking again.
+
+    Tokens are coalesced into `delta` frames: the first token is sent right away, later
+    tokens are buffered until `window_ms` has passed or `max_chars` characters are pending.
+    The answer is not repeated at the end; clients concatenate the deltas. Frames are
+    compressed when the client negotiates permessage-deflate.
+    """
+
+    def __init__(self, websocket: WebSocket, window_ms: float = 100, max_chars: int = 512):
+        """
+        Initializes the stream.
+
+        Args:
+            websocket (WebSocket): The accepted connection.
+            window_ms (float): The longest time a token waits in the buffer, in milliseconds.
+            max_chars (int): The buffered characters that trigger sending a frame.
+        """
+        super().__init__(websocket)
+        self.window = window_ms / 1000
+        self.max_chars = max_chars
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._sent_delta = False
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set = set()
+        self._send_lock = asyncio.Lock()
+
+    async def _send(self, frame_type: str, **fields) -> None:
+        """ Sends a frame; the lock keeps frames in order when a timed flush is sending too. """
+        async with self._send_lock:
+            await self.websocket.send_text(
+                json.dumps({"v": PROTOCOL_VERSION, "type": frame_type, **fields}, separators=(",", ":"))
+            )
+
+    def _schedule_flush(self) -> None:
+        """ Flushes the buffer once the coalescing window has passed. """
+        def flush() -> None:
+            self._timer = None
+            task = asyncio.ensure_future(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+        self._timer = asyncio.get_running_loop().call_later(self.window, flush)
+
+    async def flush(self) -> None:
+        """ Sends the buffered tokens as one `delta` frame. """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer, self._buffered_chars = [], 0
+        await self._send("delta", text=text)
+
+    async def sources(self, passages: List[Passage]) -> None:
+        await self._send("sources", sources=[
+            {"id": number, "source": passage.source} for number, passage in enumerate(passages, start=1)
+        ])
+
+    async def delta(self, text: str) -> None:
+        self._buffer.append(text)
+        self._buffered_chars += len(text)
+        if not self._sent_delta or self._buffered_chars >= self.max_chars:
+            self._sent_delta = True
+            await self.flush()
+        elif self._timer is None:
+            self._schedule_flush()
+
+    async def cached(self, answer: str) -> None:
+        await self.delta(answer)
+
+    async def _finish(self) -> None:
+        """ Sends the remaining tokens and resets the stream for the next answer. """
+        await self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes)
+        self._sent_delta = False
+
+    async def end(self, answer: str, timings: Dict[str, float], cached: bool = False) -> None:
+        await self._finish()
+        await self._send("end", cached=cached, length=len(answer), timings={
+            stage: round(milliseconds, 1) for stage, milliseconds in timings.items()
+        })
+
+    async def error(self, message: str, retry_after: Optional[int] = None) -> None:
+        await self._finish()
+        if retry_after is None:
+            await self._send("error", message=message)
+        else:
+            await self._send("error", message=message, retry_after=retry_after)
+
+
+def create_answer_stream(websocket: WebSocket, window_ms: float = 100, max_chars: int = 512) -> AnswerStream:
+    """
+    Creates the answer stream for the protocol negotiated by the client.
+
+    Args:
+        websocket (WebSocket): The accepted connection.
+        window_ms (float): The coalescing window of the framed protocol, in milliseconds.
+        max_chars (int): The buffered characters that trigger a frame in the framed protocol.
+
+    Returns:
+        AnswerStream: A `FramedAnswerStream` for `PROTOCOL` clients, a `TextAnswerStream` otherwise.
+    """
+    if negotiate_protocol(websocket) == PROTOCOL:
+        return FramedAnswerStream(websocket, window_ms=window_ms, max_chars=max_chars)
+    return TextAnswerStream(websocket)
@@ -0,0 +1,278 @@
+import json
+import re
+from abc import abstractmethod
+from functools import lru_cache
+from html.parser import HTMLParser
+from typing import Any, Iterator, List, Optional, Tuple
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
+
+from app.core.tokens import count_tokens
+
+# A section of a structured document: its title path and body text
+Section = Tuple[str, str]
+
+
+class SectionSplitter(TextSplitter):
+    """
+    Base class for splitters that follow the structure of a document.
+
+    Subclasses break a text into titled sections (records, headings, ...). Consecutive
+    sections with the same title are packed into chunks of up to `chunk_size` tokens,
+    every chunk starts with its section title, and sections larger than a chunk are split
+    further with a token-sized recursive splitter. Texts without recognizable structure
+    are split with the recursive splitter only.
+
+    Packed sections may carry different metadata, e.g. the records of two machines; the
+    `MetadataExtractor` then records every value of the chunk.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        """
+        Initializes the splitter.
+
+        Args:
+            chunk_size (int): The maximum chunk size, in tokens.
+            chunk_overlap (int): The overlap between pieces of oversized sections, in tokens.
+        """
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=count_tokens)
+        self.fallback = create_recursive_splitter(chunk_size, chunk_overlap)
+
+    @abstractmethod
+    def sections(self, text: str) -> Optional[List[Section]]:
+        """
+        Breaks text into titled sections.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            Optional[List[Section]]: The sections in document order, or None if the text
+                has no structure this splitter recognizes.
+        """
+
+    def split_text(self, text: str) -> List[str]:
+        sections = self.sections(text)
+        if not sections:
+            return self.fallback.split_text(text)
+        chunks, parts, title, size = [], [], None, 0
+        for section_title, body in sections:
+            if parts and section_title != title:
+                chunks.append(self._join(title, parts))
+                parts, size = [], 0
+            title = section_title
+            budget = self._chunk_size - (self._length_function(title) if title else 0)
+            body_size = self._length_function(body)
+            if body_size > budget:
+                if parts:
+                    chunks.append(self._join(title, parts))
+                    parts, size = [], 0
+                chunks.extend(self._join(title, [piece]) for piece in self.fallback.split_text(body))
+                continue
+            if parts and size + body_size > budget:
+                chunks.append(self._join(title, parts))
+                parts, size = [], 0
+            parts.append(body)
+            size += body_size
+        if parts:
+            chunks.append(self._join(title, parts))
+        return chunks
+
+    @staticmethod
+    def _join(title: Optional[str], parts: List[str]) -> str:
+        """ Joins section bodies into a chunk headed by their title. """
+        body = "\n\n".join(parts)
+        return f"{title}\n{body}" if title else body
+
+
+class RecordSplitter(SectionSplitter):
+    """
+    Splits JSON documents into whole records.
+
+    A record is an object whose values are scalars or lists of scalars, e.g. one entry of
+    a maintenance log. Records are rendered as `key: value` lines under the path of the
+    collection they belong to, which keeps every record intact and drops JSON punctuation
+    that would otherwise cost prompt tokens. Text that is not valid JSON falls back to
+    recursive splitting.
+    """
+
+    def sections(self, text: str) -> Optional[List[Section]]:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(data, (dict, list)):
+            return None
+        return [(" > ".join(path), self._render(record)) for path, record in self._records(data, [])]
+
+    def _records(self, value: Any, path: List[str]) -> Iterator[Tuple[List[str], Any]]:
+        """ Yields the records nested in value with their key paths. """
+        if isinstance(value, list):
+            if all(self._is_scalar(item) for item in value):
+                yield path, value
+                return
+            for item in value:
+                yield from self._records(item, path)
+        elif isinstance(value, dict):
+            if all(self._is_scalar(item) or self._is_scalar_list(item) for item in value.values()):
+                yield path, value
+                return
+            scalars = {key: item for key, item in value.items() if self._is_scalar(item)}
+            if scalars:
+                yield path, scalars
+            for key, item in value.items():
+                if not self._is_scalar(item):
+                    yield from self._records(item, path + [str(key)])
+        else:
+            yield path, value
+
+    @staticmethod
+    def _is_scalar(value: Any) -> bool:
+        return value is None or isinstance(value, (str, int, float, bool))
+
+    @classmethod
+    def _is_scalar_list(cls, value: Any) -> bool:
+        return isinstance(value, list) and all(cls._is_scalar(item) for item in value)
+
+    @staticmethod
+    def _render(record: Any) -> str:
+        """ Renders a record as `key: value` lines. """
+        if isinstance(record, dict):
+            return "\n".join(
+                f"{key}: {'; '.join(map(str, value)) if isinstance(value, list) else value}"
+                for key, value in record.items()
+            )
+        if isinstance(record, list):
+            return "\n".join(map(str, record))
+        return str(record)
+
+
+class MarkdownHeadingSplitter(SectionSplitter):
+    """ Splits Markdown documents at their headings, ignoring headings inside code blocks. """
+
+    HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+
+    def sections(self, text: str) -> Optional[List[Section]]:
+        sections, headings, lines = [], [], []
+        in_code = False
+
+        def flush() -> None:
+            body = "\n".join(lines).strip()
+            if body:
+                sections.append((" > ".join(title for _, title in headings), body))
+            lines.clear()
+
+        for line in text.splitlines():
+            if line.lstrip().startswith(("```", "~~~")):
+                in_code = not in_code
+            match = None if in_code else self.HEADING.match(line)
+            if match is None:
+                lines.append(line)
+                continue
+            flush()
+            level = len(match.group(1))
+            headings = [heading for heading in headings if heading[0] < level] + [(level, match.group(2))]
+        flush()
+        return sections if any(title for title, _ in sections) else None
+
+
+class _HTMLSectionParser(HTMLParser):
+    """ Collects the visible text of an HTML document, grouped by the headings above it. """
+
+    HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+    BLOCKS = {"p", "div", "li", "tr", "br", "section", "article", "pre", "blockquote", "table"}
+    SKIPPED = {"script", "style", "head", "noscript", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sections: List[Section] = []
+        self.headings: List[Tuple[int, str]] = []
+        self.text: List[str] = []
+        self.heading_level: Optional[int] = None
+        self.heading_text: List[str] = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag in self.SKIPPED:
+            self.skipping += 1
+        elif tag in self.HEADINGS:
+            self.flush()
+            self.heading_level = self.HEADINGS[tag]
+            self.heading_text = []
+        elif tag in self.BLOCKS:
+            self.text.append("\n")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self.SKIPPED:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in self.HEADINGS and self.heading_level is not None:
+            title = " ".join("".join(self.heading_text).split())
+            self.headings = [h for h in self.headings if h[0] < self.heading_level] + [(self.heading_level, title)]
+            self.heading_level = None
+        elif tag in self.BLOCKS:
+            self.text.append("\n")
+
+    def handle_data(self, data: str) -> None:
+        if self.skipping:
+            return
+        if self.heading_level is not None:
+            self.heading_text.append(data)
+        else:
+            self.text.append(data)
+
+    def flush(self) -> None:
+        """ Ends the current section. """
+        lines = (" ".join(line.split()) for line in "".join(self.text).splitlines())
+        body = "\n".join(line for line in lines if line)
+        if body:
+            self.sections.append((" > ".join(title for _, title in self.headings), body))
+        self.text = []
+
+
+class HTMLHeadingSplitter(SectionSplitter):
+    """ Splits HTML documents at their `h1`-`h6` headings, keeping only visible text. """
+
+    def sections(self, text: str) -> Optional[List[Section]]:
+        parser = _HTMLSectionParser()
+        parser.feed(text)
+        parser.close()
+        parser.flush()
+        return parser.sections or None
+
+
+def create_recursive_splitter(chunk_size: int, chunk_overlap: int) -> TextSplitter:
+    """ Returns a recursive character splitter that measures chunks in tokens. """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=count_tokens
+    )
+
+
+CHUNKING_STRATEGIES = {
+    "recursive": create_recursive_splitter,
+    "records": RecordSplitter,
+    "markdown": MarkdownHeadingSplitter,
+    "html": HTMLHeadingSplitter,
+}
+
+
+@lru_cache(maxsize=None)
+def get_text_splitter(strategy: str, chunk_size: int, chunk_overlap: int) -> TextSplitter:
+    """
+    Returns the splitter for a chunking strategy, created once per process.
+
+    Args:
+        strategy (str): The strategy name, a key of `CHUNKING_STRATEGIES`.
+        chunk_size (int): The maximum chunk size, in tokens.
+        chunk_overlap (int): The overlap between consecutive chunks, in tokens.
+
+    Returns:
+        TextSplitter: The text splitter.
+
+    Raises:
+        ValueError: If the strategy is unknown.
+    """
+    if strategy not in CHUNKING_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy '{strategy}'")
+    return CHUNKING_STRATEGIES[strategy](chunk_size, chunk_overlap)
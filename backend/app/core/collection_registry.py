@@ -0,0 +1,232 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.core.answer_cache import AnswerCache
+from app.core.logger import get_logger
+from app.core.single_flight import SingleFlight
+from app.core.vector_store import VectorStoreHandle
+
+logger = get_logger(__name__)
+
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+@dataclass
+class Collection:
+    """ A loaded collection: its vector store, answer cache, answers in flight and usage. """
+    name: str
+    source_directory: str
+    vector_store: VectorStoreHandle
+    answer_cache: AnswerCache
+    flights: SingleFlight = field(default_factory=SingleFlight)
+    leases: int = 0
+    last_used: float = 0.0
+
+
+class CollectionRegistry:
+    """
+    Named collections, loaded on first use and evicted when idle.
+
+    Every collection has its own persist directory, source directory and answer cache. The
+    default collection keeps the original layout: it is persisted in the persist directory
+    itself and reads the default source directory. Other collections are persisted in
+    `<persist directory>/collections/<name>` and read `<collections source directory>/<name>`.
+
+    Sessions and ingestion jobs lease the collection they use. When more than `max_loaded`
+    collections are loaded, the least recently used ones without leases are closed; they are
+    reopened from disk on their next use.
+    """
+
+    COLLECTIONS_DIRNAME = "collections"
+
+    def __init__(
+        self,
+        persist_directory: str,
+        source_directory: str,
+        collections_source_directory: str,
+        create_vector_store: Callable[[str], VectorStoreHandle],
+        create_answer_cache: Callable[[], AnswerCache],
+        max_loaded: int = 8,
+        default_name: str = "default"
+    ):
+        """
+        Initializes the registry without loading any collection.
+
+        Args:
+            persist_directory (str): The persist directory of the default collection, containing the others.
+            source_directory (str): The source directory of the default collection.
+            collections_source_directory (str): The directory containing the other collections' source directories.
+            create_vector_store (Callable[[str], VectorStoreHandle]): Creates a vector store for a persist directory.
+            create_answer_cache (Callable[[], AnswerCache]): Creates an empty answer cache.
+            max_loaded (int): The number of collections kept loaded while idle.
+            default_name (str): The name of the default collection.
+        """
+        self.root_directory = persist_directory
+        self.default_source_directory = source_directory
+        self.collections_source_directory = collections_source_directory
+        self.create_vector_store = create_vector_store
+        self.create_answer_cache = create_answer_cache
+        self.max_loaded = max(1, max_loaded)
+        self.default_name = default_name
+        self._collections: Dict[str, Collection] = {}
+        self._retired_cache_counts = (0, 0)
+        self._lock = threading.RLock()
+
+    def resolve(self, name: Optional[str]) -> str:
+        """
+        Validates a collection name.
+
+        Args:
+            name (Optional[str]): The collection name, or None for the default collection.
+
+        Returns:
+            str: The collection name.
+
+        Raises:
+            ValueError: If the name is not 1-64 letters, digits, '_' or '-'.
+        """
+        name = name or self.default_name
+        if not COLLECTION_NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid collection name '{name}'")
+        return name
+
+    def persist_directory(self, name: str) -> str:
+        """ Returns the persist directory of a collection. """
+        if name == self.default_name:
+            return self.root_directory
+        return os.path.join(self.root_directory, self.COLLECTIONS_DIRNAME, name)
+
+    def source_directory(self, name: str) -> str:
+        """ Returns the source directory of a collection. """
+        if name == self.default_name:
+            return self.default_source_directory
+        return os.path.join(self.collections_source_directory, name)
+
+    def exists(self, name: str) -> bool:
+        """ Returns whether a collection has been ingested or has a source directory. """
+        return (
+            name == self.default_name
+            or os.path.isdir(self.persist_directory(name))
+            or os.path.isdir(self.source_directory(name))
+        )
+
+    def _load(self, name: Optional[str]) -> Collection:
+        """ Returns a collection, loading it if needed, without evicting others. """
+        name = self.resolve(name)
+        collection = self._collections.get(name)
+        if collection is None:
+            if not self.exists(name):
+                raise ValueError(f"Unknown collection '{name}'")
+            logger.info(f"Loading collection '{name}'")
+            collection = Collection(
+                name=name,
+                source_directory=self.source_directory(name),
+                vector_store=self.create_vector_store(self.persist_directory(name)),
+                answer_cache=self.create_answer_cache()
+            )
+            self._collections[name] = collection
+        collection.last_used = time.monotonic()
+        return collection
+
+    def get(self, name: Optional[str] = None) -> Collection:
+        """
+        Returns a collection, loading it on first use.
+
+        The collection may be evicted again once other collections are loaded; use `acquire`
+        or `lease` to keep it loaded while it is in use.
+
+        Args:
+            name (Optional[str]): The collection name, or None for the default collection.
+
+        Returns:
+            Collection: The loaded collection.
+
+        Raises:
+            ValueError: If the name is invalid or the collection does not exist.
+        """
+        with self._lock:
+            collection = self._load(name)
+            self._evict(keep=collection)
+            return collection
+
+    def acquire(self, name: Optional[str] = None) -> Collection:
+        """
+        Returns a collection and keeps it loaded until `release` is called.
+
+        Args:
+            name (Optional[str]): The collection name, or None for the default collection.
+
+        Returns:
+            Collection: The loaded collection.
+
+        Raises:
+            ValueError: If the name is invalid or the collection does not exist.
+        """
+        with self._lock:
+            collection = self._load(name)
+            collection.leases += 1
+            self._evict()
+            return collection
+
+    def release(self, collection: Collection) -> None:
+        """ Ends a lease taken with `acquire`, evicting idle collections beyond the budget. """
+        with self._lock:
+            collection.leases -= 1
+            collection.last_used = time.monotonic()
+            self._evict()
+
+    @contextmanager
+    def lease(self, name: Optional[str] = None) -> Iterator[Collection]:
+        """
+        Keeps a collection loaded while it is in use.
+
+        Args:
+            name (Optional[str]): The collection name, or None for the default collection.
+
+        Yields:
+            Collection: The loaded collection.
+
+        Raises:
+            ValueError: If the name is invalid or the collection does not exist.
+        """
+        collection = self.acquire(name)
+        try:
+            yield collection
+        finally:
+            self.release(collection)
+
+    def _evict(self, keep: Optional[Collection] = None) -> None:
+        """ Closes the least recently used idle collections beyond `max_loaded`, except `keep`. """
+        idle = sorted(
+            (
+                collection for collection in self._collections.values()
+                if collection.leases == 0 and collection is not keep
+            ),
+            key=lambda collection: collection.last_used
+        )
+        excess = len(self._collections) - self.max_loaded
+        for collection in idle[:max(0, excess)]:
+            logger.info(f"Evicting idle collection '{collection.name}'")
+            del self._collections[collection.name]
+            hits, misses = self._retired_cache_counts
+            self._retired_cache_counts = (hits + collection.answer_cache.hits, misses + collection.answer_cache.misses)
+            collection.vector_store.close()
+
+    def loaded(self) -> List[str]:
+        """ Returns the names of the loaded collections. """
+        with self._lock:
+            return list(self._collections)
+
+    def answer_cache_counts(self) -> Tuple[int, int]:
+        """ Returns the answer cache hits and misses of all collections, evicted ones included. """
+        with self._lock:
+            hits, misses = self._retired_cache_counts
+            for collection in self._collections.values():
+                hits += collection.answer_cache.hits
+                misses += collection.answer_cache.misses
+            return hits, misses
@@ -0,0 +1,135 @@
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from app.core.logger import get_logger
+from app.core.tokens import count_tokens, truncate_tokens
+
+logger = get_logger(__name__)
+
+# Shortest shared text treated as chunk overlap rather than coincidence, in characters
+MIN_OVERLAP_CHARS = 16
+# A passage cut at the token budget is only kept if at least this many tokens remain
+MIN_TRUNCATED_TOKENS = 32
+CONTEXT_SEPARATOR = "\n\n"
+
+
+@dataclass
+class Passage:
+    """ Text of one or more merged chunks of a source document. """
+    source: str
+    text: str
+
+
+def _overlap(first: str, second: str) -> int:
+    """ Returns the length of the longest suffix of `first` that is a prefix of `second`. """
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    position = first.find(probe, max(0, len(first) - len(second)))
+    while position != -1:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(probe, position + 1)
+    return 0
+
+
+def _append(first: str, second: str) -> Optional[str]:
+    """
+    Joins two chunks if `second` continues `first`.
+
+    Pieces of an oversized section repeat the section title on their first line, so the
+    title is also skipped when looking for the overlap.
+
+    Returns:
+        Optional[str]: The merged text, or None if the chunks do not overlap.
+    """
+    candidates = [second]
+    title, _, body = second.partition("\n")
+    if body and first.startswith(f"{title}\n"):
+        candidates.append(body)
+    for candidate in candidates:
+        overlap = _overlap(first, candidate)
+        if overlap:
+            return first + candidate[overlap:]
+    return None
+
+
+def merge_passages(documents: List[Document]) -> List[Passage]:
+    """
+    Deduplicates retrieved chunks and merges overlapping chunks of the same source.
+
+    Chunks contained in another chunk of the same source are dropped, and chunks that overlap
+    an earlier chunk of the same source are merged into it. Passages keep the order in which
+    their first chunk was retrieved.
+
+    Args:
+        documents (List[Document]): The retrieved chunks, most relevant first.
+
+    Returns:
+        List[Passage]: The passages, most relevant first.
+    """
+    passages: List[Passage] = []
+    for document in documents:
+        text = document.page_content.strip()
+        if not text:
+            continue
+        source = os.path.basename(str(document.metadata.get("source", "")))
+        for passage in passages:
+            if passage.source != source:
+                continue
+            if text in passage.text:
+                break
+            if passage.text in text:
+                passage.text = text
+                break
+            merged = _append(passage.text, text) or _append(text, passage.text)
+            if merged is not None:
+                passage.text = merged
+                break
+        else:
+            passages.append(Passage(source=source, text=text))
+    return passages
+
+
+def _render(number: int, passage: Passage) -> str:
+    """ Renders a passage headed by its number and source file name. """
+    return f"[{number}] {passage.source}\n{passage.text}" if passage.source else f"[{number}]\n{passage.text}"
+
+
+def pack_passages(passages: List[Passage], token_budget: Optional[int] = None) -> List[Passage]:
+    """
+    Keeps the passages that fit in a token budget.
+
+    Passages are added in order until `token_budget` is reached; the passage that crosses
+    the budget is truncated, or left out if little room remains.
+
+    Args:
+        passages (List[Passage]): The passages, most relevant first.
+        token_budget (Optional[int]): The maximum number of rendered context tokens, or None for no limit.
+
+    Returns:
+        List[Passage]: The passages to put in the context.
+    """
+    packed, used = [], 0
+    for number, passage in enumerate(passages, start=1):
+        block = _render(number, passage)
+        tokens = count_tokens(f"{CONTEXT_SEPARATOR}{block}" if packed else block)
+        if token_budget is not None and used + tokens > token_budget:
+            remaining = token_budget - used - (count_tokens(CONTEXT_SEPARATOR) if packed else 0)
+            if remaining >= MIN_TRUNCATED_TOKENS:
+                header = count_tokens(_render(number, Passage(source=passage.source, text="")))
+                packed.append(Passage(source=passage.source, text=truncate_tokens(passage.text, remaining - header)))
+                used = token_budget
+            break
+        packed.append(passage)
+        used += tokens
+    logger.debug(f"Packed {len(packed)} of {len(passages)} passages into {used} tokens")
+    return packed
+
+
+def render_context(passages: List[Passage]) -> str:
+    """ Renders passages as the prompt context, numbered from 1 and headed by their source file name only. """
+    return CONTEXT_SEPARATOR.join(_render(number, passage) for number, passage in enumerate(passages, start=1))
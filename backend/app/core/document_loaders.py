@@ -0,0 +1,176 @@
+import io
+import os
+import sys
+from typing import Iterator, Optional, Tuple
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+from app.core.logger import get_logger
+from app.core.providers import import_string
+
+logger = get_logger(__name__)
+
+# Loaders are referenced by import path and only imported when a file with a matching
+# extension is loaded, see `import_string`. Markdown and HTML are loaded as raw text, so
+# their headings can be used for chunking. Unstructured loaders run in `elements` mode and
+# their elements are joined per page, see `iter_document`.
+DOC_LOADERS_MAPPING = {
+    ".csv": ("langchain_community.document_loaders.csv_loader:CSVLoader", {}),
+    ".doc": ("langchain_community.document_loaders.word_document:UnstructuredWordDocumentLoader", {"mode": "elements"}),
+    ".docx": ("langchain_community.document_loaders.word_document:UnstructuredWordDocumentLoader", {"mode": "elements"}),
+    ".enex": ("langchain_community.document_loaders.evernote:EverNoteLoader", {"load_single_document": False}),
+    ".epub": ("langchain_community.document_loaders.epub:UnstructuredEPubLoader", {"mode": "elements"}),
+    ".html": ("langchain_community.document_loaders.text:TextLoader", {"encoding": "utf8"}),
+    ".md": ("langchain_community.document_loaders.text:TextLoader", {"encoding": "utf8"}),
+    ".odt": ("langchain_community.document_loaders.odt:UnstructuredODTLoader", {"mode": "elements"}),
+    ".pdf": ("app.core.document_loaders:PDFPageLoader", {}),
+    ".ppt": ("langchain_community.document_loaders.powerpoint:UnstructuredPowerPointLoader", {"mode": "elements"}),
+    ".pptx": ("langchain_community.document_loaders.powerpoint:UnstructuredPowerPointLoader", {"mode": "elements"}),
+    ".txt": ("langchain_community.document_loaders.text:TextLoader", {"encoding": "utf8"}),
+}
+
+# Recorded in the ingest manifest with the chunking settings; bumped when loaders produce
+# different elements, so existing files are loaded again on the next ingestion
+LOADER_VERSION = 2
+
+# A range of PDF pages, 0-based and end-exclusive
+PageRange = Tuple[int, int]
+
+ELEMENT_SEPARATOR = "\n\n"
+
+
+class PDFPageLoader(BaseLoader):
+    """
+    Loads a PDF with pdfminer, one document per page.
+
+    Pages are parsed one at a time, so a long PDF is never held as a single string, and a
+    page range can be loaded on its own, so a long PDF can be split across loader workers.
+    """
+
+    def __init__(self, file_path: str, page_range: Optional[PageRange] = None):
+        """
+        Initializes the loader.
+
+        Args:
+            file_path (str): The path to the PDF.
+            page_range (Optional[PageRange]): The pages to load, all pages if None.
+        """
+        self.file_path = file_path
+        self.page_range = page_range
+
+    def lazy_load(self) -> Iterator[Document]:
+        """ Yields the text of every page, with its 1-based number in the `page` metadata. """
+        from pdfminer.converter import TextConverter
+        from pdfminer.layout import LAParams
+        from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
+
+        first, last = self.page_range or (0, None)
+        if last is not None and last <= first:
+            return
+        text = io.StringIO()
+        manager = PDFResourceManager()
+        device = TextConverter(manager, text, laparams=LAParams())
+        interpreter = PDFPageInterpreter(manager, device)
+        try:
+            with open(self.file_path, "rb") as f:
+                # Only the pages in range are parsed, and reading stops after the last one
+                pages = PDFPage.get_pages(f, pagenos=range(first, last or sys.maxsize), maxpages=last or 0)
+                for number, page in enumerate(pages, start=first):
+                    interpreter.process_page(page)
+                    content = text.getvalue()
+                    text.seek(0)
+                    text.truncate(0)
+                    yield Document(page_content=content, metadata={"source": self.file_path, "page": number + 1})
+        finally:
+            device.close()
+
+
+def count_pdf_pages(file_path: str) -> int:
+    """
+    Counts the pages of a PDF without extracting their text.
+
+    Args:
+        file_path (str): The path to the PDF.
+
+    Returns:
+        int: The number of pages.
+    """
+    from pdfminer.pdfpage import PDFPage
+
+    with open(file_path, "rb") as f:
+        return sum(1 for _ in PDFPage.get_pages(f))
+
+
+def _clean_metadata(metadata: dict) -> dict:
+    """
+    Keeps the metadata values the vector index can store.
+
+    Unstructured's 1-based `page_number` is stored as `page`; lists and nested values, such
+    as detected languages or element coordinates, are dropped.
+    """
+    cleaned = {key: value for key, value in metadata.items() if isinstance(value, (str, int, float, bool))}
+    if "page_number" in cleaned:
+        cleaned["page"] = cleaned.pop("page_number")
+    for key in ("category", "element_id", "parent_id", "filetype", "last_modified", "file_directory", "filename"):
+        cleaned.pop(key, None)
+    return cleaned
+
+
+def _join_pages(elements: Iterator[Document]) -> Iterator[Document]:
+    """
+    Joins consecutive Unstructured elements of the same page into one document.
+
+    Elements such as titles and list items are too short to chunk on their own; joining them
+    per page keeps sections together while still streaming page by page. Elements without a
+    page number, e.g. of a Word document, are joined into a single document.
+    """
+    page, texts, metadata = None, [], {}
+    for element in elements:
+        element_page = element.metadata.get("page_number")
+        if texts and element_page != page:
+            yield Document(page_content=ELEMENT_SEPARATOR.join(texts), metadata=metadata)
+            texts = []
+        if not texts:
+            page, metadata = element_page, element.metadata
+        texts.append(element.page_content)
+    if texts:
+        yield Document(page_content=ELEMENT_SEPARATOR.join(texts), metadata=metadata)
+
+
+def iter_document(file_path: str, page_range: Optional[PageRange] = None) -> Iterator[Document]:
+    """
+    Lazily loads a document, element by element, with the loader for its file extension.
+
+    Every element the loader produces is yielded: a page of a PDF, a row of a CSV file
+    (`row` metadata), a note of an Evernote export, or a page or slide of the text extracted
+    by Unstructured (`page` metadata, when the format has pages). Plain text files are a
+    single element.
+
+    Args:
+        file_path (str): The path to the document file.
+        page_range (Optional[PageRange]): The pages to load, only supported for PDFs.
+
+    Yields:
+        Document: The elements of the document, with their `source` file path.
+
+    Raises:
+        ValueError: If the file extension is unsupported, or a page range is given for another format.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext not in DOC_LOADERS_MAPPING:
+        logger.error(f"Unsupported file extension '{ext}'")
+        raise ValueError(f"Unsupported file extension '{ext}'")
+    loader_path, loader_args = DOC_LOADERS_MAPPING[ext]
+    if page_range is not None:
+        if ext != ".pdf":
+            raise ValueError(f"Page ranges are not supported for '{ext}' files")
+        loader_args = {**loader_args, "page_range": page_range}
+    logger.debug(f"Loading file '{file_path}' with extension '{ext}'")
+    elements = import_string(loader_path)(file_path, **loader_args).lazy_load()
+    if loader_args.get("mode") == "elements":
+        elements = _join_pages(elements)
+    for element in elements:
+        element.metadata = {**_clean_metadata(element.metadata), "source": file_path}
+        yield element
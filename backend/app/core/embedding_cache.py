@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+_caches: Dict[str, "CachedEmbeddings"] = {}
+_caches_lock = threading.Lock()
+
+
+def normalize_text(text: str) -> str:
+    """ Normalizes text for cache lookups by collapsing whitespace. """
+    return " ".join(text.split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper backed by a persistent SQLite cache.
+
+    Entries are keyed by the model name and a hash of the normalized text. When the
+    cache grows beyond `max_entries`, the least recently used entries are evicted. The
+    SQLite database is opened on the first lookup, not when the application starts.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_path: str, max_entries: int):
+        """
+        Initializes the cache without opening its database.
+
+        Args:
+            embeddings (Embeddings): The embeddings to compute cache misses with.
+            model_name (str): The embedding model name, part of every cache key.
+            cache_path (str): Path to the SQLite cache file.
+            max_entries (int): The maximum number of cached embeddings.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._size = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """ Opens the database and creates its table if needed; called with the lock held. """
+        if self._connection is not None:
+            return self._connection
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+        with connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)"
+            )
+            self._size = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info(f"Opened embedding cache '{self.cache_path}' with {self._size} entries")
+        self._connection = connection
+        return connection
+
+    def _key(self, kind: str, text: str) -> str:
+        """ Returns the cache key of a document or query text. """
+        normalized = normalize_text(text)
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{normalized}".encode("utf8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Fetches cached vectors and marks them as recently used.
+
+        Args:
+            keys (List[str]): The cache keys to look up.
+
+        Returns:
+            Dict[str, List[float]]: The cached vectors by key.
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock, self._connect() as connection:
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                connection.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+        return found
+
+    def _store(self, entries: List[Tuple[str, List[float]]]) -> None:
+        """
+        Stores vectors and evicts the least recently used entries beyond the size limit.
+
+        Args:
+            entries (List[Tuple[str, List[float]]]): Cache keys with their vectors.
+        """
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in entries]
+            )
+            self._size += connection.total_changes - before
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                connection.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (overflow,)
+                )
+                self._size -= overflow
+                logger.debug(f"Evicted {overflow} embeddings from cache")
+
+    def _split(self, kind: str, texts: List[str]) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str]]:
+        """
+        Resolves texts against the cache.
+
+        Args:
+            kind (str): Either "document" or "query".
+            texts (List[str]): The texts to resolve.
+
+        Returns:
+            Tuple[List[str], Dict[str, List[float]], Dict[str, str]]: The key of every text, the cached
+                vectors by key, and the texts that still have to be embedded by key.
+        """
+        keys = [self._key(kind, text) for text in texts]
+        cached = self._lookup(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return keys, cached, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """ Embeds documents, computing only the ones that are not cached. """
+        keys, cached, missing = self._split("document", texts)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_entries = list(zip(missing.keys(), vectors))
+            self._store(new_entries)
+            cached.update(new_entries)
+        return [cached[key] for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """ Asynchronously embeds documents, computing only the ones that are not cached. """
+        keys, cached, missing = await asyncio.to_thread(self._split, "document", texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            new_entries = list(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self._store, new_entries)
+            cached.update(new_entries)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """ Embeds a query, using the cached vector if there is one. """
+        keys, cached, missing = self._split("query", [text])
+        if missing:
+            vector = self.embeddings.embed_query(text)
+            self._store([(keys[0], vector)])
+            return vector
+        return cached[keys[0]]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """ Asynchronously embeds a query, using the cached vector if there is one. """
+        keys, cached, missing = await asyncio.to_thread(self._split, "query", [text])
+        if missing:
+            vector = await self.embeddings.aembed_query(text)
+            await asyncio.to_thread(self._store, [(keys[0], vector)])
+            return vector
+        return cached[keys[0]]
+
+
+def get_cached_embeddings(embeddings: Embeddings, model_name: str, cache_path: str, max_entries: int) -> Embeddings:
+    """
+    Returns the process-wide cached embeddings for a cache file.
+
+    Args:
+        embeddings (Embeddings): The embeddings to compute cache misses with.
+        model_name (str): The embedding model name.
+        cache_path (str): Path to the SQLite cache file.
+        max_entries (int): The maximum number of cached embeddings; 0 disables caching.
+
+    Returns:
+        Embeddings: The cached embeddings, or `embeddings` itself if caching is disabled.
+    """
+    if max_entries <= 0:
+        return embeddings
+    with _caches_lock:
+        if cache_path not in _caches:
+            _caches[cache_path] = CachedEmbeddings(embeddings, model_name, cache_path, max_entries)
+        return _caches[cache_path]
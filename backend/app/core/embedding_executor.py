@@ -0,0 +1,196 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.logger import get_logger
+from app.core.tokens import count_tokens
+
+logger = get_logger(__name__)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Checks whether an embedding backend error signals throttling.
+
+    Args:
+        error (Exception): The error raised by the backend.
+
+    Returns:
+        bool: True if the request was rate limited.
+    """
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status_code == 429 or "RateLimit" in type(error).__name__
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Returns the server-provided retry delay of a rate limit error, if any.
+
+    Args:
+        error (Exception): The error raised by the backend.
+
+    Returns:
+        Optional[float]: The delay in seconds, or None.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limiter whose limit adapts to throttling.
+
+    The limit is halved whenever the backend throttles and grows by one after a
+    full window of successful requests, up to `max_limit` (AIMD).
+    """
+
+    def __init__(self, max_limit: int):
+        """
+        Initializes the limiter.
+
+        Args:
+            max_limit (int): The maximum number of concurrent requests.
+        """
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self) -> "AdaptiveLimiter":
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        """ Records a successful request, growing the limit after a full window. """
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self._successes = 0
+
+    def on_throttle(self) -> None:
+        """ Records a throttled request, halving the limit. """
+        self.limit = max(1, self.limit // 2)
+        self._successes = 0
+        logger.info(f"Embedding backend throttled; concurrency limit lowered to {self.limit}")
+
+
+@dataclass
+class EmbeddingStats:
+    """ Throughput counters of an embedding executor. """
+    texts: int = 0
+    tokens: int = 0
+    batches: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        """ Embedded tokens per second of wall-clock embedding time. """
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+
+class EmbeddingExecutor:
+    """
+    Embeds texts in batches with a bounded number of concurrent requests.
+
+    Any LangChain `Embeddings` implementation can be used as backend. Throttled
+    batches are retried with exponential backoff and jitter, and the number of
+    in-flight requests is lowered while the backend keeps throttling.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = 64,
+        max_concurrency: int = 4,
+        max_retries: int = 6,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0
+    ):
+        """
+        Initializes the EmbeddingExecutor.
+
+        Args:
+            embeddings (Embeddings): The embedding backend.
+            batch_size (int): The number of texts per embedding request.
+            max_concurrency (int): The maximum number of requests in flight.
+            max_retries (int): How often a throttled batch is retried before giving up.
+            initial_backoff (float): The first retry delay in seconds.
+            max_backoff (float): The maximum retry delay in seconds.
+        """
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.stats = EmbeddingStats()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds texts, preserving their order.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: One embedding per text.
+        """
+        if not texts:
+            return []
+        started = time.perf_counter()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(self._embed_batch(batch) for batch in batches))
+        self.stats.seconds += time.perf_counter() - started
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a single batch, retrying with backoff while the backend throttles.
+
+        Args:
+            texts (List[str]): The texts of the batch.
+
+        Returns:
+            List[List[float]]: One embedding per text.
+
+        Raises:
+            Exception: The backend error, if it is not throttling or retries are exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            async with self.limiter:
+                try:
+                    vectors = await self.embeddings.aembed_documents(texts)
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt == self.max_retries:
+                        raise
+                    self.limiter.on_throttle()
+                    error = e
+                else:
+                    self.limiter.on_success()
+                    self.stats.texts += len(texts)
+                    self.stats.tokens += sum(count_tokens(text) for text in texts)
+                    self.stats.batches += 1
+                    return vectors
+
+            self.stats.retries += 1
+            delay = get_retry_after(error)
+            if delay is None:
+                delay = random.uniform(0.5, 1.0) * min(self.max_backoff, self.initial_backoff * 2 ** attempt)
+            logger.warning(f"Embedding batch throttled, retrying in {delay:.2f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import math
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DEFAULT_FAKE_RESPONSE = (
+    "Check the coolant levels, clean the cooling fans and replace the coolant "
+    "as described in the Thermal Management section of the technical manual."
+)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic offline embeddings based on feature hashing.
+
+    Every word is hashed into one of `size` buckets and the bucket counts are
+    L2-normalized, so texts that share words get similar vectors. This keeps
+    retrieval meaningful in tests and benchmarks without calling a model.
+    """
+
+    def __init__(self, size: int = 1536):
+        """
+        Initializes the HashingEmbeddings.
+
+        Args:
+            size (int): The embedding dimensionality.
+        """
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        """ Returns the normalized hashed bag-of-words vector of text. """
+        vector = [0.0] * self.size
+        for word in re.findall(r"\w+", text.lower()):
+            bucket = int.from_bytes(hashlib.blake2b(word.encode("utf8"), digest_size=8).digest(), "little")
+            vector[bucket % self.size] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector] if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    Offline chat model that streams a fixed response word by word.
+
+    Latency can be injected before the first token and between tokens, to
+    simulate a remote LLM in tests and benchmarks.
+    """
+
+    response: str = DEFAULT_FAKE_RESPONSE
+    """ The response returned for every prompt. """
+    first_token_latency: float = 0.0
+    """ Seconds to wait before the first token. """
+    token_latency: float = 0.0
+    """ Seconds to wait between tokens. """
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat"
+
+    def _tokens(self) -> List[str]:
+        """ Splits the response into word-sized tokens. """
+        return re.findall(r"\s*\S+\s*", self.response) or [self.response]
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        time.sleep(self.first_token_latency + self.token_latency * (len(self._tokens()) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._tokens()):
+            time.sleep(self.first_token_latency if i == 0 else self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._tokens()):
+            await asyncio.sleep(self.first_token_latency if i == 0 else self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
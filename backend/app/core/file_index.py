@@ -0,0 +1,176 @@
+import json
+import os
+import stat as stat_module
+import time
+from typing import Collection, Dict, Iterable, NamedTuple
+
+from app.core.logger import get_logger
+from app.core.manifest import hash_file
+
+logger = get_logger(__name__)
+
+FILE_INDEX_FILENAME = "file_index.json"
+FILE_INDEX_VERSION = 1
+# Files hashed this soon after their last modification may change again without changing
+# their timestamp, so their hash is not reused
+RACY_WINDOW_NS = 2_000_000_000
+
+
+class FileStat(NamedTuple):
+    """ Size and modification time of a file. """
+    size: int
+    mtime_ns: int
+
+
+def _matches(name: str, extensions: Collection[str]) -> bool:
+    """ Returns whether a file name has one of the extensions and is not hidden. """
+    return not name.startswith(".") and os.path.splitext(name)[1].lower() in extensions
+
+
+def scan_directory(root: str, extensions: Collection[str]) -> Dict[str, FileStat]:
+    """
+    Lists the files with the given extensions under a directory, in a single pass.
+
+    The tree is walked once with `os.scandir`, whose entries carry the file type, so only
+    matching files are stat'ed. Hidden files and directories are skipped, and symlinked
+    directories are followed once.
+
+    Args:
+        root (str): The directory to scan.
+        extensions (Collection[str]): The file extensions to include, lowercase with the dot.
+
+    Returns:
+        Dict[str, FileStat]: Paths relative to `root`, with `/` separators, mapped to their stat.
+    """
+    files: Dict[str, FileStat] = {}
+    visited = set()
+    stack = [(root, "")]
+    while stack:
+        directory, prefix = stack.pop()
+        try:
+            info = os.stat(directory)
+            if (info.st_dev, info.st_ino) in visited:
+                continue
+            visited.add((info.st_dev, info.st_ino))
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            stack.append((entry.path, f"{prefix}{entry.name}/"))
+                        elif entry.is_file() and _matches(entry.name, extensions):
+                            stat = entry.stat()
+                            files[f"{prefix}{entry.name}"] = FileStat(stat.st_size, stat.st_mtime_ns)
+                    except OSError as e:
+                        logger.error(f"Failed to read '{entry.path}': {e}")
+        except OSError as e:
+            logger.error(f"Failed to scan directory '{directory}': {e}")
+    return files
+
+
+def stat_files(root: str, sources: Iterable[str], extensions: Collection[str]) -> Dict[str, FileStat]:
+    """
+    Stats the given files, e.g. the files a watcher reported as changed.
+
+    Like `scan_directory`, files in hidden directories are skipped, so a full scan later
+    finds the same files.
+
+    Args:
+        root (str): The directory the paths are relative to.
+        sources (Iterable[str]): Paths relative to `root`, with `/` separators.
+        extensions (Collection[str]): The file extensions to include, lowercase with the dot.
+
+    Returns:
+        Dict[str, FileStat]: The paths that exist as files with a matching extension, mapped to their stat.
+    """
+    files: Dict[str, FileStat] = {}
+    for source in sources:
+        *directories, name = source.split("/")
+        if any(directory.startswith(".") for directory in directories) or not _matches(name, extensions):
+            continue
+        try:
+            stat = os.stat(os.path.join(root, *directories, name))
+        except OSError:
+            continue
+        if stat_module.S_ISREG(stat.st_mode):
+            files[source] = FileStat(stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+class FileIndex:
+    """
+    Remembers the size, modification time and content hash of every scanned file.
+
+    Stored as JSON next to the ingest manifest. A file whose size and modification time are
+    unchanged since it was hashed reuses its recorded hash, so detecting changes only reads the
+    files that were touched. Like git, hashes taken within `RACY_WINDOW_NS` of the file's
+    modification are not reused, since a later write could have kept the same timestamp.
+    """
+
+    def __init__(self, persist_directory: str):
+        """
+        Loads the file index of a persist directory, or starts empty.
+
+        Args:
+            persist_directory (str): The directory the collection is persisted in.
+        """
+        self.path = os.path.join(persist_directory, FILE_INDEX_FILENAME)
+        # Relative path: [size, mtime_ns, content hash, time of hashing in ns]
+        self.files: Dict[str, list] = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf8") as f:
+                    data = json.load(f)
+                if data.get("version") != FILE_INDEX_VERSION:
+                    raise ValueError(f"unsupported file index version {data.get('version')}")
+                self.files = data.get("files", {})
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to read file index '{self.path}', starting empty: {e}")
+
+    def hash_files(self, root: str, stats: Dict[str, FileStat]) -> Dict[str, str]:
+        """
+        Returns the content hashes of files, hashing only the files that changed.
+
+        Args:
+            root (str): The directory the paths are relative to.
+            stats (Dict[str, FileStat]): The files to hash, as returned by `scan_directory` or `stat_files`.
+
+        Returns:
+            Dict[str, str]: The paths mapped to their content hash; files that cannot be read are left out.
+        """
+        hashes, hashed = {}, 0
+        for source, stat in stats.items():
+            entry = self.files.get(source)
+            if entry is not None and entry[:2] == [stat.size, stat.mtime_ns] and entry[1] < entry[3] - RACY_WINDOW_NS:
+                hashes[source] = entry[2]
+                continue
+            hashed_ns = time.time_ns()
+            try:
+                hashes[source] = hash_file(os.path.join(root, *source.split("/")))
+            except OSError as e:
+                logger.error(f"Failed to hash document '{source}': {e}")
+                self.files.pop(source, None)
+                continue
+            self.files[source] = [stat.size, stat.mtime_ns, hashes[source], hashed_ns]
+            hashed += 1
+        logger.info(f"Hashed {hashed} of {len(stats)} files, the others are unchanged since the last scan")
+        return hashes
+
+    def retain(self, sources: Iterable[str]) -> None:
+        """ Forgets all files but `sources`, after a full scan. """
+        keep = set(sources)
+        self.files = {source: entry for source, entry in self.files.items() if source in keep}
+
+    def forget(self, sources: Iterable[str]) -> None:
+        """ Forgets files that no longer exist. """
+        for source in sources:
+            self.files.pop(source, None)
+
+    def save(self) -> None:
+        """ Atomically writes the file index to disk. """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump({"version": FILE_INDEX_VERSION, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
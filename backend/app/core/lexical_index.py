@@ -0,0 +1,260 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from app.core.logger import get_logger
+from app.core.metadata import MetadataFilter
+
+logger = get_logger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it of on or should the this to
+was what when where which who why with you
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """ Splits text into lowercase word tokens, dropping common English stopwords. """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-process inverted index with BM25 ranking.
+
+    Every chunk's term frequencies are kept next to a posting list per term, so chunks can be
+    added and removed incrementally. Searching only visits the postings of the query terms,
+    which keeps keyword lookups well below a millisecond for typical collections.
+
+    The index is persisted next to the vector index as a JSON snapshot plus a journal of the
+    changes made since. `persist` only appends the pending changes to the journal, so it can run
+    after every ingested batch; `compact` rewrites the snapshot and empties the journal. Both
+    serialize outside the index lock, so searches are not blocked while the index is written.
+    """
+
+    FILENAME = "bm25_index.json"
+    JOURNAL_FILENAME = "bm25_index.journal"
+    VERSION = 1
+
+    def __init__(self, persist_directory: str, k1: float = 1.5, b: float = 0.75):
+        """
+        Loads the index from disk, or starts empty.
+
+        Args:
+            persist_directory (str): The directory the index is persisted in.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 document length normalization.
+        """
+        self.path = os.path.join(persist_directory, self.FILENAME)
+        self.journal_path = os.path.join(persist_directory, self.JOURNAL_FILENAME)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # Serializes writers, so journal entries are appended in the order they were made
+        self._persist_lock = threading.Lock()
+        self._docs: Dict[str, dict] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        # Changes not yet written to the journal, as journal entries
+        self._pending: List[dict] = []
+        # Incremented by every compaction; journal entries of older generations are in the snapshot
+        self._generation = 0
+        # Whether the journal ended in an entry cut short by a crash
+        self._truncated = False
+        self._load()
+
+    def _load(self) -> None:
+        """ Reads the snapshot and replays the journal, starting empty if the snapshot is unreadable. """
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf8") as f:
+                    data = json.load(f)
+                if data.get("version") != self.VERSION:
+                    raise ValueError(f"unsupported index version {data.get('version')}")
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to read keyword index '{self.path}', starting empty: {e}")
+                return
+            self._generation = data.get("generation", 0)
+            for chunk_id, doc in data["docs"].items():
+                self._add(chunk_id, doc)
+        replayed = sum(1 for entry in self._read_journal() if self._apply(entry))
+        if self._truncated:
+            # Later entries would be appended to the cut-off line
+            self.compact()
+        if self._docs or replayed:
+            logger.info(
+                f"Loaded keyword index with {len(self._docs)} chunks from '{self.path}', "
+                f"replayed {replayed} journal entries"
+            )
+
+    def _read_journal(self) -> Iterator[dict]:
+        """ Yields the journal entries, stopping at an entry cut short by a crash. """
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring truncated entry at the end of '{self.journal_path}'")
+                    self._truncated = True
+                    return
+
+    def _apply(self, entry: dict) -> bool:
+        """ Applies a journal entry unless the snapshot already contains it; returns whether it was applied. """
+        if entry.get("generation", 0) < self._generation:
+            return False
+        for chunk_id in entry.get("delete", ()):
+            self._remove(chunk_id)
+        for chunk_id, doc in entry.get("upsert", {}).items():
+            self._remove(chunk_id)
+            self._add(chunk_id, doc)
+        return True
+
+    def persist(self) -> None:
+        """ Appends the changes made since the last call to the journal. """
+        with self._persist_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            lines = "".join(json.dumps(entry) + "\n" for entry in pending)
+            with open(self.journal_path, "a", encoding="utf8") as f:
+                f.write(lines)
+
+    def compact(self) -> None:
+        """ Atomically writes a snapshot of the index to disk and empties the journal. """
+        with self._persist_lock:
+            with self._lock:
+                # Entries are replaced rather than modified, so a shallow copy is a consistent snapshot
+                docs = dict(self._docs)
+                self._pending = []
+                self._generation += 1
+                generation = self._generation
+            data = json.dumps({"version": self.VERSION, "generation": generation, "docs": docs})
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+
+    def _add(self, chunk_id: str, doc: dict) -> None:
+        """ Adds a chunk's entry to the posting lists. """
+        self._docs[chunk_id] = doc
+        self._total_length += doc["length"]
+        for term, frequency in doc["terms"].items():
+            self._postings.setdefault(term, {})[chunk_id] = frequency
+
+    def _remove(self, chunk_id: str) -> None:
+        """ Removes a chunk from the posting lists. """
+        doc = self._docs.pop(chunk_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc["length"]
+        for term in doc["terms"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def upsert(self, ids: List[str], texts: List[str], metadatas: List[dict]) -> None:
+        """
+        Inserts or replaces chunks.
+
+        Args:
+            ids (List[str]): The chunk IDs.
+            texts (List[str]): The chunk texts.
+            metadatas (List[dict]): The chunk metadata.
+        """
+        docs = {}
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            tokens = tokenize(text)
+            docs[chunk_id] = {
+                "text": text,
+                "metadata": metadata,
+                "length": len(tokens),
+                "terms": dict(Counter(tokens)),
+            }
+        if not docs:
+            return
+        with self._lock:
+            entry = {"generation": self._generation, "upsert": docs}
+            self._apply(entry)
+            self._pending.append(entry)
+
+    def delete(self, ids: List[str]) -> None:
+        """ Deletes chunks by ID. """
+        if not ids:
+            return
+        with self._lock:
+            entry = {"generation": self._generation, "delete": list(ids)}
+            self._apply(entry)
+            self._pending.append(entry)
+
+    def count(self) -> int:
+        """ Returns the number of chunks. """
+        return len(self._docs)
+
+    def reset(self) -> None:
+        """ Deletes all chunks. """
+        with self._persist_lock, self._lock:
+            self._docs, self._postings, self._total_length = {}, {}, 0
+            self._pending, self._generation = [], 0
+            for path in (self.path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def contains_terms(self, terms: List[str]) -> bool:
+        """ Returns whether every term occurs in at least one chunk. """
+        return all(term in self._postings for term in terms)
+
+    def search(self, query: str, k: int, metadata_filter: Optional[MetadataFilter] = None) -> List[Tuple[Document, float]]:
+        """
+        Finds the chunks that best match the query terms.
+
+        Args:
+            query (str): The query.
+            k (int): The number of chunks to return.
+            metadata_filter (Optional[MetadataFilter]): Only chunks whose metadata satisfies the
+                filter are scored; collection statistics still cover all chunks.
+
+        Returns:
+            List[Tuple[Document, float]]: Documents with their BM25 scores, best first.
+        """
+        terms = tokenize(query)
+        with self._lock:
+            if not terms or not self._docs:
+                return []
+            n_docs = len(self._docs)
+            average_length = self._total_length / n_docs or 1.0
+            scores: Dict[str, float] = {}
+            allowed: Dict[str, bool] = {}
+            for term in set(terms):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, frequency in postings.items():
+                    if metadata_filter is not None:
+                        if chunk_id not in allowed:
+                            allowed[chunk_id] = metadata_filter.matches(self._docs[chunk_id]["metadata"])
+                        if not allowed[chunk_id]:
+                            continue
+                    length_norm = self.k1 * (1 - self.b + self.b * self._docs[chunk_id]["length"] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + length_norm)
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [
+                (Document(page_content=self._docs[chunk_id]["text"], metadata=self._docs[chunk_id]["metadata"]), score)
+                for chunk_id, score in top
+            ]
@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from app.core.logger import get_logger
+from app.core.metrics import STAGE_SECONDS
+
+logger = get_logger(__name__)
+
+# Weight of the latest run in the moving average of how long runs hold a slot
+HOLD_TIME_SMOOTHING = 0.2
+
+# Why a run was not admitted, by reason
+REJECTION_MESSAGES = {
+    "queue_full": "Too many queries are waiting",
+    "slo": "Queries are waiting too long",
+    "timeout": "Waited too long for a free slot",
+    "shed": "Displaced by a query of higher priority",
+}
+
+
+class AdmissionRejected(Exception):
+    """ Raised when a run is not admitted; the client should retry after `retry_after` seconds. """
+
+    def __init__(self, reason: str, priority: str, retry_after: int):
+        """
+        Initializes the rejection.
+
+        Args:
+            reason (str): Why the run was rejected, a key of `REJECTION_MESSAGES`.
+            priority (str): The priority class of the run.
+            retry_after (int): The suggested delay before retrying, in seconds.
+        """
+        super().__init__(f"Server busy: {REJECTION_MESSAGES[reason]}, retry in {retry_after}s")
+        self.reason = reason
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+@dataclass(order=True)
+class _Waiter:
+    """ A run waiting for a slot, ordered by priority rank and arrival. """
+    rank: int
+    sequence: int
+    priority: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class LLMScheduler:
+    """
+    Admission control for chain runs, shared by all sessions of the process.
+
+    At most `max_concurrency` runs hold a slot at once; further runs wait in a queue of at most
+    `max_queue` runs, served by priority class and then in arrival order. Priority classes are
+    listed from highest to lowest, e.g. `interactive` before `batch`.
+
+    Runs are rejected with `AdmissionRejected`, carrying a retry hint, instead of piling up:
+
+    - `queue_full`: the queue is full of runs of the same or a higher priority. A run of higher
+      priority than the newest, lowest priority waiter takes its place instead, and the
+      displaced waiter is rejected (`shed`).
+    - `slo`: the expected wait, estimated from how long recent runs held their slot, already
+      exceeds `queue_timeout`, so waiting would only end in a timeout.
+    - `timeout`: the run waited `queue_timeout` seconds without getting a slot.
+
+    Once the slots are busy, latency therefore grows with the queue up to `queue_timeout`
+    instead of with the number of sessions, and overload turns into fast rejections. Time spent
+    waiting is recorded in `STAGE_SECONDS` as the `queue` stage.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_queue: int = 64,
+        queue_timeout: float = 10.0,
+        priorities: Iterable[str] = ("interactive", "batch")
+    ):
+        """
+        Initializes the scheduler.
+
+        Args:
+            max_concurrency (int): The runs allowed at once; 0 disables admission control.
+            max_queue (int): The runs allowed to wait for a slot; 0 rejects runs when all slots are busy.
+            queue_timeout (float): The longest a run waits for a slot, in seconds; 0 waits indefinitely.
+            priorities (Iterable[str]): The priority classes, from highest to lowest.
+
+        Raises:
+            ValueError: If no priority class is given.
+        """
+        self.priorities: List[str] = [priority.strip() for priority in priorities if priority.strip()]
+        if not self.priorities:
+            raise ValueError("At least one priority class is required")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self._ranks: Dict[str, int] = {priority: rank for rank, priority in enumerate(self.priorities)}
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._hold_seconds: Optional[float] = None
+
+    @property
+    def default_priority(self) -> str:
+        """ The highest priority class, used when none is requested. """
+        return self.priorities[0]
+
+    @property
+    def queued(self) -> int:
+        """ The number of runs waiting for a slot. """
+        return len(self._waiters)
+
+    def resolve(self, priority: Optional[str]) -> str:
+        """
+        Validates a requested priority class.
+
+        Args:
+            priority (Optional[str]): The priority class, or None for the default one.
+
+        Returns:
+            str: The priority class.
+
+        Raises:
+            ValueError: If the priority class is unknown.
+        """
+        if not priority:
+            return self.default_priority
+        if priority not in self._ranks:
+            raise ValueError(f"Unknown priority '{priority}'; priorities: {', '.join(self.priorities)}")
+        return priority
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None) -> AsyncIterator[float]:
+        """
+        Holds a slot for the duration of a run, waiting for one if all are busy.
+
+        Args:
+            priority (Optional[str]): The priority class of the run, the default one if omitted.
+
+        Yields:
+            float: The seconds spent waiting for the slot.
+
+        Raises:
+            AdmissionRejected: If the run is not admitted.
+            ValueError: If the priority class is unknown.
+        """
+        priority = self.resolve(priority)
+        if self.max_concurrency <= 0:
+            yield 0.0
+            return
+        started = time.monotonic()
+        await self._acquire(priority)
+        admitted = time.monotonic()
+        STAGE_SECONDS.observe(admitted - started, stage="queue")
+        try:
+            yield admitted - started
+        finally:
+            self._observe(time.monotonic() - admitted)
+            self._release()
+
+    async def _acquire(self, priority: str) -> None:
+        """ Takes a free slot, or waits in the queue until a finishing run hands one over. """
+        if self.running < self.max_concurrency and not self._waiters:
+            self.running += 1
+            return
+        rank = self._ranks[priority]
+        ahead = sum(1 for waiter in self._waiters if waiter.rank <= rank)
+        if self.queue_timeout > 0 and self.expected_wait(ahead) > self.queue_timeout:
+            raise self._reject("slo", priority)
+        if len(self._waiters) >= self.max_queue:
+            displaced = max(self._waiters) if self._waiters else None
+            if displaced is None or displaced.rank <= rank:
+                raise self._reject("queue_full", priority)
+            self._waiters.remove(displaced)
+            heapq.heapify(self._waiters)
+            displaced.future.set_exception(self._reject("shed", displaced.priority))
+
+        waiter = _Waiter(rank, next(self._sequence), priority, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, waiter)
+        try:
+            done, _ = await asyncio.wait((waiter.future,), timeout=self.queue_timeout or None)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not done:
+            self._abandon(waiter)
+            raise self._reject("timeout", priority)
+        # Raises the rejection of a displaced waiter
+        waiter.future.result()
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """ Removes a waiter that stopped waiting, passing on a slot it was handed meanwhile. """
+        if waiter.future.done():
+            if not waiter.future.cancelled() and waiter.future.exception() is None:
+                self._release()
+            return
+        waiter.future.cancel()
+        self._waiters.remove(waiter)
+        heapq.heapify(self._waiters)
+
+    def _release(self) -> None:
+        """ Hands the slot of a finished run to the first waiter, or frees it. """
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+                return
+        self.running -= 1
+
+    def _observe(self, seconds: float) -> None:
+        """ Updates the moving average of how long runs hold a slot. """
+        if self._hold_seconds is None:
+            self._hold_seconds = seconds
+        else:
+            self._hold_seconds += HOLD_TIME_SMOOTHING * (seconds - self._hold_seconds)
+
+    def expected_wait(self, ahead: int) -> float:
+        """
+        Estimates how long a run waits for a slot.
+
+        Args:
+            ahead (int): The waiting runs that will be served first.
+
+        Returns:
+            float: The expected wait in seconds, 0 until a run has finished.
+        """
+        if self._hold_seconds is None:
+            return 0.0
+        return self._hold_seconds * (ahead + 1) / self.max_concurrency
+
+    def retry_after(self) -> int:
+        """ Suggests when to retry a rejected run: once the current queue has drained, at least 1 second. """
+        return max(1, math.ceil(self.expected_wait(len(self._waiters))))
+
+    def _reject(self, reason: str, priority: str) -> AdmissionRejected:
+        """ Creates the rejection of a run. """
+        return AdmissionRejected(reason, priority, self.retry_after())
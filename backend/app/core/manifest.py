@@ -0,0 +1,174 @@
+import hashlib
+import itertools
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_bytes(data: bytes) -> str:
+    """ Returns the SHA-256 hex digest of data. """
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(file_path: str, block_size: int = 1 << 20) -> str:
+    """
+    Computes the SHA-256 hex digest of a file's contents.
+
+    Args:
+        file_path (str): Path to the file.
+        block_size (int): Number of bytes to read at a time.
+
+    Returns:
+        str: The hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_chunk_ids(
+    source: str,
+    chunk_texts: Iterable[str],
+    chunk_fields: Optional[Iterable[dict]] = None
+) -> List[str]:
+    """
+    Builds deterministic chunk IDs for the chunks of a single source file.
+
+    The ID is derived from the source path and the chunk's content hash, so an
+    unchanged chunk keeps its ID across re-ingests even if chunks around it change.
+    Identical chunks within the same file are disambiguated by occurrence number.
+    Metadata extracted from a chunk is hashed with its content, so chunks whose extracted
+    metadata changed are stored again.
+
+    Args:
+        source (str): The source path the chunks were split from.
+        chunk_texts (Iterable[str]): The chunk contents, in order.
+        chunk_fields (Optional[Iterable[dict]]): The extracted metadata of every chunk, in order.
+
+    Returns:
+        List[str]: One ID per chunk.
+    """
+    seen: Dict[str, int] = {}
+    ids = []
+    for text, fields in zip(chunk_texts, chunk_fields if chunk_fields is not None else itertools.repeat(None)):
+        if fields:
+            text = f"{text}\0{json.dumps(fields, sort_keys=True)}"
+        chunk_hash = hash_bytes(text.encode("utf8"))
+        occurrence = seen.get(chunk_hash, 0)
+        seen[chunk_hash] = occurrence + 1
+        ids.append(hash_bytes(f"{source}\0{chunk_hash}\0{occurrence}".encode("utf8")))
+    return ids
+
+
+@dataclass
+class FileChanges:
+    """ Result of comparing the files on disk against the manifest. """
+    added: Dict[str, str] = field(default_factory=dict)
+    modified: Dict[str, str] = field(default_factory=dict)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> Dict[str, str]:
+        """ Files that need to be (re-)loaded, mapped to their content hash. """
+        return {**self.added, **self.modified}
+
+
+class IngestManifest:
+    """
+    Tracks per-file and per-chunk content hashes for an ingested collection.
+
+    The manifest is stored as JSON next to the vector store and maps every
+    ingested file to its content hash, the chunking settings it was split with
+    and the IDs of the chunks it produced.
+    """
+
+    def __init__(self, persist_directory: str):
+        """
+        Initializes the manifest for the given vector store directory.
+
+        Args:
+            persist_directory (str): The directory the vector store is persisted in.
+        """
+        self.path = os.path.join(persist_directory, MANIFEST_FILENAME)
+        self.files: Dict[str, dict] = {}
+        self.exists = os.path.exists(self.path)
+        if self.exists:
+            self.load()
+
+    def load(self) -> None:
+        """ Loads the manifest from disk, starting empty if it is unreadable. """
+        try:
+            with open(self.path, "r", encoding="utf8") as f:
+                data = json.load(f)
+            if data.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"unsupported manifest version {data.get('version')}")
+            self.files = data.get("files", {})
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read ingest manifest '{self.path}', starting empty: {e}")
+            self.files = {}
+
+    def save(self) -> None:
+        """ Atomically writes the manifest to disk. """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+        self.exists = True
+
+    def diff(
+        self,
+        file_hashes: Dict[str, str],
+        chunking: Optional[Dict[str, str]] = None,
+        sources: Optional[Iterable[str]] = None
+    ) -> FileChanges:
+        """
+        Compares the current files against the manifest.
+
+        Files whose chunking settings changed count as modified, so they are split again.
+
+        Args:
+            file_hashes (Dict[str, str]): Current source files mapped to their content hash.
+            chunking (Optional[Dict[str, str]]): Current source files mapped to their chunking settings.
+            sources (Optional[Iterable[str]]): The files that were checked, when only some were; other
+                recorded files are not reported as removed.
+
+        Returns:
+            FileChanges: The added, modified, removed and unchanged files.
+        """
+        changes = FileChanges()
+        chunking = chunking or {}
+        for source, file_hash in file_hashes.items():
+            entry = self.files.get(source)
+            if entry is None:
+                changes.added[source] = file_hash
+            elif entry["hash"] != file_hash or entry.get("chunking") != chunking.get(source):
+                changes.modified[source] = file_hash
+            else:
+                changes.unchanged.append(source)
+        checked = self.files if sources is None else [source for source in sources if source in self.files]
+        changes.removed = [source for source in checked if source not in file_hashes]
+        return changes
+
+    def chunk_ids(self, source: str) -> List[str]:
+        """ Returns the chunk IDs recorded for source. """
+        entry = self.files.get(source)
+        return list(entry["chunks"]) if entry else []
+
+    def update(self, source: str, file_hash: str, chunk_ids: List[str], chunking: Optional[str] = None) -> None:
+        """ Records the content hash, chunking settings and chunk IDs for source. """
+        self.files[source] = {"hash": file_hash, "chunking": chunking, "chunks": chunk_ids}
+
+    def remove(self, source: str) -> None:
+        """ Forgets source. """
+        self.files.pop(source, None)
@@ -0,0 +1,343 @@
+import datetime
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core.manifest import hash_bytes
+
+# A metadata value as stored in the vector and keyword indexes
+MetadataValue = Union[str, int, float, bool]
+
+DATE_PATTERN = re.compile(r"^(\d{4})-(\d{2})-(\d{2})(?:[T ][\d:.]*)?$")
+
+RANGE_OPERATORS = ("gt", "gte", "lt", "lte")
+
+# Version of how extracted values are stored, part of the extractor fingerprint
+METADATA_ENCODING = 2
+
+
+def value_key(field: str, value: MetadataValue) -> str:
+    """ Returns the metadata key flagging one of several values of a field in a chunk. """
+    return f"{field}={json.dumps(value)}"
+
+
+def max_key(field: str) -> str:
+    """ Returns the metadata key of the largest of several numeric values of a field in a chunk. """
+    return f"{field}:max"
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def normalize_value(value: Any) -> Any:
+    """
+    Normalizes an extracted or requested metadata value.
+
+    ISO dates, optionally with a time, become `YYYYMMDD` integers, so date ranges can be
+    compared by every index; Chroma only compares numbers. Other strings are stripped.
+    """
+    if not isinstance(value, str):
+        return value
+    value = value.strip()
+    match = DATE_PATTERN.match(value)
+    if match:
+        year, month, day = map(int, match.groups())
+        try:
+            datetime.date(year, month, day)
+        except ValueError:
+            return value
+        return year * 10000 + month * 100 + day
+    return value
+
+
+class MetadataExtractor:
+    """
+    Extracts filterable metadata from chunks at ingest time.
+
+    Two kinds of extractors are configured:
+
+    - `fields`: `field: value` lines, such as the maintenance log records rendered by
+      `RecordSplitter` (`machine: CNC Machine 01`) or headers of plain text logs. Field names
+      match case-insensitively; the first line of a field wins.
+    - `patterns`: regular expressions per field, whose first group (or whole match) is the value.
+
+    Values are normalized with `normalize_value` and stored in the chunk metadata under the
+    field name, so they can be used in retrieval filters, see `MetadataFilter`. A chunk packing
+    several records may hold several values of a field. The field then holds the first value,
+    or the smallest one if all are numbers, with `max_key` holding the largest. Every value is
+    also flagged under its `value_key`, so the chunk matches a filter on any of its values.
+    Chroma metadata only takes scalars, which rules out lists.
+    """
+
+    def __init__(self, fields: Iterable[str] = (), patterns: Optional[Dict[str, str]] = None):
+        """
+        Initializes the extractor.
+
+        Args:
+            fields (Iterable[str]): The names of `field: value` lines to extract.
+            patterns (Optional[Dict[str, str]]): Regular expressions keyed by the field they extract.
+
+        Raises:
+            ValueError: If a pattern is not a valid regular expression.
+        """
+        self.fields = [field.strip().lower() for field in fields if field.strip()]
+        self.patterns = {name.strip().lower(): pattern for name, pattern in (patterns or {}).items()}
+        self._field_line = re.compile(
+            rf"^[ \t]*({'|'.join(map(re.escape, self.fields))})[ \t]*:[ \t]*(\S.*?)[ \t]*$",
+            re.IGNORECASE | re.MULTILINE
+        ) if self.fields else None
+        try:
+            self._patterns = {name: re.compile(pattern, re.MULTILINE) for name, pattern in self.patterns.items()}
+        except re.error as e:
+            raise ValueError(f"Invalid metadata pattern: {e}") from e
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, MetadataExtractor) and (self.fields, self.patterns) == (other.fields, other.patterns)
+
+    def __hash__(self) -> int:
+        return hash((tuple(self.fields), tuple(sorted(self.patterns.items()))))
+
+    @property
+    def names(self) -> List[str]:
+        """ The names of all extracted fields, which retrieval filters may use. """
+        return list(dict.fromkeys([*self.fields, *self.patterns]))
+
+    @property
+    def fingerprint(self) -> str:
+        """ A short hash of the configuration, recorded in the ingest manifest. """
+        return hash_bytes(
+            json.dumps([METADATA_ENCODING, self.fields, self.patterns], sort_keys=True).encode("utf8")
+        )[:8]
+
+    def extract(self, text: str) -> Dict[str, MetadataValue]:
+        """
+        Extracts the configured fields from a chunk's text.
+
+        Args:
+            text (str): The chunk text.
+
+        Returns:
+            Dict[str, MetadataValue]: The fields found in the text, with normalized values, plus
+                the `value_key` and `max_key` entries of fields with several values.
+        """
+        values: Dict[str, Dict[MetadataValue, None]] = {}
+        if self._field_line is not None:
+            for match in self._field_line.finditer(text):
+                values.setdefault(match.group(1).lower(), {})[normalize_value(match.group(2))] = None
+        for name, pattern in self._patterns.items():
+            for match in pattern.finditer(text):
+                values.setdefault(name, {})[normalize_value(match.group(1) if pattern.groups else match.group(0))] = None
+        extracted: Dict[str, MetadataValue] = {}
+        for name, found in values.items():
+            found = list(found)
+            if len(found) == 1:
+                extracted[name] = found[0]
+                continue
+            if all(_is_number(value) for value in found):
+                extracted[name], extracted[max_key(name)] = min(found), max(found)
+            else:
+                extracted[name] = found[0]
+            extracted.update({value_key(name, value): True for value in found})
+        return extracted
+
+    def apply(self, chunks: List[Document]) -> None:
+        """ Adds the extracted fields to the metadata of every chunk. """
+        for chunk in chunks:
+            chunk.metadata.update(self.extract(chunk.page_content))
+
+    def select(self, metadata: dict) -> Dict[str, MetadataValue]:
+        """ Returns the extracted fields of a chunk's metadata, including the entries of fields with several values. """
+        prefixes = tuple(f"{name}{separator}" for name in self.names for separator in ("=", ":"))
+        return {key: value for key, value in metadata.items() if key in self.names or key.startswith(prefixes)}
+
+
+# A filter condition: field, operator ('eq', 'in' or one of `RANGE_OPERATORS`) and value
+Condition = Tuple[str, str, Any]
+
+
+class MetadataFilter:
+    """
+    A retrieval filter on chunk metadata, applied inside the vector and keyword searches.
+
+    Every field's condition must hold. A request filter maps fields to a value (equality),
+    a list of values (any of them), or an object of range bounds (`gt`, `gte`, `lt`, `lte`):
+
+        {"machine": "CNC Machine 01", "date": {"gte": "2023-01-01", "lte": "2023-06-30"}}
+
+    Values are normalized like extracted metadata, so dates compare as dates. A chunk with
+    several values of a field matches a condition if any of its values does; a range matches
+    if it overlaps the chunk's smallest to largest value.
+    """
+
+    def __init__(self, conditions: List[Condition]):
+        """
+        Initializes the filter.
+
+        Args:
+            conditions (List[Condition]): The conditions that must all hold.
+        """
+        self.conditions = conditions
+
+    @classmethod
+    def parse(cls, filters: Any, fields: Iterable[str]) -> Optional["MetadataFilter"]:
+        """
+        Parses the filters of a /retrieve request.
+
+        Args:
+            filters (Any): The filters as sent by the client, or None.
+            fields (Iterable[str]): The fields that can be filtered on.
+
+        Returns:
+            Optional[MetadataFilter]: The filter, or None if there are no conditions.
+
+        Raises:
+            ValueError: If the filters are malformed or use a field that is not extracted.
+        """
+        if not filters:
+            return None
+        if not isinstance(filters, dict):
+            raise ValueError("Filters must be an object mapping fields to values")
+        fields = set(fields)
+        conditions: List[Condition] = []
+        for field, value in filters.items():
+            if field not in fields:
+                raise ValueError(f"Cannot filter on '{field}'; filterable fields: {', '.join(sorted(fields)) or 'none'}")
+            if isinstance(value, dict):
+                if not value or set(value) - set(RANGE_OPERATORS):
+                    raise ValueError(f"Range filter on '{field}' takes {', '.join(RANGE_OPERATORS)}")
+                for operator, bound in value.items():
+                    bound = normalize_value(bound)
+                    if isinstance(bound, bool) or not isinstance(bound, (int, float)):
+                        raise ValueError(f"Range filter on '{field}' needs numbers or ISO dates")
+                    conditions.append((field, operator, bound))
+            elif isinstance(value, list):
+                if not value or not all(cls._is_scalar(item) for item in value):
+                    raise ValueError(f"Filter on '{field}' needs a non-empty list of values")
+                conditions.append((field, "in", [normalize_value(item) for item in value]))
+            elif cls._is_scalar(value):
+                conditions.append((field, "eq", normalize_value(value)))
+            else:
+                raise ValueError(f"Invalid filter value for '{field}'")
+        return cls(conditions)
+
+    @staticmethod
+    def _is_scalar(value: Any) -> bool:
+        return isinstance(value, (str, int, float, bool))
+
+    @property
+    def key(self) -> str:
+        """ A canonical form of the filter, e.g. for cache keys. """
+        return json.dumps(sorted(self.conditions, key=lambda condition: condition[:2]), separators=(",", ":"))
+
+    def to_chroma(self) -> dict:
+        """ Returns the filter as a Chroma `where` clause. """
+        clauses = []
+        for field, operator, value in self.conditions:
+            if operator in ("eq", "in"):
+                values = [value] if operator == "eq" else value
+                alternatives = [{field: {f"${operator}": value}}]
+                alternatives.extend({value_key(field, item): {"$eq": True}} for item in values)
+            else:
+                alternatives = [{field: {f"${operator}": value}}]
+                if operator in ("gt", "gte"):
+                    alternatives.append({max_key(field): {f"${operator}": value}})
+            clauses.append(alternatives[0] if len(alternatives) == 1 else {"$or": alternatives})
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def matches(self, metadata: dict) -> bool:
+        """ Returns whether a chunk's metadata satisfies the filter. """
+        for field, operator, value in self.conditions:
+            if operator in ("eq", "in"):
+                values = [value] if operator == "eq" else value
+                if not any(metadata.get(field) == item or metadata.get(value_key(field, item)) is True for item in values):
+                    return False
+                continue
+            bounds = [metadata.get(field)]
+            if operator in ("gt", "gte"):
+                bounds.append(metadata.get(max_key(field)))
+            if not any(_is_number(bound) and _compare(operator, bound, value) for bound in bounds):
+                return False
+        return True
+
+    def mask(self, columns: "MetadataColumns") -> np.ndarray:
+        """
+        Evaluates the filter over metadata columns.
+
+        Args:
+            columns (MetadataColumns): The metadata of the entries to filter.
+
+        Returns:
+            np.ndarray: A boolean array, True for the entries satisfying the filter.
+        """
+        mask = np.ones(columns.size, dtype=bool)
+        for field, operator, value in self.conditions:
+            if operator in ("eq", "in"):
+                values = columns.values(field)
+                mask &= np.logical_or.reduce([
+                    (values == item) | columns.values(value_key(field, item)).astype(bool)
+                    for item in ([value] if operator == "eq" else value)
+                ])
+            else:
+                # NaN, i.e. a missing or non-numeric value, fails every comparison
+                with np.errstate(invalid="ignore"):
+                    matched = _compare(operator, columns.numbers(field), value)
+                    if operator in ("gt", "gte"):
+                        matched |= _compare(operator, columns.numbers(max_key(field)), value)
+                mask &= matched
+        return mask
+
+
+class MetadataColumns:
+    """
+    Column-wise view of the metadata of a list of entries, for vectorized filtering.
+
+    Columns are built on first use and kept until the entries change, when the owner
+    creates a new instance.
+    """
+
+    def __init__(self, metadatas: List[dict]):
+        """
+        Initializes the columns without building any.
+
+        Args:
+            metadatas (List[dict]): The metadata of every entry, in index order.
+        """
+        self.metadatas = metadatas
+        self.size = len(metadatas)
+        self._values: Dict[str, np.ndarray] = {}
+        self._numbers: Dict[str, np.ndarray] = {}
+
+    def values(self, field: str) -> np.ndarray:
+        """ Returns the values of a field as an object array, None where it is missing. """
+        column = self._values.get(field)
+        if column is None:
+            column = np.empty(self.size, dtype=object)
+            column[:] = [metadata.get(field) for metadata in self.metadatas]
+            self._values[field] = column
+        return column
+
+    def numbers(self, field: str) -> np.ndarray:
+        """ Returns the numeric values of a field as a float array, NaN where it is missing or not a number. """
+        column = self._numbers.get(field)
+        if column is None:
+            column = np.array([
+                value if _is_number(value) else np.nan
+                for value in self.values(field)
+            ], dtype=np.float64)
+            self._numbers[field] = column
+        return column
+
+
+def _compare(operator: str, actual: Any, bound: Any) -> Any:
+    """ Applies a range operator to a value or array. """
+    if operator == "gt":
+        return actual > bound
+    if operator == "gte":
+        return actual >= bound
+    if operator == "lt":
+        return actual < bound
+    return actual <= bound
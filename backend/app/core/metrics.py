@@ -0,0 +1,353 @@
+import abc
+import bisect
+import inspect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Histogram bucket bounds in seconds, covering sub-millisecond lookups up to minute-long ingest stages
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+# A metric value read at collection time, by label values
+MetricCallback = Callable[[], Dict[LabelValues, float]]
+
+
+def _format_value(value: float) -> str:
+    """ Formats a sample value as Prometheus text. """
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    """ Escapes a label value for the Prometheus text format. """
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """ Formats labels as `{name="value",...}`, or an empty string without labels. """
+    if not names:
+        return ""
+    return "{" + ",".join(f"{name}=\"{_escape(str(value))}\"" for name, value in zip(names, values)) + "}"
+
+
+class Metric(abc.ABC):
+    """
+    Base class of metrics with a fixed set of label names.
+
+    Values are kept per combination of label values and updated under a lock, so metrics
+    can be updated from worker threads as well as from the event loop.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """
+        Initializes the metric.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The help text.
+            labelnames (Sequence[str]): The names of the metric's labels.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._callbacks: Dict[str, MetricCallback] = {}
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        """ Returns the label values in label name order. """
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric '{self.name}' expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def set_callback(self, key: str, callback: MetricCallback) -> None:
+        """
+        Reads values from a callback at collection time, replacing an earlier callback with the same key.
+
+        Useful for values other components already count, such as cache hits.
+
+        Args:
+            key (str): Identifies the callback.
+            callback (MetricCallback): Returns values by label values.
+        """
+        with self._lock:
+            self._callbacks[key] = callback
+
+    @abc.abstractmethod
+    def _values(self) -> Dict[LabelValues, float]:
+        """ Returns the recorded values merged with the callback values. """
+
+    def collect(self) -> List[str]:
+        """ Returns the metric in the Prometheus text format. """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        samples = self._values()
+        if not self.labelnames:
+            samples.setdefault((), 0.0)
+        for values, value in sorted(samples.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+    def _callback_values(self) -> Dict[LabelValues, float]:
+        """ Sums the values of all callbacks. """
+        with self._lock:
+            callbacks = list(self._callbacks.values())
+        values: Dict[LabelValues, float] = {}
+        for callback in callbacks:
+            for key, value in callback().items():
+                values[key] = values.get(key, 0.0) + value
+        return values
+
+
+class Counter(Metric):
+    """ A value that only goes up, e.g. the number of errors. """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._counts: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """ Increments the counter for the given labels. """
+        key = self._key(labels)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0.0) + amount
+
+    def _values(self) -> Dict[LabelValues, float]:
+        values = self._callback_values()
+        with self._lock:
+            for key, value in self._counts.items():
+                values[key] = values.get(key, 0.0) + value
+        return values
+
+
+class Gauge(Metric):
+    """ A value that goes up and down, e.g. the number of open connections. """
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._gauges: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        """ Sets the gauge for the given labels. """
+        key = self._key(labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """ Increments the gauge for the given labels. """
+        key = self._key(labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        """ Decrements the gauge for the given labels. """
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        """ Counts a block as in progress while it runs. """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _values(self) -> Dict[LabelValues, float]:
+        values = self._callback_values()
+        with self._lock:
+            values.update(self._gauges)
+        return values
+
+
+class Histogram(Metric):
+    """ Counts observations, e.g. durations, in cumulative buckets. """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        """
+        Initializes the histogram.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The help text.
+            labelnames (Sequence[str]): The names of the metric's labels.
+            buckets (Sequence[float]): The upper bounds of the buckets, an `+Inf` bucket is added.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """ Records an observation for the given labels. """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def time(self, **labels: str) -> "Timer":
+        """
+        Times a block or a function and records its duration in seconds.
+
+        Usable as a context manager or as a decorator of sync and async functions.
+        """
+        return Timer(self, labels)
+
+    def _values(self) -> Dict[LabelValues, float]:
+        """ Returns the number of observations by label values; `collect` renders the buckets. """
+        with self._lock:
+            return {key: float(sum(counts)) for key, counts in self._counts.items()}
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            snapshot = {key: (list(counts), self._sums[key]) for key, counts in self._counts.items()}
+        names = self.labelnames + ("le",)
+        for key, (counts, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Timer:
+    """ Records the duration of a block or function call in a histogram. """
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self._started: Optional[float] = None
+
+    def __enter__(self) -> "Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self._started, **self.labels)
+
+    def __call__(self, function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+            @wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with Timer(self.histogram, self.labels):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with Timer(self.histogram, self.labels):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+class MetricsRegistry:
+    """
+    Collects metrics and renders them in the Prometheus text exposition format.
+
+    Metrics are kept per process; run a single worker per scrape target, or aggregate
+    the workers' metrics in Prometheus.
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """ Adds a metric, returning it; names must be unique. """
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """ Returns all metrics in the Prometheus text format. """
+        return "\n".join(line for metric in self._metrics.values() for line in metric.collect()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS: Histogram = REGISTRY.register(Histogram(
+    "rag_stage_duration_seconds",
+    "Duration of ingest and retrieval stages: load, split, embed, upsert, queue, retrieve, rerank, "
+    "time_to_first_token and llm.",
+    ["stage"]
+))
+CACHE_REQUESTS: Counter = REGISTRY.register(Counter(
+    "rag_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss).",
+    ["cache", "result"]
+))
+ERRORS: Counter = REGISTRY.register(Counter(
+    "rag_errors_total",
+    "Errors by operation.",
+    ["operation"]
+))
+ACTIVE_WEBSOCKETS: Gauge = REGISTRY.register(Gauge(
+    "rag_active_websockets",
+    "Open WebSocket connections by endpoint.",
+    ["endpoint"]
+))
+LOADED_COLLECTIONS: Gauge = REGISTRY.register(Gauge(
+    "rag_loaded_collections",
+    "Collections loaded in memory."
+))
+COALESCED_QUERIES: Counter = REGISTRY.register(Counter(
+    "rag_coalesced_queries_total",
+    "Queries answered by joining an identical query in flight."
+))
+CHAIN_RUNS: Gauge = REGISTRY.register(Gauge(
+    "rag_chain_runs",
+    "Chain runs holding an admission slot (running) or waiting for one (queued).",
+    ["state"]
+))
+REJECTED_QUERIES: Counter = REGISTRY.register(Counter(
+    "rag_rejected_queries_total",
+    "Queries rejected by admission control, by priority class and reason.",
+    ["priority", "reason"]
+))
+INGESTED_CHUNKS: Counter = REGISTRY.register(Counter(
+    "rag_ingested_chunks_total",
+    "Chunks embedded and stored by ingestion."
+))
+
+
+def span(stage: str) -> Timer:
+    """
+    Times a pipeline stage in `STAGE_SECONDS`.
+
+    Usable as a context manager or as a decorator of sync and async functions.
+
+    Args:
+        stage (str): The stage name.
+
+    Returns:
+        Timer: The timer recording the stage duration.
+    """
+    return STAGE_SECONDS.time(stage=stage)
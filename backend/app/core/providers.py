@@ -0,0 +1,71 @@
+import importlib
+import threading
+from functools import lru_cache
+from typing import Any, Callable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+@lru_cache(maxsize=None)
+def import_string(path: str) -> Any:
+    """
+    Imports an object from a "package.module:attribute" path.
+
+    The object is imported on the first call and reused for the life of the process.
+
+    Args:
+        path (str): The import path, e.g. "langchain_openai:ChatOpenAI".
+
+    Returns:
+        Any: The imported object.
+
+    Raises:
+        ImportError: If the module or attribute cannot be imported.
+    """
+    module_name, _, attribute = path.partition(":")
+    module = importlib.import_module(module_name)
+    try:
+        return getattr(module, attribute) if attribute else module
+    except AttributeError as e:
+        raise ImportError(f"Module '{module_name}' has no attribute '{attribute}'") from e
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    Embeddings that build the underlying client on the first call.
+
+    This lets the application wire up its embedding layers at startup without importing
+    or constructing the provider, e.g. for a process that only serves `/status`.
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings]):
+        """
+        Initializes the LazyEmbeddings.
+
+        Args:
+            factory (Callable[[], Embeddings]): Builds the embeddings on first use.
+        """
+        self.factory = factory
+        self._embeddings: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """ Returns the underlying embeddings, building them on first access. """
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self.factory()
+        return self._embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
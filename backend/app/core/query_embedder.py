@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.embedding_cache import normalize_text
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BatchingQueryEmbeddings(Embeddings):
+    """
+    Query embeddings with an in-process LRU cache and cross-session micro-batching.
+
+    Cached queries are answered without leaving the process. Queries that miss
+    the cache are queued, and queries arriving within `batch_window_ms` of each
+    other, from any session or thread, are embedded together in one request.
+    Identical queries waiting in the same window share a single slot.
+
+    Batches are embedded with `embed_documents`, which yields the same vectors as
+    `embed_query` for symmetric models such as OpenAI's. Document embedding is
+    passed straight through to the wrapped embeddings.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache_size: int = 1024,
+        batch_window_ms: float = 5.0,
+        max_batch_size: int = 32
+    ):
+        """
+        Initializes the BatchingQueryEmbeddings.
+
+        Args:
+            embeddings (Embeddings): The embeddings to compute vectors with.
+            cache_size (int): The number of query vectors kept in memory.
+            batch_window_ms (float): How long to wait for more queries before embedding a batch.
+            max_batch_size (int): The maximum number of queries per embedding request.
+        """
+        self.embeddings = embeddings
+        self.cache_size = cache_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_queries = 0
+        self.max_batch_seen = 0
+
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._pending: Dict[str, Tuple[str, Future]] = {}
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def hit_rate(self) -> float:
+        """ The fraction of queries answered from the cache. """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def mean_batch_size(self) -> float:
+        """ The average number of queries per embedding request. """
+        return self.batched_queries / self.batches if self.batches else 0.0
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        """ Returns the cached vector for key, marking it as recently used. """
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        """ Caches a vector, evicting the least recently used one if full. """
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _submit(self, key: str, text: str) -> Future:
+        """ Queues a query for the next batch, returning a future for its vector. """
+        with self._condition:
+            if key in self._pending:
+                return self._pending[key][1]
+            future = Future()
+            self._pending[key] = (text, future)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+            return future
+
+    def _next_batch(self) -> List[Tuple[str, str, Future]]:
+        """ Waits for queries and collects them until the window closes or the batch is full. """
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending)
+            deadline = time.monotonic() + self.batch_window
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            keys = list(self._pending)[:self.max_batch_size]
+            return [(key, *self._pending.pop(key)) for key in keys]
+
+    def _run(self) -> None:
+        """ Embeds queued queries batch by batch. """
+        while True:
+            batch = self._next_batch()
+            self.batches += 1
+            self.batched_queries += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            try:
+                vectors = self.embeddings.embed_documents([text for _, text, _ in batch])
+            except Exception as e:
+                logger.error(f"Failed to embed batch of {len(batch)} queries: {e}")
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (key, _, future), vector in zip(batch, vectors):
+                self._remember(key, vector)
+                future.set_result(vector)
+
+    def embed_query(self, text: str) -> List[float]:
+        """ Embeds a query from the cache or as part of the next batch. """
+        key = normalize_text(text)
+        vector = self._lookup(key)
+        if vector is not None:
+            return vector
+        return self._submit(key, text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """ Asynchronously embeds a query from the cache or as part of the next batch. """
+        key = normalize_text(text)
+        vector = self._lookup(key)
+        if vector is not None:
+            return vector
+        return await asyncio.wrap_future(self._submit(key, text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """ Embeds documents with the wrapped embeddings. """
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """ Asynchronously embeds documents with the wrapped embeddings. """
+        return await self.embeddings.aembed_documents(texts)
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Returns cache and batching metrics.
+
+        Returns:
+            Dict[str, float]: Hit rate, cache counters and batch size statistics.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "batches": self.batches,
+            "mean_batch_size": self.mean_batch_size,
+            "max_batch_size": self.max_batch_seen,
+        }
@@ -0,0 +1,247 @@
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.core.lexical_index import tokenize
+from app.core.logger import get_logger
+from app.core.metadata import MetadataFilter
+from app.core.metrics import STAGE_SECONDS
+from app.core.providers import import_string
+from app.core.tokens import count_tokens
+
+logger = get_logger(__name__)
+
+
+class Reranker(ABC):
+    """ Scores candidate documents against a query. """
+
+    blocking: bool = False
+    """ Whether scoring is slow enough to run outside the event loop. """
+
+    @abstractmethod
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        """
+        Scores documents by relevance to the query.
+
+        Args:
+            query (str): The query.
+            documents (List[Document]): The candidates, in retrieval order.
+
+        Returns:
+            List[float]: One score per document; higher is more relevant.
+        """
+
+
+class LexicalReranker(Reranker):
+    """
+    Cheap CPU re-ranker based on query term statistics over the candidate set.
+
+    All candidates are scored at once with NumPy: BM25 over the candidates, the fraction of
+    query terms each candidate covers and the fraction of query bigrams it contains, plus a
+    small prior for the retrieval rank. It needs no model and scores a few dozen candidates
+    in well under a millisecond.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, rank_prior: float = 0.1):
+        """
+        Initializes the LexicalReranker.
+
+        Args:
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 document length normalization.
+            rank_prior (float): Weight of the retrieval rank, which breaks ties between candidates.
+        """
+        self.k1 = k1
+        self.b = b
+        self.rank_prior = rank_prior
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        query_tokens = tokenize(query)
+        terms = list(dict.fromkeys(query_tokens))
+        if not terms or not documents:
+            return [0.0] * len(documents)
+        query_bigrams = set(zip(query_tokens, query_tokens[1:]))
+        tokens = [tokenize(document.page_content) for document in documents]
+        counters = [Counter(document_tokens) for document_tokens in tokens]
+
+        counts = np.array([[counter[term] for term in terms] for counter in counters], dtype=np.float32)
+        lengths = np.array([max(len(document_tokens), 1) for document_tokens in tokens], dtype=np.float32)
+        document_frequency = (counts > 0).sum(axis=0)
+        idf = np.log(1 + (len(documents) - document_frequency + 0.5) / (document_frequency + 0.5))
+        length_norm = self.k1 * (1 - self.b + self.b * lengths / lengths.mean())
+        bm25 = (idf * counts * (self.k1 + 1) / (counts + length_norm[:, None])).sum(axis=1)
+        bm25 = bm25 / bm25.max() if bm25.max() > 0 else bm25
+        coverage = (counts > 0).mean(axis=1)
+        phrases = np.array([
+            len(query_bigrams.intersection(zip(document_tokens, document_tokens[1:]))) / len(query_bigrams)
+            if query_bigrams else 0.0
+            for document_tokens in tokens
+        ], dtype=np.float32)
+        prior = self.rank_prior / (1 + np.arange(len(documents), dtype=np.float32))
+        return (bm25 + coverage + phrases + prior).tolist()
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Re-ranker scoring query and document pairs with a local cross-encoder model.
+
+    Requires the optional `sentence-transformers` package. The model is loaded on first use
+    and runs on the CPU in batches. Instances are shared by all sessions, see `create_reranker`.
+    """
+
+    blocking = True
+
+    def __init__(self, model_name: str, batch_size: int = 32):
+        """
+        Initializes the CrossEncoderReranker without loading the model.
+
+        Args:
+            model_name (str): The cross-encoder model name or path.
+            batch_size (int): The number of pairs scored per batch.
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model: Optional[Any] = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> Any:
+        """ Returns the cross-encoder model, loading it on first access. """
+        # Sessions share the re-ranker, and their first queries may arrive at once
+        with self._lock:
+            if self._model is None:
+                logger.info(f"Loading cross-encoder '{self.model_name}'")
+                try:
+                    cross_encoder = import_string("sentence_transformers:CrossEncoder")
+                except ImportError as e:
+                    raise ImportError("The 'cross-encoder' reranker requires the sentence-transformers package") from e
+                self._model = cross_encoder(self.model_name, device="cpu")
+            return self._model
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        if not documents:
+            return []
+        pairs = [(query, document.page_content) for document in documents]
+        return [float(score) for score in self.model.predict(pairs, batch_size=self.batch_size)]
+
+
+@lru_cache(maxsize=None)
+def create_reranker(name: str, model_name: Optional[str] = None, batch_size: int = 32) -> Optional[Reranker]:
+    """
+    Creates a re-ranker by name.
+
+    Re-rankers are created once per process and settings and shared by all sessions, so a
+    cross-encoder model is only loaded once.
+
+    Args:
+        name (str): 'lexical', 'cross-encoder' or 'none'.
+        model_name (Optional[str]): The cross-encoder model.
+        batch_size (int): The cross-encoder batch size.
+
+    Returns:
+        Optional[Reranker]: The re-ranker, or None for 'none'.
+
+    Raises:
+        ValueError: If the name is unknown.
+    """
+    if name == "none":
+        return None
+    if name == "lexical":
+        return LexicalReranker()
+    if name == "cross-encoder":
+        return CrossEncoderReranker(model_name, batch_size=batch_size)
+    raise ValueError(f"Unknown reranker '{name}'")
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Retriever that re-ranks the candidates of another retriever.
+
+    The base retriever over-fetches candidates, the re-ranker scores them and the best `k`
+    documents are kept, as long as they fit in `token_budget` tokens. The top document is
+    always kept. The duration of every stage is logged and kept in `last_timings`. A
+    `metadata_filter` is passed on to the base retriever.
+    """
+
+    retriever: BaseRetriever
+    """ The retriever fetching the candidates. """
+    reranker: Any
+    """ The `Reranker` scoring the candidates. """
+    k: int = 4
+    """ The maximum number of documents to return. """
+    token_budget: Optional[int] = None
+    """ The maximum number of tokens of the returned documents. """
+    last_timings: Dict[str, float] = {}
+    """ Milliseconds spent per stage on the latest query. """
+
+    def _select(self, documents: List[Document], scores: List[float]) -> List[Document]:
+        """ Keeps the best-scoring documents that fit in the token budget. """
+        ranked = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        selected, tokens = [], 0
+        for i in ranked:
+            if len(selected) >= self.k:
+                break
+            document_tokens = count_tokens(documents[i].page_content)
+            if selected and self.token_budget is not None and tokens + document_tokens > self.token_budget:
+                continue
+            selected.append(documents[i])
+            tokens += document_tokens
+        return selected
+
+    def _record(self, candidates: int, selected: List[Document], started: float, retrieved: float) -> None:
+        """ Records and logs the stage timings of a query. """
+        finished = time.perf_counter()
+        STAGE_SECONDS.observe(finished - retrieved, stage="rerank")
+        self.last_timings = {
+            "retrieval_ms": (retrieved - started) * 1000,
+            "rerank_ms": (finished - retrieved) * 1000,
+        }
+        logger.debug(
+            f"Retrieved {candidates} candidates in {self.last_timings['retrieval_ms']:.1f} ms, "
+            f"re-ranked and kept {len(selected)} in {self.last_timings['rerank_ms']:.1f} ms"
+        )
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+        metadata_filter: Optional[MetadataFilter] = None
+    ) -> List[Document]:
+        started = time.perf_counter()
+        candidates = self.retriever.invoke(
+            query, config={"callbacks": run_manager.get_child()}, metadata_filter=metadata_filter
+        )
+        retrieved = time.perf_counter()
+        selected = self._select(candidates, self.reranker.score(query, candidates))
+        self._record(len(candidates), selected, started, retrieved)
+        return selected
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        metadata_filter: Optional[MetadataFilter] = None
+    ) -> List[Document]:
+        started = time.perf_counter()
+        candidates = await self.retriever.ainvoke(
+            query, config={"callbacks": run_manager.get_child()}, metadata_filter=metadata_filter
+        )
+        retrieved = time.perf_counter()
+        if self.reranker.blocking:
+            scores = await asyncio.to_thread(self.reranker.score, query, candidates)
+        else:
+            scores = self.reranker.score(query, candidates)
+        selected = self._select(candidates, scores)
+        self._record(len(candidates), selected, started, retrieved)
+        return selected
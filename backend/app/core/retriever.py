@@ -0,0 +1,134 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.core.lexical_index import tokenize
+from app.core.metadata import MetadataFilter
+
+
+class VectorIndexRetriever(BaseRetriever):
+    """
+    Retriever over the application's shared vector index.
+
+    The index is fetched from the vector store handle on every query, so the
+    retriever always searches the latest committed collection. A `metadata_filter` passed
+    when invoking the retriever restricts the search to the matching chunks.
+    """
+
+    vector_store: Any
+    """ The `VectorStoreHandle` to search. """
+    k: int = 4
+    """ The number of documents to retrieve. """
+    score_threshold: Optional[float] = None
+    """ The minimum relevance score of returned documents. """
+
+    def _filter(self, results: List[Tuple[Document, float]]) -> List[Document]:
+        """ Drops results below the score threshold. """
+        if self.score_threshold is None:
+            return [document for document, _ in results]
+        return [document for document, score in results if score >= self.score_threshold]
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+        metadata_filter: Optional[MetadataFilter] = None
+    ) -> List[Document]:
+        embedding = self.vector_store.embeddings.embed_query(query)
+        return self._filter(self.vector_store.get().search(embedding, self.k, metadata_filter))
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        metadata_filter: Optional[MetadataFilter] = None
+    ) -> List[Document]:
+        embedding = await self.vector_store.embeddings.aembed_query(query)
+        results = await asyncio.to_thread(self.vector_store.get().search, embedding, self.k, metadata_filter)
+        return self._filter(results)
+
+
+class HybridRetriever(VectorIndexRetriever):
+    """
+    Retriever fusing BM25 keyword search with vector search.
+
+    Both searches fetch `fetch_k` candidates and the rankings are merged with reciprocal rank
+    fusion, so exact identifiers such as machine IDs or part names rank high even when their
+    embeddings are not close. Short queries without a question mark whose terms all occur in
+    the keyword index are answered from the keyword index alone, without embedding the query.
+    """
+
+    fetch_k: int = 20
+    """ The number of candidates fetched from each search. """
+    rrf_k: int = 60
+    """ The reciprocal rank fusion constant; higher values flatten rank differences. """
+    keyword_query_max_terms: int = 3
+    """ The maximum number of terms of a keyword-only query, 0 to always search vectors. """
+
+    def _is_keyword_query(self, query: str) -> bool:
+        """ Returns whether the query can be answered from the keyword index alone. """
+        terms = tokenize(query)
+        return (
+            0 < len(terms) <= self.keyword_query_max_terms
+            and "?" not in query
+            and self.vector_store.get_lexical_index().contains_terms(terms)
+        )
+
+    def _keyword_search(self, query: str, metadata_filter: Optional[MetadataFilter]) -> Tuple[List[Tuple[Document, float]], bool]:
+        """ Searches the keyword index; also returns whether the query is answered by it alone. """
+        results = self.vector_store.get_lexical_index().search(query, self.fetch_k, metadata_filter)
+        return results, self._is_keyword_query(query)
+
+    def _fuse(self, keyword_results: List[Tuple[Document, float]], vector_results: List[Tuple[Document, float]]) -> List[Document]:
+        """ Merges both rankings with reciprocal rank fusion and returns the top k documents. """
+        scores: Dict[Tuple[Any, str], float] = {}
+        documents: Dict[Tuple[Any, str], Document] = {}
+        for results in (keyword_results, vector_results):
+            for rank, (document, _) in enumerate(results):
+                key = (document.metadata.get("source"), document.page_content)
+                documents.setdefault(key, document)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        return [documents[key] for key in ranked]
+
+    def _vector_results(self, results: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+        """ Drops vector results below the score threshold. """
+        if self.score_threshold is None:
+            return results
+        return [(document, score) for document, score in results if score >= self.score_threshold]
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+        metadata_filter: Optional[MetadataFilter] = None
+    ) -> List[Document]:
+        keyword_results, keyword_only = self._keyword_search(query, metadata_filter)
+        if keyword_only:
+            return [document for document, _ in keyword_results[:self.k]]
+        embedding = self.vector_store.embeddings.embed_query(query)
+        vector_results = self.vector_store.get().search(embedding, self.fetch_k, metadata_filter)
+        return self._fuse(keyword_results, self._vector_results(vector_results))
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        metadata_filter: Optional[MetadataFilter] = None
+    ) -> List[Document]:
+        # Loading and searching the keyword index take its lock, which ingestion holds while updating it
+        keyword_results, keyword_only = await asyncio.to_thread(self._keyword_search, query, metadata_filter)
+        if keyword_only:
+            return [document for document, _ in keyword_results[:self.k]]
+        embedding = await self.vector_store.embeddings.aembed_query(query)
+        vector_results = await asyncio.to_thread(
+            self.vector_store.get().search, embedding, self.fetch_k, metadata_filter
+        )
+        return self._fuse(keyword_results, self._vector_results(vector_results))
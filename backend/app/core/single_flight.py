@@ -0,0 +1,134 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# An event of an answer: ('sources', ...), ('delta', text), ('end', answer) or ('error', exception)
+FlightEvent = Tuple[str, Any]
+
+
+class Flight:
+    """
+    An answer being generated, shared by every session that asked for it.
+
+    The producer publishes the events of the answer, which are kept until it is done, so
+    sessions joining late first replay the events they missed and then follow live ones.
+    """
+
+    def __init__(self, key: Hashable):
+        """
+        Initializes an empty flight.
+
+        Args:
+            key (Hashable): The key identical queries share.
+        """
+        self.key = key
+        self.events: List[FlightEvent] = []
+        self.done = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._updated = asyncio.Event()
+
+    def publish(self, kind: str, value: Any) -> None:
+        """ Appends an event and wakes the subscribers. """
+        self.events.append((kind, value))
+        self._wake()
+
+    def finish(self) -> None:
+        """ Marks the flight as done; subscribers stop after the last event. """
+        self.done = True
+        self._wake()
+
+    def _wake(self) -> None:
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    async def follow(self) -> AsyncIterator[FlightEvent]:
+        """
+        Yields every event of the flight, from the first one, until it is done.
+
+        Yields:
+            FlightEvent: The events in the order they were published.
+        """
+        position = 0
+        while True:
+            updated = self._updated
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.done:
+                return
+            await updated.wait()
+
+
+class SingleFlight:
+    """
+    Coalesces identical queries that are in flight at the same time.
+
+    The first session asking a query starts a producer task and later sessions with the same
+    key subscribe to it, so N identical concurrent queries cost one retrieval and one LLM
+    call. The producer runs independently of the session that started it, so the answer
+    keeps streaming to the other subscribers if that session disconnects; it is cancelled
+    once no session follows it anymore. Finished flights are forgotten right away; completed
+    answers are reused by the answer cache.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    @asynccontextmanager
+    async def join(
+        self,
+        key: Hashable,
+        produce: Callable[[Flight], Awaitable[None]]
+    ) -> AsyncIterator[Tuple[Flight, bool]]:
+        """
+        Subscribes to the flight of a key, starting it if none is in flight.
+
+        Args:
+            key (Hashable): The key of the query, e.g. its normalized text and the collection version.
+            produce (Callable[[Flight], Awaitable[None]]): Generates the answer and publishes its
+                events; only called if no flight with the key is in flight.
+
+        Yields:
+            Tuple[Flight, bool]: The flight, and whether this subscriber started it.
+        """
+        flight = self._flights.get(key)
+        started = flight is None
+        if started:
+            flight = Flight(key)
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(flight, produce))
+        flight.subscribers += 1
+        try:
+            yield flight, started
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                logger.info("All sessions left an answer in flight; cancelling it")
+                self._forget(flight)
+                flight.task.cancel()
+
+    async def _run(self, flight: Flight, produce: Callable[[Flight], Awaitable[None]]) -> None:
+        """ Runs a producer, publishing an error event with the exception if it fails. """
+        try:
+            await produce(flight)
+        except asyncio.CancelledError:
+            flight.publish("error", RuntimeError("The answer was cancelled"))
+        except Exception as e:
+            # Logged and counted by every session following the flight
+            flight.publish("error", e)
+        finally:
+            self._forget(flight)
+            flight.finish()
+
+    def _forget(self, flight: Flight) -> None:
+        """ Removes a flight, so later queries start a new one. """
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
@@ -0,0 +1,64 @@
+from functools import lru_cache
+from typing import Any, Optional
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING) -> Optional[Any]:
+    """
+    Returns a tiktoken encoding, or None if tiktoken or its encoding files are unavailable.
+
+    Args:
+        encoding_name (str): The tiktoken encoding name.
+
+    Returns:
+        Optional[Any]: The encoding, or None.
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.warning(f"tiktoken encoding '{encoding_name}' unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    """
+    Counts the tokens in text with a local tokenizer.
+
+    Falls back to an estimate of four characters per token when tiktoken cannot be loaded.
+
+    Args:
+        text (str): The text to count tokens for.
+        encoding_name (str): The tiktoken encoding name.
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, encoding_name: str = DEFAULT_ENCODING) -> str:
+    """
+    Truncates text to at most `max_tokens` tokens.
+
+    Args:
+        text (str): The text to truncate.
+        max_tokens (int): The maximum number of tokens to keep.
+        encoding_name (str): The tiktoken encoding name.
+
+    Returns:
+        str: The leading part of the text that fits in `max_tokens`.
+    """
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return text[:max(max_tokens, 0) * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max(max_tokens, 0)])
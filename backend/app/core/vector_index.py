@@ -0,0 +1,350 @@
+import json
+import math
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core.logger import get_logger
+from app.core.metadata import MetadataColumns, MetadataFilter
+from app.core.providers import import_string
+
+logger = get_logger(__name__)
+
+
+def l2_relevance(squared_distances: np.ndarray) -> np.ndarray:
+    """
+    Converts squared L2 distances to relevance scores.
+
+    This matches LangChain's relevance scores for Chroma's default `l2` space, so score
+    thresholds mean the same for every engine.
+    """
+    return 1.0 - squared_distances / math.sqrt(2)
+
+
+class VectorIndex(ABC):
+    """ A vector index holding chunk embeddings, texts and metadata. """
+
+    # Whether writes are on disk without calling `persist`, so ingestion can commit files to
+    # the manifest batch by batch; otherwise the index is persisted once per ingestion
+    durable_writes = False
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str], metadatas: List[dict]) -> None:
+        """ Inserts or replaces entries. """
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        """ Deletes entries by ID. """
+
+    @abstractmethod
+    def count(self) -> int:
+        """ Returns the number of entries. """
+
+    @abstractmethod
+    def reset(self) -> None:
+        """ Deletes all entries. """
+
+    @abstractmethod
+    def search(
+        self,
+        embedding: List[float],
+        k: int,
+        metadata_filter: Optional[MetadataFilter] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        Finds the entries closest to an embedding.
+
+        Args:
+            embedding (List[float]): The query embedding.
+            k (int): The number of entries to return.
+            metadata_filter (Optional[MetadataFilter]): Only entries whose metadata satisfies the
+                filter are searched.
+
+        Returns:
+            List[Tuple[Document, float]]: Documents with their relevance scores, most relevant first.
+        """
+
+    def persist(self) -> None:
+        """ Writes the index to disk, if its writes are not durable already. """
+
+    def close(self) -> None:
+        """ Releases the memory held by the index; it is not used afterwards. """
+
+
+class ChromaIndex(VectorIndex):
+    """
+    Vector index backed by a persistent Chroma collection (HNSW).
+
+    The HNSW settings (`hnsw:construction_ef`, `hnsw:search_ef`, `hnsw:M`, ...) are passed as
+    collection metadata. Chroma applies them when the collection is created, so changing them
+    for an existing collection requires resetting it and ingesting again.
+    """
+
+    # Chroma writes every upsert and delete to its SQLite database
+    durable_writes = True
+
+    def __init__(self, persist_directory: str, **hnsw_params: Any):
+        """
+        Opens or creates the collection.
+
+        Args:
+            persist_directory (str): The directory the collection is persisted in.
+            **hnsw_params (Any): HNSW settings, keyed by their Chroma metadata names.
+        """
+        self.persist_directory = persist_directory
+        self.hnsw_params = hnsw_params
+        self.store = self._open()
+
+    def _open(self) -> Any:
+        """ Opens the Chroma collection; Chroma is only imported once a collection is opened. """
+        chroma = import_string("langchain_community.vectorstores:Chroma")
+        return chroma(persist_directory=self.persist_directory, collection_metadata=self.hnsw_params or None)
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str], metadatas: List[dict]) -> None:
+        self.store._collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+
+    def delete(self, ids: List[str]) -> None:
+        self.store.delete(ids=ids)
+
+    def count(self) -> int:
+        return self.store._collection.count()
+
+    def reset(self) -> None:
+        self.store.delete_collection()
+        self.store = self._open()
+
+    def search(
+        self,
+        embedding: List[float],
+        k: int,
+        metadata_filter: Optional[MetadataFilter] = None
+    ) -> List[Tuple[Document, float]]:
+        count = self.count()
+        if count == 0:
+            return []
+        # Chroma evaluates `where` on its SQLite metadata index and only searches the matching vectors
+        results = self.store.similarity_search_by_vector_with_relevance_scores(
+            embedding,
+            k=min(k, count),
+            filter=metadata_filter.to_chroma() if metadata_filter is not None else None
+        )
+        relevance_fn = self.store._select_relevance_score_fn()
+        return [(document, relevance_fn(distance)) for document, distance in results]
+
+    def close(self) -> None:
+        """
+        Stops the Chroma system of the persist directory.
+
+        Chroma keeps one system per persist directory for the lifetime of the process, so it is
+        also dropped from Chroma's cache. Chroma has no public API for this; failures are logged.
+        """
+        client = self.store._client
+        try:
+            # Private API of chromadb 0.5 (pyproject pins ^0.5.4, checked up to 0.5.23); the public
+            # `clear_system_cache` would stop the systems of every collection. The cache was renamed
+            # from the misspelled `_identifer_to_system` in later Chroma releases
+            for name in ("_identifier_to_system", "_identifer_to_system"):
+                systems = getattr(client, name, None)
+                if isinstance(systems, dict) and client._identifier in systems:
+                    systems.pop(client._identifier).stop()
+                    break
+        except Exception as e:
+            logger.warning(f"Could not close Chroma at '{self.persist_directory}': {e}")
+
+
+class NumpyIndex(VectorIndex):
+    """
+    In-process vector index for small collections, backed by NumPy.
+
+    With `n_lists=0` every query is an exact scan over all vectors. With `n_lists > 0`
+    the vectors are clustered with k-means into an inverted file (IVF) and queries only
+    scan the `n_probe` clusters closest to the query. Filtered queries first select the
+    matching entries from metadata columns and scan all of them exactly, so a narrow filter
+    never misses entries of unprobed clusters. The index is persisted as an `.npz` file next
+    to the Chroma collection. Persisting rewrites the whole file, so ingestion only persists
+    it once per run.
+    """
+
+    FILENAME = "numpy_index.npz"
+
+    def __init__(self, persist_directory: str, n_lists: int = 0, n_probe: int = 8, kmeans_iterations: int = 10):
+        """
+        Loads the index from disk, or starts empty.
+
+        Args:
+            persist_directory (str): The directory the index is persisted in.
+            n_lists (int): The number of IVF clusters, 0 for exact search.
+            n_probe (int): The number of clusters scanned per query.
+            kmeans_iterations (int): The number of k-means iterations when (re)building clusters.
+        """
+        self.path = os.path.join(persist_directory, self.FILENAME)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.kmeans_iterations = kmeans_iterations
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        self._columns: Optional[MetadataColumns] = None
+        if os.path.exists(self.path):
+            self._load()
+
+    def _load(self) -> None:
+        """ Reads the index from disk. """
+        with np.load(self.path, allow_pickle=False) as data:
+            self._vectors = data["vectors"]
+            payload = json.loads(str(data["payload"]))
+        self._ids = payload["ids"]
+        self._texts = payload["texts"]
+        self._metadatas = payload["metadatas"]
+        self._columns = None
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(self._ids)}
+        logger.info(f"Loaded NumPy index with {len(self._ids)} vectors from '{self.path}'")
+
+    def persist(self) -> None:
+        # Serialize a snapshot, so searches are not blocked while the file is written; updated
+        # vectors are overwritten in place, so the array is copied
+        with self._lock:
+            vectors = self._vectors.copy()
+            ids, texts, metadatas = list(self._ids), list(self._texts), list(self._metadatas)
+        payload = json.dumps({"ids": ids, "texts": texts, "metadatas": metadatas})
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, vectors=vectors, payload=np.array(payload))
+        os.replace(tmp_path, self.path)
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str], metadatas: List[dict]) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            if self._vectors.size == 0:
+                self._vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            new_rows = []
+            for chunk_id, vector, text, metadata in zip(ids, vectors, texts, metadatas):
+                position = self._positions.get(chunk_id)
+                if position is None:
+                    self._positions[chunk_id] = len(self._ids)
+                    self._ids.append(chunk_id)
+                    self._texts.append(text)
+                    self._metadatas.append(metadata)
+                    new_rows.append(vector)
+                else:
+                    self._vectors[position] = vector
+                    self._texts[position] = text
+                    self._metadatas[position] = metadata
+            if new_rows:
+                self._vectors = np.vstack([self._vectors, np.stack(new_rows)])
+            self._centroids = None
+            self._columns = None
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            doomed = {self._positions[chunk_id] for chunk_id in ids if chunk_id in self._positions}
+            if not doomed:
+                return
+            keep = [i for i in range(len(self._ids)) if i not in doomed]
+            self._vectors = self._vectors[keep]
+            self._ids = [self._ids[i] for i in keep]
+            self._texts = [self._texts[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._positions = {chunk_id: i for i, chunk_id in enumerate(self._ids)}
+            self._centroids = None
+            self._columns = None
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._ids, self._texts, self._metadatas, self._positions = [], [], [], {}
+            self._vectors = np.zeros((0, 0), dtype=np.float32)
+            self._centroids = None
+            self._columns = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _build_clusters(self) -> None:
+        """ Clusters the vectors with k-means for IVF search. """
+        n_lists = min(self.n_lists, len(self._ids))
+        rng = np.random.default_rng(0)
+        centroids = self._vectors[rng.choice(len(self._ids), n_lists, replace=False)]
+        for _ in range(self.kmeans_iterations):
+            assignments = np.argmin(self._squared_distances(self._vectors, centroids), axis=1)
+            for cluster in range(n_lists):
+                members = self._vectors[assignments == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+        self._centroids = centroids
+        self._assignments = np.argmin(self._squared_distances(self._vectors, centroids), axis=1)
+        logger.debug(f"Built {n_lists} IVF clusters over {len(self._ids)} vectors")
+
+    @staticmethod
+    def _squared_distances(vectors: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """ Returns the squared L2 distances between every vector and every query. """
+        return (
+            np.sum(vectors ** 2, axis=1)[:, None]
+            - 2 * vectors @ queries.T
+            + np.sum(queries ** 2, axis=1)[None, :]
+        )
+
+    def search(
+        self,
+        embedding: List[float],
+        k: int,
+        metadata_filter: Optional[MetadataFilter] = None
+    ) -> List[Tuple[Document, float]]:
+        query = np.asarray(embedding, dtype=np.float32)[None, :]
+        with self._lock:
+            if not self._ids:
+                return []
+            candidates = np.arange(len(self._ids))
+            if metadata_filter is not None:
+                if self._columns is None:
+                    self._columns = MetadataColumns(self._metadatas)
+                candidates = candidates[metadata_filter.mask(self._columns)]
+                if not len(candidates):
+                    return []
+            elif self.n_lists > 0:
+                if self._centroids is None:
+                    self._build_clusters()
+                nearest = np.argsort(self._squared_distances(self._centroids, query)[:, 0])[:self.n_probe]
+                candidates = candidates[np.isin(self._assignments, nearest)]
+            distances = np.maximum(self._squared_distances(self._vectors[candidates], query)[:, 0], 0)
+            top = np.argsort(distances)[:k]
+            scores = l2_relevance(distances[top])
+            return [
+                (Document(page_content=self._texts[candidates[i]], metadata=self._metadatas[candidates[i]]), float(score))
+                for i, score in zip(top, scores)
+            ]
+
+
+VECTOR_INDEX_ENGINES = {
+    "chroma": ChromaIndex,
+    "numpy": NumpyIndex,
+}
+
+
+def create_vector_index(engine: str, persist_directory: str, params: Optional[dict] = None) -> VectorIndex:
+    """
+    Creates a vector index with the given engine.
+
+    Args:
+        engine (str): The engine name, a key of `VECTOR_INDEX_ENGINES`.
+        persist_directory (str): The directory the index is persisted in.
+        params (Optional[dict]): Engine-specific settings.
+
+    Returns:
+        VectorIndex: The vector index.
+
+    Raises:
+        ValueError: If the engine is unknown.
+    """
+    if engine not in VECTOR_INDEX_ENGINES:
+        raise ValueError(f"Unknown vector index engine '{engine}'")
+    return VECTOR_INDEX_ENGINES[engine](persist_directory, **(params or {}))
@@ -0,0 +1,168 @@
+import os
+import threading
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.lexical_index import BM25Index
+from app.core.logger import get_logger
+from app.core.vector_index import VectorIndex, create_vector_index
+
+logger = get_logger(__name__)
+
+
+class VectorStoreHandle:
+    """
+    Application-scoped handle to the persisted vector index.
+
+    The index is opened once, on first use, and shared by every session.
+    Ingestion calls `refresh` after committing, which swaps in a freshly opened
+    index and bumps `version`; sessions holding the previous index keep working
+    with it until they fetch the handle again.
+
+    The handle also owns the BM25 keyword index stored next to the vector index. It is
+    updated in place by ingestion, so it is loaded once and only reloaded after another
+    process changed the collection.
+
+    `version` is the generation recorded in `index_generation` in the persist directory, which
+    `refresh` increments. With several worker processes, the others see the new generation the
+    next time they use the handle, and reopen both indexes; answer caches keyed by `version`
+    drop their answers then.
+    """
+
+    GENERATION_FILENAME = "index_generation"
+
+    def __init__(
+        self,
+        persist_directory: str,
+        embeddings: Embeddings,
+        engine: str = "chroma",
+        engine_params: Optional[dict] = None
+    ):
+        """
+        Initializes the handle without opening the index.
+
+        Args:
+            persist_directory (str): The directory the index is persisted in.
+            embeddings (Embeddings): The embeddings used for queries.
+            engine (str): The vector index engine.
+            engine_params (Optional[dict]): Engine-specific settings.
+        """
+        self.persist_directory = persist_directory
+        self.embeddings = embeddings
+        self.engine = engine
+        self.engine_params = engine_params or {}
+        self._version = 0
+        self._index: Optional[VectorIndex] = None
+        self._lexical_index: Optional[BM25Index] = None
+        self._lock = threading.Lock()
+        self._generation_path = os.path.join(persist_directory, self.GENERATION_FILENAME)
+        # The generation file last read, by inode, modification time and size
+        self._generation_stat: Optional[tuple] = ()
+
+    @property
+    def version(self) -> int:
+        """ The generation of the collection, incremented whenever an ingestion changed it. """
+        self._sync()
+        return self._version
+
+    def _stat_generation(self) -> Optional[tuple]:
+        """ Returns the inode, modification time and size of the generation file, or None if missing. """
+        try:
+            stat = os.stat(self._generation_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read_generation(self) -> int:
+        """ Returns the generation recorded on disk, 0 if none is. """
+        try:
+            with open(self._generation_path, "r", encoding="utf8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read the index generation from '{self._generation_path}': {e}")
+            return self._version
+
+    def _sync(self) -> None:
+        """ Drops both indexes if another process changed the collection since they were opened. """
+        stat = self._stat_generation()
+        if stat == self._generation_stat:
+            return
+        with self._lock:
+            generation = self._read_generation()
+            self._generation_stat = stat
+            if generation == self._version:
+                return
+            if self._index is not None or self._lexical_index is not None:
+                logger.info(f"Vector index at '{self.persist_directory}' changed to version {generation}; reopening")
+            # Reopened on next use; sessions holding the previous indexes keep working with them
+            self._index, self._lexical_index = None, None
+            self._version = generation
+
+    def _open(self) -> VectorIndex:
+        """ Opens the index, creating the persist directory if needed. """
+        os.makedirs(self.persist_directory, exist_ok=True)
+        logger.info(f"Opening {self.engine} vector index at '{self.persist_directory}'")
+        return create_vector_index(self.engine, self.persist_directory, self.engine_params)
+
+    def get(self) -> VectorIndex:
+        """
+        Returns the shared vector index, opening it on first use.
+
+        Returns:
+            VectorIndex: The vector index.
+        """
+        self._sync()
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._open()
+                index = self._index
+        return index
+
+    def refresh(self) -> VectorIndex:
+        """
+        Reopens the vector index after its collection changed.
+
+        Returns:
+            VectorIndex: The reopened vector index.
+        """
+        with self._lock:
+            self._index = self._open()
+            self._version = max(self._version, self._read_generation()) + 1
+            # Ingestions of a collection hold its writer lock, so no other process bumps it meanwhile
+            tmp_path = f"{self._generation_path}.tmp.{os.getpid()}"
+            with open(tmp_path, "w", encoding="utf8") as f:
+                f.write(str(self._version))
+            os.replace(tmp_path, self._generation_path)
+            self._generation_stat = self._stat_generation()
+            logger.info(f"Refreshed vector index, now at version {self._version}")
+            return self._index
+
+    def close(self) -> None:
+        """ Closes the vector index and drops the keyword index; both are reopened on next use. """
+        with self._lock:
+            index, self._index, self._lexical_index = self._index, None, None
+        if index is not None:
+            index.close()
+            logger.info(f"Closed vector index at '{self.persist_directory}'")
+
+    def get_lexical_index(self) -> BM25Index:
+        """
+        Returns the shared keyword index, loading it on first use.
+
+        Returns:
+            BM25Index: The keyword index.
+        """
+        self._sync()
+        index = self._lexical_index
+        if index is None:
+            with self._lock:
+                if self._lexical_index is None:
+                    os.makedirs(self.persist_directory, exist_ok=True)
+                    self._lexical_index = BM25Index(self.persist_directory)
+                index = self._lexical_index
+        return index
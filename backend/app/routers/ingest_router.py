@@ -1,23 +1,36 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from app.services.ingest_service import IngestService, get_ingest_service
+from typing import List, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
+
+from app.core.logger import get_logger
+from app.core.metrics import ACTIVE_WEBSOCKETS, ERRORS
+from app.schemas.job_schema import IngestJob
+from app.services.ingest_job_service import IngestJobService, get_ingest_job_service
+
+logger = get_logger(__name__)
 
 ingest_router = APIRouter()
 
 @ingest_router.websocket("/ingest")
 async def ingest_documents(
     websocket: WebSocket,
-    ingest_service: IngestService = Depends(get_ingest_service)
+    job_id: Optional[str] = None,
+    collection: Optional[str] = None,
+    ingest_jobs: IngestJobService = Depends(get_ingest_job_service)
 ):
     """
     WebSocket endpoint for ingesting documents.
 
-    This endpoint handles WebSocket connections for ingesting documents from the source directory.
-    It uses the IngestService to load documents from the directory, process them, and provide
-    real-time updates on the progress via WebSocket messages.
+    This endpoint queues a background ingestion job for a collection's source directory, or
+    joins the job that is already queued or running for it, and streams the job's progress via
+    WebSocket messages. Passing `job_id` follows an existing job instead. The job keeps running
+    if the connection is closed.
 
     Args:
         websocket (WebSocket): The WebSocket connection instance.
-        ingest_service (IngestService): The service responsible for document ingestion, 
+        job_id (Optional[str]): The ID of an existing job to follow.
+        collection (Optional[str]): The collection to ingest, the default collection if omitted.
+        ingest_jobs (IngestJobService): The service running ingestion jobs,
             provided by dependency injection.
 
     Raises:
@@ -25,13 +38,67 @@ async def ingest_documents(
     """
     await websocket.accept()
     try:
-        source_directory = "source_documents/"
-        documents = await ingest_service.load_documents_from_directory(source_directory, websocket)
-        await ingest_service.process_documents(documents, websocket)
-        await websocket.send_text("Successfully ingested data!")
+        with ACTIVE_WEBSOCKETS.track(endpoint="ingest"):
+            if job_id is None:
+                job = await ingest_jobs.submit(collection)
+                job_id = job.job_id
+                await websocket.send_text(f"Ingesting: job {job_id} is {job.status.value}")
+            async for message in ingest_jobs.subscribe(job_id):
+                await websocket.send_text(message)
     except WebSocketDisconnect:
-        print("WebSocket disconnected")
+        logger.info("WebSocket disconnected")
     except Exception as e:
+        ERRORS.inc(operation="ingest")
         await websocket.send_text(f"Error: {e}")
     finally:
         await websocket.close()
+
+@ingest_router.post("/ingest/jobs", response_model=IngestJob, status_code=status.HTTP_202_ACCEPTED, tags=["Ingestion"])
+async def create_ingest_job(
+    collection: Optional[str] = None,
+    ingest_jobs: IngestJobService = Depends(get_ingest_job_service)
+) -> IngestJob:
+    """
+    Queue an ingestion of a collection's source directory.
+
+    Returns the job that is already queued or running for the collection, if any.
+
+    Parameters:
+    - collection: The collection to ingest, the default collection if omitted.
+
+    Returns:
+    - IngestJob: The queued or running job.
+    """
+    try:
+        return await ingest_jobs.submit(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+@ingest_router.get("/ingest/jobs", response_model=List[IngestJob], tags=["Ingestion"])
+async def list_ingest_jobs(
+    collection: Optional[str] = None,
+    ingest_jobs: IngestJobService = Depends(get_ingest_job_service)
+) -> List[IngestJob]:
+    """
+    List the recorded ingestion jobs, oldest first.
+
+    Parameters:
+    - collection: Only list the jobs of this collection.
+
+    Returns:
+    - List[IngestJob]: The jobs with their status and latest progress.
+    """
+    return await ingest_jobs.list_jobs(collection)
+
+@ingest_router.get("/ingest/jobs/{job_id}", response_model=IngestJob, tags=["Ingestion"])
+async def get_ingest_job(job_id: str, ingest_jobs: IngestJobService = Depends(get_ingest_job_service)) -> IngestJob:
+    """
+    Get the status and latest progress of an ingestion job.
+
+    Returns:
+    - IngestJob: The job.
+    """
+    job = await ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown ingest job '{job_id}'")
+    return job
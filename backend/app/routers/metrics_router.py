@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Response
+
+from app.core.metrics import REGISTRY
+
+metrics_router = APIRouter()
+
+@metrics_router.get("/metrics", tags=["Status"])
+async def get_metrics() -> Response:
+    """
+    Get application metrics.
+
+    This endpoint exposes stage latency histograms, cache and error counters and connection
+    gauges in the Prometheus text exposition format, for scraping by Prometheus.
+
+    Returns:
+    - Response: The metrics as `text/plain`.
+    """
+    return Response(content=REGISTRY.render(), media_type=REGISTRY.CONTENT_TYPE)
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
 from app.services.retrieve_service import RetrieverService, get_retriever_service
+from app.core.answer_stream import negotiate_protocol
 from app.core.logger import get_logger
+from app.core.metrics import ACTIVE_WEBSOCKETS, ERRORS
 
 logger = get_logger(__name__)
 
@@ -18,6 +20,16 @@ async def retrieve_query(
     and return results to the client. It leverages the RetrieverService to create a retriever and a prompt template,
     then handles the retrieval process, sending results back to the client in real-time.
 
+    Clients offering the `rag.v1` subprotocol receive versioned JSON frames with coalesced tokens,
+    sources and timings (see `FramedAnswerStream`); other clients receive the plain text protocol.
+    The `collection` query parameter selects the collection to query, the default collection if
+    omitted; connections to unknown collections are refused. Queries sent as JSON may filter the
+    searched chunks by their metadata (see `RetrieverService.parse_request`). The `priority` query
+    parameter sets the priority class the session's chain runs are admitted with (see
+    `LLMScheduler`), the first of `LLM_PRIORITY_CLASSES` by default, e.g. `batch` for bulk
+    clients; when the server is too busy, a query is answered with an error carrying a
+    `retry_after` hint.
+
     Args:
         websocket (WebSocket): The WebSocket connection instance.
         retriever_service (RetrieverService): The service for handling retrieval operations,
@@ -27,18 +39,22 @@ async def retrieve_query(
         WebSocketDisconnect: Raised when the WebSocket connection is unexpectedly closed.
         Exception: Catches all other exceptions, logs them, and sends an error message to the client.
     """
-    await websocket.accept()
-    logger.info("WebSocket connection accepted")
+    protocol = negotiate_protocol(websocket)
+    await websocket.accept(subprotocol=protocol)
+    logger.info(f"WebSocket connection accepted (protocol: {protocol or 'text'})")
+    answer_stream = retriever_service.create_answer_stream(websocket)
 
     try:
-        retriever = retriever_service.create_chroma_retriever()
-        prompt_template = retriever_service.create_prompt_template()
-        await retriever_service.handle_retrieval(websocket, retriever, prompt_template)
+        with ACTIVE_WEBSOCKETS.track(endpoint="retrieve"):
+            retriever = retriever_service.create_retriever()
+            prompt_template = retriever_service.create_prompt_template()
+            await retriever_service.handle_retrieval(websocket, retriever, prompt_template, answer_stream)
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
     except Exception as e:
         logger.error(f"Exception: {e}")
-        await websocket.send_text(f"Error: {e}")
+        ERRORS.inc(operation="retrieve")
+        await answer_stream.error(str(e))
     finally:
         try:
             await websocket.close()
@@ -0,0 +1,28 @@
+from enum import Enum
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+class JobStatus(str, Enum):
+    """ Lifecycle states of a background job. """
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class IngestJob(BaseModel):
+    """ State and progress of a background ingestion job. """
+    job_id: str
+    status: JobStatus
+    collection: str = "default"
+    source_directory: str
+    # Files to check, relative to the source directory; None scans the whole directory
+    paths: Optional[List[str]] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    attempts: int = 0
+    # The worker process running the job, see `IngestJobService`
+    owner: Optional[str] = None
+    progress: Optional[str] = None
+    error: Optional[str] = None
@@ -0,0 +1,451 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from starlette.requests import HTTPConnection
+
+from app.core.collection_registry import CollectionRegistry
+from app.core.logger import get_logger
+from app.core.metrics import ERRORS
+from app.schemas.job_schema import IngestJob, JobStatus
+
+logger = get_logger(__name__)
+
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+class IngestJobService:
+    """
+    Runs ingestions as background jobs on a job queue shared by the processes of the app.
+
+    Jobs run one at a time per process in a worker task, independent of the connection that
+    submitted them, and hold a file lock on the collection's persist directory while writing,
+    so ingestions of the same collection wait for each other. Submitting a collection that
+    already has a queued or running job returns that job instead of starting a second rebuild.
+    A job leases its collection, so it is not evicted while being written.
+
+    Jobs of all collections are recorded in `ingest_jobs.json` in the root persist directory,
+    which is the queue itself: every change re-reads and rewrites it under an exclusive lock
+    (`ingest_jobs.lock`), so with several worker processes every process sees all jobs and
+    none overwrites another's records. A queued job is claimed by exactly one process, which
+    records itself as the job's `owner`. Each process holds a lock file in `ingest_workers/`
+    while it runs, so a job whose owner's lock is free was interrupted by a shutdown or crash;
+    the next process to look claims it again and, since the ingest manifest is checkpointed as
+    files are committed, resumes after the last committed file. Processes look for jobs when
+    one is submitted to them and every `POLL_SECONDS`.
+    """
+
+    JOBS_FILENAME = "ingest_jobs.json"
+    JOBS_LOCK_FILENAME = "ingest_jobs.lock"
+    WORKERS_DIRNAME = "ingest_workers"
+    LOCK_FILENAME = "ingest.lock"
+    MAX_FINISHED_JOBS = 50
+    MAX_EVENTS = 1000
+    POLL_SECONDS = 2.0
+    # Progress of running jobs is written to the job records at most this often
+    PROGRESS_SAVE_SECONDS = 1.0
+
+    def __init__(self, collections: CollectionRegistry):
+        """
+        Initializes the IngestJobService without claiming any job.
+
+        Args:
+            collections (CollectionRegistry): The collections to ingest into.
+        """
+        self.collections = collections
+        self.path = os.path.join(collections.root_directory, self.JOBS_FILENAME)
+        self.worker_id: Optional[str] = None
+        # Jobs claimed by this process; their in-memory state is the latest
+        self._owned: Dict[str, IngestJob] = {}
+        self._events: Dict[str, Deque[str]] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._worker_lock = None
+        self._progress_saved = 0.0
+
+    async def jobs(self) -> Dict[str, IngestJob]:
+        """
+        Reads the recorded jobs of all processes in a thread, so the event loop does not wait on
+        the disk.
+
+        Returns:
+            Dict[str, IngestJob]: The jobs, oldest first, with the latest state of the jobs this
+                process runs, which is only written at checkpoints.
+        """
+        jobs = await asyncio.to_thread(self._read)
+        # Replaced here, since the worker updates its jobs on the event loop
+        jobs.update({job_id: job for job_id, job in self._owned.items() if job_id in jobs})
+        return jobs
+
+    def _read(self) -> Dict[str, IngestJob]:
+        """ Reads the job records. """
+        jobs: Dict[str, IngestJob] = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf8") as f:
+                    records = json.load(f)
+                for record in records:
+                    job = IngestJob.model_validate(record)
+                    jobs[job.job_id] = job
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to read ingest jobs from '{self.path}', starting empty: {e}")
+        return jobs
+
+    def _write(self, jobs: Dict[str, IngestJob]) -> None:
+        """ Atomically writes the job records, keeping the latest finished jobs only. """
+        finished = [job_id for job_id, job in jobs.items() if job.status not in ACTIVE_STATUSES]
+        for job_id in finished[:-self.MAX_FINISHED_JOBS]:
+            del jobs[job_id]
+            self._events.pop(job_id, None)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump([job.model_dump(mode="json") for job in jobs.values()], f)
+        os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[Dict[str, IngestJob]]:
+        """
+        Locks the job records against other processes for a read-modify-write.
+
+        Yields:
+            Dict[str, IngestJob]: The recorded jobs, written back if they changed when the block
+                exits without error.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(os.path.join(os.path.dirname(self.path), self.JOBS_LOCK_FILENAME), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            jobs = self._read()
+            before = [job.model_dump() for job in jobs.values()]
+            yield jobs
+            if [job.model_dump() for job in jobs.values()] != before:
+                self._write(jobs)
+
+    def _store(self, job: IngestJob) -> None:
+        """ Records the state of a job this process runs. """
+        with self._transaction() as jobs:
+            jobs[job.job_id] = job
+
+    def _workers_directory(self) -> str:
+        return os.path.join(os.path.dirname(self.path), self.WORKERS_DIRNAME)
+
+    def _register_worker(self) -> None:
+        """ Takes this process's lock file, which tells other processes it is alive. """
+        self.worker_id = uuid.uuid4().hex
+        if fcntl is None:
+            return
+        os.makedirs(self._workers_directory(), exist_ok=True)
+        self._worker_lock = open(os.path.join(self._workers_directory(), f"{self.worker_id}.lock"), "a")
+        fcntl.flock(self._worker_lock, fcntl.LOCK_EX)
+
+    def _unregister_worker(self) -> None:
+        """ Releases this process's lock file, so other processes resume its running job. """
+        if self._worker_lock is not None:
+            os.remove(self._worker_lock.name)
+            self._worker_lock.close()
+            self._worker_lock = None
+
+    def _is_alive(self, worker_id: Optional[str]) -> bool:
+        """
+        Returns whether the process that claimed a job still runs.
+
+        Without file locks, e.g. on Windows, a single process is assumed, so jobs of other
+        owners are from an earlier run.
+        """
+        if worker_id is None or fcntl is None:
+            return worker_id is not None and worker_id == self.worker_id
+        if worker_id == self.worker_id:
+            return True
+        path = os.path.join(self._workers_directory(), f"{worker_id}.lock")
+        try:
+            lock_file = open(path, "r")
+        except FileNotFoundError:
+            return False
+        with lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            os.remove(path)
+            return False
+
+    def _claim(self) -> Optional[IngestJob]:
+        """ Claims the oldest queued job, or a running job whose process is gone, and marks it running. """
+        with self._transaction() as jobs:
+            for job in jobs.values():
+                if job.status == JobStatus.RUNNING and not self._is_alive(job.owner):
+                    logger.info(f"Resuming interrupted ingest job {job.job_id}")
+                    job.progress = "Ingesting: resuming after restart"
+                elif job.status != JobStatus.QUEUED:
+                    continue
+                job.status = JobStatus.RUNNING
+                job.owner = self.worker_id
+                job.started_at = time.time()
+                job.attempts += 1
+                job.error = None
+                self._owned[job.job_id] = job
+                return job
+        return None
+
+    async def start(self) -> None:
+        """ Starts the worker, which also resumes jobs interrupted before. """
+        if self._worker is not None:
+            return
+        await asyncio.to_thread(self._register_worker)
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._work())
+
+    async def stop(self) -> None:
+        """ Stops the worker; a running job is resumed by another process or on the next start. """
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        self._owned.clear()
+        self._unregister_worker()
+
+    async def submit(self, collection: Optional[str] = None, paths: Optional[List[str]] = None) -> IngestJob:
+        """
+        Queues an ingestion of a collection's source directory.
+
+        Without `paths` the whole directory is scanned, and a queued job or a running full scan
+        of the collection is returned instead of a new one. With `paths`, e.g. from a file
+        watcher, only those files are checked; they are added to the collection's queued job if
+        there is one, and otherwise a new job is queued, since a running job may have checked
+        them already.
+
+        Args:
+            collection (Optional[str]): The collection name, or None for the default collection.
+            paths (Optional[List[str]]): The changed files, relative to the source directory with `/` separators.
+
+        Returns:
+            IngestJob: The new job, or the queued or running job the ingestion was added to.
+
+        Raises:
+            ValueError: If the name is invalid, or a named collection has no source directory.
+        """
+        await self.start()
+        collection = self.collections.resolve(collection)
+        source_directory = os.path.abspath(self.collections.source_directory(collection))
+        if collection != self.collections.default_name and not os.path.isdir(source_directory):
+            raise ValueError(f"Collection '{collection}' has no source directory at '{source_directory}'")
+        job = await asyncio.to_thread(self._submit, collection, source_directory, paths)
+        self._wakeup.set()
+        return job
+
+    def _submit(self, collection: str, source_directory: str, paths: Optional[List[str]]) -> IngestJob:
+        """ Records a new job, or adds the ingestion to the collection's active job. """
+        with self._transaction() as jobs:
+            for job in jobs.values():
+                if job.collection != collection:
+                    continue
+                if job.status == JobStatus.QUEUED:
+                    job.paths = None if paths is None or job.paths is None else sorted({*job.paths, *paths})
+                    logger.info(f"Ingest job {job.job_id} for collection '{collection}' is already queued")
+                    return job
+                # A running job checking some files only would miss changes elsewhere
+                if job.status == JobStatus.RUNNING and paths is None and job.paths is None:
+                    logger.info(f"Ingest job {job.job_id} for collection '{collection}' is already running")
+                    return job
+            job = IngestJob(
+                job_id=uuid.uuid4().hex,
+                status=JobStatus.QUEUED,
+                collection=collection,
+                source_directory=source_directory,
+                paths=paths,
+                created_at=time.time()
+            )
+            jobs[job.job_id] = job
+        logger.info(f"Queued ingest job {job.job_id} for collection '{collection}' from '{source_directory}'")
+        return job
+
+    async def get(self, job_id: str) -> Optional[IngestJob]:
+        """ Returns a job by ID, or None if it is unknown. """
+        return (await self.jobs()).get(job_id)
+
+    async def list_jobs(self, collection: Optional[str] = None) -> List[IngestJob]:
+        """ Returns the recorded jobs, of one collection if given, oldest first. """
+        return [job for job in (await self.jobs()).values() if collection is None or job.collection == collection]
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[str]:
+        """
+        Streams the progress messages of a job until it finishes.
+
+        Messages published before subscribing are replayed first. The progress of a job run
+        by another process is followed through its recorded `progress`, checked every
+        `POLL_SECONDS`, so intermediate messages may be skipped.
+
+        Args:
+            job_id (str): The job to follow.
+
+        Yields:
+            str: Progress messages, ending with the job's completion or error message.
+
+        Raises:
+            ValueError: If the job is unknown.
+        """
+        job = await self.get(job_id)
+        if job is None:
+            raise ValueError(f"Unknown ingest job '{job_id}'")
+        events = list(self._events.get(job_id, ()))
+        if job.status not in ACTIVE_STATUSES:
+            for message in events or [self._final_message(job)]:
+                yield message
+            return
+        # Subscribe before replaying, so no message published meanwhile is missed
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        try:
+            for message in events:
+                yield message
+            progress = events[-1] if events else None
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=self.POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    job = await self.get(job_id)
+                    if job is None or job_id in self._owned:
+                        continue
+                    if job.status not in ACTIVE_STATUSES:
+                        yield self._final_message(job)
+                        return
+                    message = job.progress
+                    if message is None or message == progress:
+                        continue
+                if message is None:
+                    return
+                progress = message
+                yield message
+        finally:
+            subscribers = self._subscribers.get(job_id, [])
+            if queue in subscribers:
+                subscribers.remove(queue)
+
+    @staticmethod
+    def _final_message(job: IngestJob) -> str:
+        """ Returns the message that ends a finished job's progress stream. """
+        if job.status == JobStatus.FAILED:
+            return f"Error: {job.error}"
+        return "Successfully ingested data!"
+
+    def _publish(self, job: IngestJob, message: str) -> None:
+        """ Records a progress message and forwards it to the job's subscribers. """
+        job.progress = message
+        self._events.setdefault(job.job_id, deque(maxlen=self.MAX_EVENTS)).append(message)
+        for queue in self._subscribers.get(job.job_id, []):
+            queue.put_nowait(message)
+
+    def _close_subscribers(self, job: IngestJob) -> None:
+        """ Ends the progress streams of a finished job. """
+        for queue in self._subscribers.pop(job.job_id, []):
+            queue.put_nowait(None)
+
+    async def _work(self) -> None:
+        """ Claims and runs jobs one at a time, waiting for a submission or the next poll in between. """
+        while True:
+            try:
+                job = await asyncio.to_thread(self._claim)
+            except OSError as e:
+                logger.error(f"Failed to claim an ingest job: {e}")
+                job = None
+            if job is not None:
+                await self._run(job)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _run(self, job: IngestJob) -> None:
+        """
+        Runs a single claimed ingestion job and records its outcome.
+
+        Args:
+            job (IngestJob): The job to run.
+        """
+        async def report(message: str) -> None:
+            self._publish(job, message)
+            if time.monotonic() - self._progress_saved >= self.PROGRESS_SAVE_SECONDS:
+                self._progress_saved = time.monotonic()
+                await asyncio.to_thread(self._store, job)
+
+        logger.info(f"Running ingest job {job.job_id} (attempt {job.attempts})")
+        try:
+            with self.collections.lease(job.collection) as collection:
+                async with self._writer_lock(job, collection.vector_store.persist_directory):
+                    # Imported on the first job, so processes that never ingest skip the loaders
+                    from app.services.ingest_service import IngestService
+
+                    ingest_service = IngestService(collection.vector_store)
+                    documents = ingest_service.load_documents_from_directory(job.source_directory, report, job.paths)
+                    await ingest_service.process_documents(documents, report)
+        except asyncio.CancelledError:
+            # The process is shutting down; the job stays running on disk and is resumed once
+            # another process, or this one after a restart, sees that its owner is gone
+            self._close_subscribers(job)
+            raise
+        except Exception as e:
+            logger.error(f"Ingest job {job.job_id} failed: {e}")
+            ERRORS.inc(operation="ingest")
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        else:
+            logger.info(f"Ingest job {job.job_id} succeeded")
+            job.status = JobStatus.SUCCEEDED
+        job.finished_at = time.time()
+        self._publish(job, self._final_message(job))
+        await asyncio.to_thread(self._store, job)
+        self._owned.pop(job.job_id, None)
+        self._close_subscribers(job)
+
+    @asynccontextmanager
+    async def _writer_lock(self, job: IngestJob, persist_directory: str) -> AsyncIterator[None]:
+        """
+        Holds the exclusive lock on a persist directory, so only one process writes to it at a time.
+
+        Args:
+            job (IngestJob): The job acquiring the lock, notified while waiting.
+            persist_directory (str): The persist directory of the job's collection.
+        """
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(persist_directory, exist_ok=True)
+        lock_file = open(os.path.join(persist_directory, self.LOCK_FILENAME), "a")
+        try:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._publish(job, "Ingesting: waiting for another ingestion to finish")
+                await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+            yield
+        finally:
+            lock_file.close()
+
+def get_ingest_job_service(connection: HTTPConnection) -> IngestJobService:
+    """
+    Factory function to get the application's IngestJobService.
+
+    Args:
+        connection (HTTPConnection): The request or WebSocket connection, used to reach the app state.
+
+    Returns:
+        IngestJobService: The shared IngestJobService.
+    """
+    return connection.app.state.ingest_jobs
@@ -1,47 +1,144 @@
+import asyncio
+import itertools
+import multiprocessing
 import os
-import glob
-from typing import List
-from fastapi import WebSocket
-from langchain_community.document_loaders import (
-    CSVLoader, EverNoteLoader, PDFMinerLoader, TextLoader,
-    UnstructuredEPubLoader, UnstructuredHTMLLoader, UnstructuredMarkdownLoader,
-    UnstructuredODTLoader, UnstructuredPowerPointLoader, UnstructuredWordDocumentLoader,
-)
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 from langchain.schema import Document
-from langchain_community.vectorstores.chroma import Chroma
 
+from app.core.chunking import get_text_splitter
+from app.core.document_loaders import DOC_LOADERS_MAPPING, LOADER_VERSION, PageRange, count_pdf_pages, iter_document
 from app.core.environment import get_environment
 from app.config import config as app_config
+from app.core.embedding_executor import EmbeddingExecutor
 from app.core.logger import get_logger
+from app.core.vector_index import VectorIndex
+from app.core.vector_store import VectorStoreHandle
+from app.core.file_index import FileIndex, scan_directory, stat_files
+from app.core.manifest import FileChanges, IngestManifest, make_chunk_ids
+from app.core.metadata import MetadataExtractor
+from app.core.metrics import INGESTED_CHUNKS, STAGE_SECONDS, span
 
 logger = get_logger(__name__)
 
-DOC_LOADERS_MAPPING = {
-    ".csv": (CSVLoader, {}),
-    ".doc": (UnstructuredWordDocumentLoader, {}),
-    ".docx": (UnstructuredWordDocumentLoader, {}),
-    ".enex": (EverNoteLoader, {}),
-    ".epub": (UnstructuredEPubLoader, {}),
-    ".html": (UnstructuredHTMLLoader, {}),
-    ".md": (UnstructuredMarkdownLoader, {}),
-    ".odt": (UnstructuredODTLoader, {}),
-    ".pdf": (PDFMinerLoader, {}),
-    ".ppt": (UnstructuredPowerPointLoader, {}),
-    ".pptx": (UnstructuredPowerPointLoader, {}),
-    ".txt": (TextLoader, {"encoding": "utf8"}),
-}
+# Receives progress messages of an ingestion
+ProgressReporter = Callable[[str], Awaitable[None]]
+
+_loader_pool: Optional[ProcessPoolExecutor] = None
+
+@dataclass
+class FileCheckpoint:
+    """ Marks that all new chunks of a file have been queued for storage. """
+    source: str
+    file_hash: str
+    chunking: str
+    chunk_ids: List[str]
+    stale_ids: List[str]
+    # All chunks of the file, for the keyword index
+    texts: List[str]
+    metadatas: List[dict]
+
+def load_document(file_path: str) -> List[Document]:
+    """
+    Loads all elements of a single document based on its file extension using the appropriate loader.
+
+    Args:
+        file_path (str): The path to the document file.
+
+    Returns:
+        List[Document]: The pages, rows or other elements of the document, see `iter_document`.
+
+    Raises:
+        ValueError: If the file extension is unsupported.
+    """
+    return list(iter_document(file_path))
+
+def load_and_split_document(
+    file_path: str,
+    strategy: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    page_range: Optional[PageRange] = None,
+    metadata_extractor: Optional[MetadataExtractor] = None
+) -> Tuple[List[Document], Dict[str, float]]:
+    """
+    Loads a single document, or a page range of a PDF, and splits it into chunks.
+
+    This runs in the loader worker processes, so splitting scales with the loaders; it is a
+    module-level function so it can be shipped to them. Elements are split as they are
+    loaded, so only one page or row is held as text at a time, and chunks keep the element's
+    `page` or `row` metadata, plus the fields found by the metadata extractor. The stage
+    durations are returned, since metrics recorded in a worker would not reach the app.
+
+    Args:
+        file_path (str): The path to the document file.
+        strategy (str): The chunking strategy, see `CHUNKING_STRATEGIES`.
+        chunk_size (int): The maximum chunk size, in tokens.
+        chunk_overlap (int): The overlap between consecutive chunks, in tokens.
+        page_range (Optional[PageRange]): The pages to load, for PDFs split across workers.
+        metadata_extractor (Optional[MetadataExtractor]): Adds filterable metadata to every chunk.
+
+    Returns:
+        Tuple[List[Document], Dict[str, float]]: The chunks of the document, and the seconds
+            spent loading and splitting it.
+
+    Raises:
+        ValueError: If the file extension or chunking strategy is unsupported.
+    """
+    splitter = get_text_splitter(strategy, chunk_size, chunk_overlap)
+    chunks: List[Document] = []
+    durations = {"load": 0.0, "split": 0.0}
+    elements = iter_document(file_path, page_range)
+    while True:
+        started = time.perf_counter()
+        element = next(elements, None)
+        loaded = time.perf_counter()
+        durations["load"] += loaded - started
+        if element is None:
+            break
+        element_chunks = splitter.split_documents([element])
+        if metadata_extractor is not None:
+            metadata_extractor.apply(element_chunks)
+        chunks.extend(element_chunks)
+        durations["split"] += time.perf_counter() - loaded
+    return chunks, durations
+
+def get_loader_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the process pool used to parse documents, creating it on first use.
+
+    The pool is shared by all ingestions in the process, so worker processes
+    are only spawned once.
+
+    Args:
+        max_workers (int): The number of loader worker processes.
+
+    Returns:
+        ProcessPoolExecutor: The loader process pool.
+    """
+    global _loader_pool
+    if _loader_pool is None:
+        logger.info(f"Starting document loader pool with {max_workers} workers")
+        _loader_pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _loader_pool
 
 class IngestService:
     """
     A service class for ingesting and processing documents using various loaders and embeddings.
     """
 
-    def __init__(self):
+    def __init__(self, vector_store: VectorStoreHandle):
         """
         Initializes the IngestService with environment configurations and embeddings.
 
+        Args:
+            vector_store (VectorStoreHandle): The shared vector store to ingest into.
+
         Raises:
             KeyError: If the environment is not found in the application configuration.
             RuntimeError: If embeddings cannot be retrieved.
@@ -53,90 +150,257 @@ class IngestService:
             raise KeyError(f"Environment {environment} not found in app_config")
 
         self.ENVIRONMENT = app_config[environment]
-        self.EMBEDDINGS = self.ENVIRONMENT.EMBEDDINGS.embeddings
+        self.vector_store = vector_store
+        self.EMBEDDINGS = vector_store.embeddings
         
         if self.EMBEDDINGS is None:
             raise RuntimeError("Failed to retrieve embeddings model!")
 
+        self.embedding_executor = EmbeddingExecutor(
+            self.EMBEDDINGS,
+            batch_size=self.ENVIRONMENT.EMBEDDING_BATCH_SIZE,
+            max_concurrency=self.ENVIRONMENT.EMBEDDING_MAX_CONCURRENCY,
+            max_retries=self.ENVIRONMENT.EMBEDDING_MAX_RETRIES
+        )
+        self.persist_directory = vector_store.persist_directory
+        self.source_directory = None
+        self.manifest = IngestManifest(self.persist_directory)
+        self.file_index = FileIndex(self.persist_directory)
+        self.metadata_extractor = MetadataExtractor(
+            self.ENVIRONMENT.METADATA_FIELDS,
+            self.ENVIRONMENT.METADATA_PATTERNS
+        )
+        self.file_changes = FileChanges()
+        self.lexical_index = vector_store.get_lexical_index()
+        self.collection_changed = False
+
         logger.debug(f"Initialized IngestService with environment: {self.ENVIRONMENT}")
 
-    def load_single_document(self, file_path: str) -> Document:
+    def load_single_document(self, file_path: str) -> List[Document]:
         """
-        Loads a single document based on its file extension using the appropriate loader.
+        Loads all elements of a single document based on its file extension using the appropriate loader.
 
         Args:
             file_path (str): The path to the document file.
 
         Returns:
-            Document: The loaded document.
+            List[Document]: The pages, rows or other elements of the document.
 
         Raises:
             ValueError: If the file extension is unsupported.
         """
-        ext = "." + file_path.rsplit(".", 1)[-1]
-        logger.debug(f"Loading file '{file_path}' with extension '{ext}'")
-        if ext in DOC_LOADERS_MAPPING:
-            loader_class, loader_args = DOC_LOADERS_MAPPING[ext]
-            loader = loader_class(file_path, **loader_args)
-            document = loader.load()[0]
-            logger.debug(f"Loaded document: {document}")
-            return document
-        logger.error(f"Unsupported file extension '{ext}'")
-        raise ValueError(f"Unsupported file extension '{ext}'")
+        return load_document(file_path)
 
-    async def load_documents_from_directory(self, source_dir: str, websocket: WebSocket) -> List[Document]:
+    def chunking_settings(self, file_path: str) -> Tuple[str, int, int]:
         """
-        Loads all documents from a specified directory using various loaders based on file extensions.
+        Returns the chunking strategy, chunk size and chunk overlap for a file.
 
         Args:
-            source_dir (str): The directory to load documents from.
-            websocket (WebSocket): WebSocket connection for sending progress updates.
+            file_path (str): The path to the document file.
 
         Returns:
-            List[Document]: A list of loaded documents.
+            Tuple[str, int, int]: The strategy name and the size and overlap in tokens.
+        """
+        ext = os.path.splitext(file_path)[1].lower()
+        strategy = self.ENVIRONMENT.CHUNKING_STRATEGIES.get(ext, "recursive")
+        return strategy, self.ENVIRONMENT.CHUNK_SIZE, self.ENVIRONMENT.CHUNK_OVERLAP
+
+    def _chunking_fingerprint(self, source: str) -> str:
+        """
+        Returns the chunking settings, loader version and metadata extractors of a manifest source
+        as recorded in the manifest.
+        """
+        settings = (*self.chunking_settings(source), LOADER_VERSION, self.metadata_extractor.fingerprint)
+        return ":".join(map(str, settings))
+
+    async def load_documents_from_directory(
+        self,
+        source_dir: str,
+        report: ProgressReporter,
+        paths: Optional[List[str]] = None
+    ) -> AsyncIterator[Tuple[str, List[Document]]]:
+        """
+        Loads and splits the new and modified documents from a specified directory.
+
+        The directory is scanned in a single pass, or only `paths` are checked when the caller
+        knows which files changed, e.g. a file watcher. Files whose size and modification time
+        changed since the last scan are hashed, see `FileIndex`, and compared against the ingest
+        manifest; only files whose content or chunking settings changed since the last ingest
+        are loaded. The detected changes are kept on the service for `process_documents`. Files
+        are parsed and split in parallel in the loader process pool and yielded in completion
+        order, keeping the event loop free. At most two files per loader worker are in flight
+        at once, so memory does not grow with the corpus.
+
+        Args:
+            source_dir (str): The directory to load documents from.
+            report (ProgressReporter): Called with progress updates.
+            paths (Optional[List[str]]): The files to check, relative to `source_dir` with `/`
+                separators, or None to scan the whole directory. Missing files count as removed.
+
+        Yields:
+            Tuple[str, List[Document]]: The path of every loaded file and its chunks.
         """
         logger.info(f"Loading documents from directory '{source_dir}'")
         absolute_source_dir = os.path.abspath(source_dir)
         logger.debug(f"Absolute source directory: {absolute_source_dir}")
+        self.source_directory = absolute_source_dir
 
-        all_files = []
-        for ext in DOC_LOADERS_MAPPING:
-            files = glob.glob(os.path.join(absolute_source_dir, f"**/*{ext}"), recursive=True)
-            logger.debug(f"Found {len(files)} files with extension '{ext}'")
-            all_files.extend(files)
+        file_hashes = await asyncio.to_thread(self._hash_files, paths)
+        chunking = {source: self._chunking_fingerprint(source) for source in file_hashes}
+        self.file_changes = self.manifest.diff(file_hashes, chunking, paths)
+        if self.file_changes.unchanged and self.lexical_index.count() == 0:
+            # Collections ingested before the keyword index existed: re-read every file to build it,
+            # chunks that are already stored are not embedded again
+            logger.info("Keyword index is empty; re-reading unchanged files to build it")
+            self.file_changes.modified.update({source: file_hashes[source] for source in self.file_changes.unchanged})
+            self.file_changes.unchanged = []
+        logger.info(
+            f"Found {len(self.file_changes.added)} new, {len(self.file_changes.modified)} modified, "
+            f"{len(self.file_changes.removed)} removed and {len(self.file_changes.unchanged)} unchanged files"
+        )
 
-        documents = []
-        total_files = len(all_files)
+        changed_files = iter([self._absolute_path(source) for source in self.file_changes.changed])
+        total_files = len(self.file_changes.changed)
         logger.info(f"Total files to load: {total_files}")
-        for i, file_path in enumerate(all_files):
-            try:
-                document = self.load_single_document(file_path)
-                documents.append(document)
-                logger.info(f"Loaded document {i+1}/{total_files}: '{file_path}'")
-            except Exception as e:
-                logger.error(f"Failed to load document '{file_path}': {e}")
-            progress = (i + 1) / total_files * 100
-            await websocket.send_text(f"Ingesting: {progress:.2f}% complete")
+        if total_files == 0:
+            await report("Ingesting: no new or modified files")
+
+        max_workers = self.ENVIRONMENT.LOADER_MAX_WORKERS
+        pool = get_loader_pool(max_workers)
+        pending = set()
+        completed = 0
+        try:
+            while True:
+                for file_path in itertools.islice(changed_files, 2 * max_workers - len(pending)):
+                    pending.add(asyncio.create_task(self._load_in_pool(pool, file_path)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    file_path, chunks, error = task.result()
+                    completed += 1
+                    if error is None:
+                        logger.info(f"Loaded document {completed}/{total_files}: '{file_path}'")
+                    else:
+                        logger.error(f"Failed to load document '{file_path}': {error}")
+                    progress = completed / total_files * 100
+                    await report(f"Ingesting: {progress:.2f}% complete")
+                    if error is None:
+                        yield file_path, chunks
+        finally:
+            for task in pending:
+                task.cancel()
 
         logger.info("Completed loading all documents")
-        return documents
 
-    async def process_documents(self, documents: List[Document], websocket: WebSocket) -> None:
+    async def _load_in_pool(
+        self,
+        pool: ProcessPoolExecutor,
+        file_path: str
+    ) -> Tuple[str, Optional[List[Document]], Optional[Exception]]:
         """
-        Processes a list of documents by splitting them into chunks and storing them in a vector database.
+        Loads and splits a document in the loader pool without raising, recording the stage durations.
+
+        PDFs with more than `PDF_PAGES_PER_TASK` pages are loaded in page ranges on several
+        workers at once; their chunks are joined in page order.
 
         Args:
-            documents (List[Document]): The documents to process.
-            websocket (WebSocket): WebSocket connection for sending progress updates.
+            pool (ProcessPoolExecutor): The loader process pool.
+            file_path (str): The path to the document file.
+
+        Returns:
+            Tuple[str, Optional[List[Document]], Optional[Exception]]: The file path, and either
+                the document's chunks or the error raised while loading it.
         """
-        logger.info("Processing documents")
-        chunk_size = 500
-        chunk_overlap = 50
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        texts = text_splitter.split_documents(documents)
-        logger.debug(f"Split documents into {len(texts)} chunks")
+        loop = asyncio.get_running_loop()
+        settings = self.chunking_settings(file_path)
+        try:
+            page_ranges = [None]
+            if file_path.lower().endswith(".pdf"):
+                pages = await loop.run_in_executor(pool, count_pdf_pages, file_path)
+                step = max(1, self.ENVIRONMENT.PDF_PAGES_PER_TASK)
+                if pages > step:
+                    logger.debug(f"Loading {pages} pages of '{file_path}' in ranges of {step}")
+                    page_ranges = [(first, min(first + step, pages)) for first in range(0, pages, step)]
+            results = await asyncio.gather(*(
+                loop.run_in_executor(
+                    pool, load_and_split_document, file_path, *settings, page_range, self.metadata_extractor
+                )
+                for page_range in page_ranges
+            ))
+            chunks = []
+            for range_chunks, durations in results:
+                chunks.extend(range_chunks)
+                for stage, seconds in durations.items():
+                    STAGE_SECONDS.observe(seconds, stage=stage)
+            return file_path, chunks, None
+        except Exception as e:
+            return file_path, None, e
 
-        persist_directory = '/usr/src/app/backend/chroma_db'
+    def _hash_files(self, paths: Optional[List[str]] = None) -> Dict[str, str]:
+        """
+        Finds the supported files in the source directory and returns their content hashes.
+
+        Args:
+            paths (Optional[List[str]]): The files to check, or None to scan the source directory.
+
+        Returns:
+            Dict[str, str]: Paths relative to the source directory mapped to their content hash.
+        """
+        started = time.perf_counter()
+        if paths is None:
+            stats = scan_directory(self.source_directory, DOC_LOADERS_MAPPING)
+        else:
+            stats = stat_files(self.source_directory, paths, DOC_LOADERS_MAPPING)
+        logger.info(f"Found {len(stats)} files in {(time.perf_counter() - started) * 1000:.0f} ms")
+        file_hashes = self.file_index.hash_files(self.source_directory, stats)
+        if paths is None:
+            self.file_index.retain(file_hashes)
+        else:
+            self.file_index.forget(source for source in paths if source not in file_hashes)
+        self.file_index.save()
+        return file_hashes
+
+    def _relative_path(self, file_path: str) -> str:
+        """ Returns file_path relative to the source directory, as stored in the manifest. """
+        return os.path.relpath(file_path, self.source_directory).replace(os.sep, "/")
+
+    def _absolute_path(self, source: str) -> str:
+        """ Returns the absolute path of a manifest source. """
+        return os.path.join(self.source_directory, *source.split("/"))
+
+    async def process_documents(
+        self,
+        documents: AsyncIterator[Tuple[str, List[Document]]],
+        report: ProgressReporter
+    ) -> None:
+        """
+        Processes a stream of split documents by storing their chunks in a vector database.
+
+        Loading runs concurrently with storing: chunks are passed through a bounded queue and
+        embedded and upserted in batches of `INGEST_BATCH_SIZE`, so memory stays flat and the first
+        chunks are searchable while later files are still being parsed.
+
+        Chunks get deterministic IDs derived from their source and content, so only chunks that are
+        not yet in the collection are embedded and upserted. Chunks that no longer exist, either
+        because their file changed or was removed, are deleted from the collection. The indexes and
+        the manifest are persisted once at the end of the run. Vector indexes with durable writes
+        (Chroma) also commit the manifest after every batch, once all chunks of a file have been
+        stored, so an interrupted ingestion resumes after the last committed file; the keyword
+        index then only appends the batch's changes to its journal.
+
+        Args:
+            documents (AsyncIterator[Tuple[str, List[Document]]]): The paths and chunks of the
+                documents to process, see `load_documents_from_directory`.
+            report (ProgressReporter): Called with progress updates.
+
+        Raises:
+            Exception: If loading, embedding or storing fails. With durable vector index writes,
+                batches committed before the failure stay in the manifest, so the next ingestion
+                resumes after them.
+        """
+        logger.info("Processing documents")
+        persist_directory = self.persist_directory
         logger.info(f"Using persist directory: {persist_directory} ({os.path.abspath(persist_directory)})")
         
         if not os.path.exists(persist_directory):
@@ -144,12 +408,35 @@ class IngestService:
             logger.info(f"Created directory: {persist_directory}")
 
         try:
-            vectordb = Chroma.from_documents(
-                documents=texts,
-                embedding=self.EMBEDDINGS,
-                persist_directory=persist_directory
+            vectordb = await asyncio.to_thread(self._open_vector_store)
+
+            queue = asyncio.Queue(maxsize=2 * self.ENVIRONMENT.INGEST_BATCH_SIZE)
+            producer = asyncio.create_task(self._queue_chunks(documents, queue))
+            try:
+                stored = await self._store_chunks(vectordb, queue, report)
+            finally:
+                producer.cancel()
+            producer.result()
+            stats = self.embedding_executor.stats
+            logger.info(
+                f"Stored {stored} new chunks; embedded {stats.tokens} tokens in {stats.batches} requests "
+                f"({stats.tokens_per_second:.0f} tokens/s, {stats.retries} retries)"
             )
-            vectordb.persist()
+
+            stale_ids = []
+            for source in self.file_changes.removed:
+                stale_ids.extend(self.manifest.chunk_ids(source))
+                self.manifest.remove(source)
+            if stale_ids:
+                logger.info(f"Deleting {len(stale_ids)} chunks of removed files")
+                await asyncio.to_thread(vectordb.delete, ids=stale_ids)
+                await asyncio.to_thread(self.lexical_index.delete, stale_ids)
+                self.collection_changed = True
+            await asyncio.to_thread(vectordb.persist)
+            await asyncio.to_thread(self.lexical_index.compact)
+            await asyncio.to_thread(self.manifest.save)
+            if self.collection_changed:
+                self.vector_store.refresh()
 
             if os.path.exists(persist_directory):
                 logger.info(f"Directory contents: {os.listdir(persist_directory)}")
@@ -157,14 +444,159 @@ class IngestService:
                 logger.error(f"Directory {persist_directory} does not exist after persisting.")
         except Exception as e:
             logger.error(f"Failed to create or persist vector database: {e}")
+            raise
 
         logger.info(f"Persisted vector database at '{persist_directory}'")
 
-def get_ingest_service() -> IngestService:
-    """
-    Factory function to get an instance of IngestService.
+    def _open_vector_store(self) -> VectorIndex:
+        """
+        Opens the vector index, resetting collections that predate the ingest manifest.
 
-    Returns:
-        IngestService: An instance of IngestService.
-    """
-    return IngestService()
+        Returns:
+            VectorIndex: The vector index to ingest into.
+        """
+        vectordb = self.vector_store.get()
+        if not self.manifest.exists and vectordb.count() > 0:
+            # Vectors from before the manifest existed have random IDs and cannot be reconciled
+            logger.info("No ingest manifest found for existing collection; rebuilding it from scratch")
+            vectordb.reset()
+            self.lexical_index.reset()
+            vectordb = self.vector_store.refresh()
+        return vectordb
+
+    async def _queue_chunks(self, documents: AsyncIterator[Tuple[str, List[Document]]], queue: asyncio.Queue) -> None:
+        """
+        Queues the chunks of split documents that are not stored yet.
+
+        Each document's new chunks are followed by a `FileCheckpoint`, and a `None` sentinel
+        marks the end of the stream. The checkpoint carries all chunks of the document for the
+        keyword index, which is updated once they are stored, see `_flush_batch`.
+
+        Args:
+            documents (AsyncIterator[Tuple[str, List[Document]]]): The paths and chunks of the documents.
+            queue (asyncio.Queue): The queue to put `(chunk_id, chunk)` pairs and checkpoints on.
+        """
+        try:
+            async for file_path, chunks in documents:
+                source = self._relative_path(file_path)
+                chunk_ids = make_chunk_ids(
+                    source,
+                    (chunk.page_content for chunk in chunks),
+                    (self.metadata_extractor.select(chunk.metadata) for chunk in chunks)
+                )
+                existing_ids = set(self.manifest.chunk_ids(source))
+                stale_ids = list(existing_ids.difference(chunk_ids))
+                for chunk_id, chunk in zip(chunk_ids, chunks):
+                    if chunk_id not in existing_ids:
+                        await queue.put((chunk_id, chunk))
+                await queue.put(FileCheckpoint(
+                    source=source,
+                    file_hash=self.file_changes.changed[source],
+                    chunking=self._chunking_fingerprint(source),
+                    chunk_ids=chunk_ids,
+                    stale_ids=stale_ids,
+                    texts=[chunk.page_content for chunk in chunks],
+                    metadatas=[chunk.metadata for chunk in chunks]
+                ))
+        except Exception:
+            await queue.put(None)
+            raise
+        await queue.put(None)
+
+    async def _store_chunks(self, vectordb: VectorIndex, queue: asyncio.Queue, report: ProgressReporter) -> int:
+        """
+        Embeds and upserts queued chunks in fixed-size batches.
+
+        Args:
+            vectordb (VectorIndex): The vector store to upsert into.
+            queue (asyncio.Queue): The queue filled by `_queue_chunks`.
+            report (ProgressReporter): Called with progress updates.
+
+        Returns:
+            int: The number of chunks stored.
+        """
+        batch_size = self.ENVIRONMENT.INGEST_BATCH_SIZE
+        ids, chunks, checkpoints = [], [], []
+        stored = 0
+        while (item := await queue.get()) is not None:
+            if isinstance(item, FileCheckpoint):
+                checkpoints.append(item)
+                continue
+            ids.append(item[0])
+            chunks.append(item[1])
+            if len(ids) >= batch_size:
+                await self._flush_batch(vectordb, ids, chunks, checkpoints)
+                stored += len(ids)
+                ids, chunks, checkpoints = [], [], []
+                await report(f"Ingesting: stored {stored} chunks")
+        await self._flush_batch(vectordb, ids, chunks, checkpoints)
+        return stored + len(ids)
+
+    async def _flush_batch(
+        self,
+        vectordb: VectorIndex,
+        ids: List[str],
+        chunks: List[Document],
+        checkpoints: List["FileCheckpoint"]
+    ) -> None:
+        """
+        Upserts a batch of chunks and commits the files that are now completely stored.
+
+        The chunks are embedded by the embedding executor and upserted with their precomputed
+        vectors, so the vector store does not embed them again. The keyword index is updated with
+        the committed files in a worker thread, so searches keep running on the event loop. The
+        manifest and the keyword index journal are only saved if the vector index's writes are
+        durable; otherwise committed files are saved with the index at the end of the run, since
+        persisting such an index rewrites all of it.
+
+        Args:
+            vectordb (VectorIndex): The vector store to upsert into.
+            ids (List[str]): The chunk IDs.
+            chunks (List[Document]): The chunks.
+            checkpoints (List[FileCheckpoint]): Files whose chunks have all been queued before this flush.
+        """
+        stale_ids = [chunk_id for checkpoint in checkpoints for chunk_id in checkpoint.stale_ids]
+        if ids or checkpoints:
+            self.collection_changed = True
+        if ids:
+            logger.debug(f"Upserting batch of {len(ids)} chunks")
+            embeddings = await self._embed_batch(chunks)
+            await self._upsert_batch(vectordb, ids, embeddings, chunks)
+            INGESTED_CHUNKS.inc(len(ids))
+        if stale_ids:
+            await asyncio.to_thread(vectordb.delete, ids=stale_ids)
+        if checkpoints:
+            await asyncio.to_thread(self._index_keywords, checkpoints)
+        for checkpoint in checkpoints:
+            self.manifest.update(checkpoint.source, checkpoint.file_hash, checkpoint.chunk_ids, checkpoint.chunking)
+        if checkpoints and vectordb.durable_writes:
+            await asyncio.to_thread(self.lexical_index.persist)
+            await asyncio.to_thread(self.manifest.save)
+
+    def _index_keywords(self, checkpoints: List[FileCheckpoint]) -> None:
+        """ Replaces the chunks of committed files in the keyword index. """
+        for checkpoint in checkpoints:
+            self.lexical_index.delete(checkpoint.stale_ids)
+            self.lexical_index.upsert(checkpoint.chunk_ids, checkpoint.texts, checkpoint.metadatas)
+
+    @span("embed")
+    async def _embed_batch(self, chunks: List[Document]) -> List[List[float]]:
+        """ Embeds a batch of chunks with the embedding executor. """
+        return await self.embedding_executor.embed([chunk.page_content for chunk in chunks])
+
+    @span("upsert")
+    async def _upsert_batch(
+        self,
+        vectordb: VectorIndex,
+        ids: List[str],
+        embeddings: List[List[float]],
+        chunks: List[Document]
+    ) -> None:
+        """ Upserts a batch of chunks with their precomputed embeddings. """
+        await asyncio.to_thread(
+            vectordb.upsert,
+            ids=ids,
+            embeddings=embeddings,
+            texts=[chunk.page_content for chunk in chunks],
+            metadatas=[chunk.metadata for chunk in chunks]
+        )
@@ -0,0 +1,143 @@
+import asyncio
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.collection_registry import CollectionRegistry
+from app.core.document_loaders import DOC_LOADERS_MAPPING
+from app.core.logger import get_logger
+from app.core.providers import import_string
+from app.services.ingest_job_service import IngestJobService
+
+logger = get_logger(__name__)
+
+# Collection name mapped to the changed files, or None when the whole directory must be scanned
+ChangedFiles = Dict[str, Optional[Set[str]]]
+
+class IngestWatchService:
+    """
+    Watches the source directories and queues ingestion jobs for the files that change.
+
+    Uses `watchfiles` (inotify on Linux, FSEvents on macOS, polling elsewhere), which batches
+    events for `debounce_ms`. Created, modified and deleted files are passed to the collection's
+    ingestion job as `paths`, so only those files are checked instead of walking the directory.
+    Changes to directories, e.g. a directory moved into or out of the source directory, queue a
+    full scan of the collection, since their files are not reported one by one.
+
+    The default collection's source directory and the directory of named collections are
+    watched if they exist when the watcher starts.
+    """
+
+    def __init__(self, ingest_jobs: IngestJobService, collections: CollectionRegistry, debounce_ms: int = 1000):
+        """
+        Initializes the watcher without starting it.
+
+        Args:
+            ingest_jobs (IngestJobService): The service to queue ingestion jobs on.
+            collections (CollectionRegistry): The collections, and their source directories.
+            debounce_ms (int): The time changes are collected for before jobs are queued, in milliseconds.
+        """
+        self.ingest_jobs = ingest_jobs
+        self.collections = collections
+        self.debounce_ms = debounce_ms
+        self.default_directory = os.path.abspath(collections.default_source_directory)
+        self.collections_directory = os.path.abspath(collections.collections_source_directory)
+        self._stop: Optional[asyncio.Event] = None
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """ Starts watching in a background task. """
+        if self._watcher is not None:
+            return
+        try:
+            awatch = import_string("watchfiles:awatch")
+        except ImportError as e:
+            raise ImportError("Watching source directories requires the watchfiles package") from e
+        roots = [root for root in (self.default_directory, self.collections_directory) if os.path.isdir(root)]
+        if not roots:
+            logger.warning("No source directory to watch")
+            return
+        self._stop = asyncio.Event()
+        self._watcher = asyncio.create_task(self._watch(awatch, roots))
+        logger.info(f"Watching {', '.join(roots)} for changes")
+
+    async def stop(self) -> None:
+        """ Stops watching. """
+        if self._watcher is None:
+            return
+        self._stop.set()
+        self._watcher.cancel()
+        try:
+            await self._watcher
+        except asyncio.CancelledError:
+            pass
+        self._watcher = None
+
+    async def _watch(self, awatch, roots: List[str]) -> None:
+        """ Queues ingestion jobs for every batch of changes. """
+        async for changes in awatch(*roots, debounce=self.debounce_ms, stop_event=self._stop):
+            for collection, paths in self.group_changes(path for _, path in changes).items():
+                try:
+                    job = await self.ingest_jobs.submit(collection, sorted(paths) if paths is not None else None)
+                except Exception as e:
+                    logger.error(f"Failed to queue ingestion of collection '{collection}': {e}")
+                    continue
+                scope = f"{len(paths)} changed files" if paths is not None else "a full scan"
+                logger.info(f"Queued {scope} of collection '{collection}' in ingest job {job.job_id}")
+
+    def group_changes(self, paths: Iterable[str]) -> ChangedFiles:
+        """
+        Groups changed paths by collection.
+
+        Args:
+            paths (Iterable[str]): Absolute paths of changed files and directories.
+
+        Returns:
+            ChangedFiles: The changed supported files per collection, relative to its source
+                directory, or None for collections needing a full scan.
+        """
+        changed: ChangedFiles = {}
+        for path in paths:
+            located = self._locate(os.path.abspath(path))
+            if located is None:
+                continue
+            collection, source = located
+            if source is None or self._is_directory(path):
+                changed[collection] = None
+            elif os.path.splitext(source)[1].lower() in DOC_LOADERS_MAPPING:
+                files = changed.setdefault(collection, set())
+                if files is not None:
+                    files.add(source)
+        return changed
+
+    @staticmethod
+    def _is_directory(path: str) -> bool:
+        """ Returns whether a changed path is, or likely was, a directory. """
+        if os.path.exists(path):
+            return os.path.isdir(path)
+        name = os.path.basename(path)
+        return not name.startswith(".") and not os.path.splitext(name)[1]
+
+    def _locate(self, path: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Finds the collection of a changed path.
+
+        Returns:
+            Optional[Tuple[str, Optional[str]]]: The collection and the path relative to its source
+                directory, None as the path if the collection's source directory itself changed,
+                or None if the path is not in a collection.
+        """
+        if path == self.collections_directory or path.startswith(self.collections_directory + os.sep):
+            parts = os.path.relpath(path, self.collections_directory).split(os.sep)
+            # The default collection reads the default source directory, not a directory named after it
+            if parts == ["."] or parts[0] == self.collections.default_name:
+                return None
+            try:
+                collection = self.collections.resolve(parts[0])
+            except ValueError:
+                return None
+            return collection, "/".join(parts[1:]) or None
+        if path == self.default_directory or path.startswith(self.default_directory + os.sep):
+            relative = os.path.relpath(path, self.default_directory)
+            source = None if relative == "." else relative.replace(os.sep, "/")
+            return self.collections.default_name, source
+        return None
@@ -1,17 +1,31 @@
-from fastapi import WebSocket, WebSocketDisconnect, Depends
-from typing import Any
+from fastapi import WebSocket, WebSocketDisconnect, WebSocketException, Depends, status
+from contextlib import nullcontext
+from functools import partial
+from operator import itemgetter
+from textwrap import dedent
+from typing import Any, AsyncContextManager, Dict, Iterator, List, Optional, Tuple
 import json
+import time
 
 from langchain.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
-from langchain.vectorstores import Chroma
+from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableParallel, RunnablePassthrough
-from langchain_community.vectorstores import Chroma
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda, RunnableParallel
 
+from app.core.answer_cache import AnswerCache, normalize_query
+from app.core.answer_stream import AnswerStream, create_answer_stream
+from app.core.context import merge_passages, pack_passages, render_context
 from app.core.environment import get_environment
 from app.config import config as app_config
+from app.core.llm_scheduler import AdmissionRejected, LLMScheduler
 from app.core.logger import get_logger
+from app.core.metadata import MetadataExtractor, MetadataFilter
+from app.core.metrics import COALESCED_QUERIES, ERRORS, REJECTED_QUERIES, STAGE_SECONDS
+from app.core.reranker import RerankingRetriever, create_reranker
+from app.core.retriever import HybridRetriever, VectorIndexRetriever
+from app.core.single_flight import Flight, SingleFlight
+from app.core.vector_store import VectorStoreHandle
 
 logger = get_logger(__name__)
 
@@ -21,12 +35,30 @@ class RetrieverService:
     using language models and vector databases.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        vector_store: VectorStoreHandle,
+        answer_cache: AnswerCache,
+        flights: Optional[SingleFlight] = None,
+        scheduler: Optional[LLMScheduler] = None,
+        priority: Optional[str] = None
+    ):
         """
         Initializes the RetrieverService with environment configurations, language model, and embeddings.
 
+        Args:
+            vector_store (VectorStoreHandle): The shared vector store to retrieve from.
+            answer_cache (AnswerCache): The shared cache of previous answers.
+            flights (Optional[SingleFlight]): The shared answers in flight, coalescing identical
+                queries of concurrent sessions; a private one if omitted.
+            scheduler (Optional[LLMScheduler]): The process-wide admission control of chain runs;
+                runs are not limited if omitted.
+            priority (Optional[str]): The priority class of the session's chain runs, the
+                scheduler's highest one if omitted.
+
         Raises:
             KeyError: If the environment is not found in the application configuration.
+            ValueError: If the priority class is unknown to the scheduler.
             RuntimeError: If the language model or embeddings cannot be retrieved.
         """
         environment = get_environment()
@@ -37,7 +69,16 @@ class RetrieverService:
 
         self.ENVIRONMENT = app_config[environment]
         self.LLM = self.ENVIRONMENT.LLM.llm
-        self.EMBEDDINGS = self.ENVIRONMENT.EMBEDDINGS.embeddings
+        self.vector_store = vector_store
+        self.answer_cache = answer_cache
+        self.flights = flights if flights is not None else SingleFlight()
+        self.scheduler = scheduler
+        self.priority = scheduler.resolve(priority) if scheduler is not None else priority
+        self.EMBEDDINGS = vector_store.embeddings
+        self.metadata_fields = MetadataExtractor(
+            self.ENVIRONMENT.METADATA_FIELDS,
+            self.ENVIRONMENT.METADATA_PATTERNS
+        ).names
 
         if self.LLM is None:
             raise RuntimeError("Failed to retrieve the language model!")
@@ -47,21 +88,58 @@ class RetrieverService:
 
         logger.debug(f"Initialized RetrieverService with environment: {self.ENVIRONMENT}")
     
-    def create_chroma_retriever(self) -> Any:
+    def create_retriever(self) -> BaseRetriever:
         """
-        Creates a retriever instance using LangChain's Chroma vector store.
+        Creates a retriever over the application's shared vector and keyword indexes.
+
+        With `RETRIEVAL_MODE` 'hybrid' the retriever fuses BM25 keyword search and vector search,
+        with 'vector' it only searches the vector index. The index engine is chosen by
+        `VECTOR_INDEX_ENGINE`, and vector results must score at least `RETRIEVER_SCORE_THRESHOLD`.
+        Unless `RERANKER` is 'none', `RERANK_CANDIDATES` documents are fetched and re-ranked, and
+        the best ones that fit in `CONTEXT_TOKEN_BUDGET` tokens are kept. The retriever returns up
+        to `RETRIEVER_K` documents.
 
         Returns:
-            Any: A retriever instance configured for similarity-based retrieval.
-        """
-        persist_directory = 'chroma_db'
-        embeddings = self.EMBEDDINGS
-        chroma_db = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
-        retriever = chroma_db.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={"score_threshold": 0.3}
+            BaseRetriever: A retriever instance configured for the retrieval mode and re-ranker.
+
+        Raises:
+            ValueError: If the retrieval mode or re-ranker is unknown.
+        """
+        reranker = create_reranker(
+            self.ENVIRONMENT.RERANKER,
+            model_name=self.ENVIRONMENT.RERANKER_MODEL,
+            batch_size=self.ENVIRONMENT.RERANK_BATCH_SIZE
+        )
+        k = self.ENVIRONMENT.RETRIEVER_K
+        fetch_k = max(k, self.ENVIRONMENT.RERANK_CANDIDATES) if reranker is not None else k
+
+        mode = self.ENVIRONMENT.RETRIEVAL_MODE
+        if mode == "vector":
+            retriever = VectorIndexRetriever(
+                vector_store=self.vector_store,
+                k=fetch_k,
+                score_threshold=self.ENVIRONMENT.RETRIEVER_SCORE_THRESHOLD
+            )
+        elif mode == "hybrid":
+            retriever = HybridRetriever(
+                vector_store=self.vector_store,
+                k=fetch_k,
+                score_threshold=self.ENVIRONMENT.RETRIEVER_SCORE_THRESHOLD,
+                fetch_k=max(fetch_k, self.ENVIRONMENT.HYBRID_FETCH_K),
+                rrf_k=self.ENVIRONMENT.HYBRID_RRF_K,
+                keyword_query_max_terms=self.ENVIRONMENT.KEYWORD_QUERY_MAX_TERMS
+            )
+        else:
+            raise ValueError(f"Unknown retrieval mode '{mode}'")
+
+        if reranker is None:
+            return retriever
+        return RerankingRetriever(
+            retriever=retriever,
+            reranker=reranker,
+            k=k,
+            token_budget=self.ENVIRONMENT.CONTEXT_TOKEN_BUDGET
         )
-        return retriever
 
     @staticmethod
     def create_prompt_template() -> PromptTemplate:
@@ -71,77 +149,299 @@ class RetrieverService:
         Returns:
             PromptTemplate: A configured prompt template for generating answers.
         """
-        template =  """
-                        You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question.
-                        If you don't know the answer, just say that you don't know. Answer concise.
+        template = dedent("""
+            You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question.
+            If you don't know the answer, just say that you don't know. Answer concise.
 
-                        Question: {question} 
+            Question: {question}
 
-                        Context: {context} 
+            Context:
+            {context}
 
-                        Answer:
-                    """
+            Answer:
+        """).strip()
         return PromptTemplate(template=template, input_variables=["context", "question"])
 
-    async def handle_retrieval(self, websocket: WebSocket, retriever: Any, prompt_template: PromptTemplate):
+    def create_answer_stream(self, websocket: WebSocket) -> AnswerStream:
+        """
+        Creates the stream that sends answers in the protocol negotiated by the client.
+
+        Args:
+            websocket (WebSocket): The accepted WebSocket connection.
+
+        Returns:
+            AnswerStream: The framed `rag.v1` stream, or the plain text stream for older clients.
+        """
+        return create_answer_stream(
+            websocket,
+            window_ms=self.ENVIRONMENT.STREAM_COALESCE_WINDOW_MS,
+            max_chars=self.ENVIRONMENT.STREAM_COALESCE_MAX_CHARS
+        )
+
+    def parse_request(self, message: str) -> Tuple[str, Optional[MetadataFilter]]:
+        """
+        Parses a query received on /retrieve.
+
+        A query is either plain text, or a JSON object with the query and optional filters on
+        the metadata extracted at ingest time (`METADATA_FIELDS`, `METADATA_PATTERNS`):
+
+            {"query": "Why did the pump leak?", "filters": {"machine": "Hydraulic Pump 03"}}
+
+        Args:
+            message (str): The message sent by the client.
+
+        Returns:
+            Tuple[str, Optional[MetadataFilter]]: The query, and its filter if any.
+
+        Raises:
+            ValueError: If a JSON query has no query text or invalid filters.
+        """
+        if not message.lstrip().startswith("{"):
+            return message, None
+        try:
+            request = json.loads(message)
+        except ValueError:
+            return message, None
+        if not isinstance(request, dict) or not isinstance(request.get("query"), str):
+            raise ValueError("A JSON query needs a 'query' string")
+        return request["query"], MetadataFilter.parse(request.get("filters"), self.metadata_fields)
+
+    async def handle_retrieval(
+        self,
+        websocket: WebSocket,
+        retriever: Any,
+        prompt_template: PromptTemplate,
+        answer_stream: Optional[AnswerStream] = None
+    ):
         """
         Handles document retrieval and question-answering over a WebSocket connection.
 
+        The chain runs asynchronously, retrieval included, so the event loop keeps serving
+        other connections while an answer is retrieved and streamed. Retrieved chunks are
+        deduplicated and packed into at most `CONTEXT_TOKEN_BUDGET` tokens of context before
+        they reach the prompt. Queries may carry metadata filters, see `parse_request`, which
+        restrict the searched chunks. Answers found in the answer cache for the same query and
+        filter are sent without running the chain. Identical queries of concurrent sessions,
+        with the same filter, collection version and priority share a single chain run (see
+        `SingleFlight`): sessions joining late first receive the tokens already generated.
+        Chain runs are admitted by the scheduler at the session's priority; a rejected query
+        gets an error with a `retry_after` hint in seconds and the session stays open. The
+        retrieve, time-to-first-token and LLM stages are recorded in `STAGE_SECONDS`.
+
         Args:
             websocket (WebSocket): The WebSocket connection instance.
             retriever (Any): The retriever instance for fetching relevant documents.
             prompt_template (PromptTemplate): The prompt template for formatting questions and context.
+            answer_stream (Optional[AnswerStream]): The stream to send answers with, by default
+                the one for the protocol negotiated by the client.
 
         Raises:
             WebSocketDisconnect: If the WebSocket connection is disconnected unexpectedly.
         """
-        
+        if answer_stream is None:
+            answer_stream = self.create_answer_stream(websocket)
+
         rag_chain_from_docs = (
             prompt_template
             | self.LLM
             | StrOutputParser()
         )
+        token_budget = self.ENVIRONMENT.CONTEXT_TOKEN_BUDGET
+
+        async def retrieve(inputs: Dict[str, Any], config: RunnableConfig) -> List[Document]:
+            return await retriever.ainvoke(inputs["question"], config, metadata_filter=inputs["filter"])
+
+        rag_chain_with_source = RunnableParallel(
+            {
+                "documents": RunnableLambda(retrieve),
+                "question": itemgetter("question")
+            }
+        ).assign(
+            passages=RunnableLambda(lambda inputs: pack_passages(merge_passages(inputs["documents"]), token_budget))
+        ).assign(
+            context=RunnableLambda(lambda inputs: render_context(inputs["passages"]))
+        ).assign(answer=rag_chain_from_docs)
 
         while True:
             try:
                 logger.info("Waiting for query from client")
-                query = await websocket.receive_text()
-                logger.info(f"Received query: {query}")
+                message = await websocket.receive_text()
+                logger.info(f"Received query: {message}")
+                try:
+                    query, metadata_filter = self.parse_request(message)
+                except ValueError as e:
+                    logger.warning(f"Rejected query: {e}")
+                    await answer_stream.error(str(e))
+                    continue
                 if query:
-                    rag_chain_with_source = RunnableParallel(
-                        {
-                            "context": retriever,
-                            "question": RunnablePassthrough()
-                        }
-                    ).assign(answer=rag_chain_from_docs)
-            
-                    response_stream = rag_chain_with_source.stream(query)
+                    started = time.perf_counter()
+                    version = self.vector_store.version
+                    scope = metadata_filter.key if metadata_filter is not None else ""
+                    cached_answer = await self.answer_cache.get(query, version, scope)
+                    if cached_answer is not None:
+                        logger.info("Serving answer from cache")
+                        await answer_stream.cached(cached_answer)
+                        await answer_stream.end(
+                            cached_answer, {"total_ms": (time.perf_counter() - started) * 1000}, cached=True
+                        )
+                        continue
+
                     full_response = ""
-                    for chunk in response_stream:
-                        logger.info(f"Received chunk: {chunk} (type: {type(chunk)})")
-                        
-                        if chunk := chunk.get("answer"):
-                            full_response += chunk
-                            await websocket.send_text(chunk)
-                    
-                    # Send the full response once completed
-                    await websocket.send_text(f"Full response: {full_response}")
+                    timings = {}
+                    key = self._flight_key(query, scope, version)
+                    produce = partial(
+                        self._produce, rag_chain_with_source, retriever, query, metadata_filter, version, scope
+                    )
+                    async with self.flights.join(key, produce) as (flight, started_flight):
+                        if not started_flight:
+                            logger.info("Joining an identical query in flight")
+                            COALESCED_QUERIES.inc()
+                        async for kind, value in flight.follow():
+                            if kind == "sources":
+                                passages, retriever_timings = value
+                                timings.update(retriever_timings)
+                                timings["context_ms"] = (time.perf_counter() - started) * 1000
+                                await answer_stream.sources(passages)
+                            elif kind == "delta":
+                                if not full_response:
+                                    timings["first_token_ms"] = (time.perf_counter() - started) * 1000
+                                full_response += value
+                                await answer_stream.delta(value)
+                            elif kind == "error":
+                                raise value
+
+                    # End the answer once completed
+                    timings["total_ms"] = (time.perf_counter() - started) * 1000
+                    await answer_stream.end(full_response, timings)
+                    self._observe(timings)
 
                     logger.info("Query processing completed.")
             except WebSocketDisconnect:
                 logger.info("WebSocket disconnected during retrieval")
                 break
+            except AdmissionRejected as e:
+                # The priority the chain run waited at
+                logger.warning(f"Rejected {e.priority} query: {e}")
+                REJECTED_QUERIES.inc(priority=e.priority, reason=e.reason)
+                await answer_stream.error(str(e), retry_after=e.retry_after)
             except Exception as e:
                 logger.error(f"Exception during retrieval: {e}")
-                await websocket.send_text(json.dumps({"error": str(e)}))
+                ERRORS.inc(operation="retrieve")
+                await answer_stream.error(str(e))
                 break
 
+    def _flight_key(self, query: str, scope: str, version: int) -> Tuple[str, str, int, Optional[str]]:
+        """
+        Returns the key of the flight answering a query.
+
+        The priority is part of the key, since the chain run is admitted at the priority of the
+        session starting it; a session never waits for a slot at another session's priority.
+        """
+        return normalize_query(query), scope, version, self.priority
+
+    async def _produce(
+        self,
+        chain: Runnable,
+        retriever: Any,
+        query: str,
+        metadata_filter: Optional[MetadataFilter],
+        version: int,
+        scope: str,
+        flight: Flight
+    ) -> None:
+        """
+        Runs the chain for a query and publishes its sources and tokens to the sessions following it.
+
+        The run holds a scheduler slot from retrieval to the last token, so sessions joining
+        the flight do not take a slot of their own.
+
+        Args:
+            chain (Runnable): The chain retrieving the passages and generating the answer.
+            retriever (Any): The retriever of the chain, for its stage timings.
+            query (str): The query.
+            metadata_filter (Optional[MetadataFilter]): The filter of the query.
+            version (int): The collection version the answer is generated from.
+            scope (str): The answer cache scope of the query.
+            flight (Flight): The flight to publish to.
+
+        Raises:
+            AdmissionRejected: If the scheduler does not admit the run.
+        """
+        answer = ""
+        async with self._slot() as queued_seconds:
+            admitted = time.perf_counter()
+            async for chunk in chain.astream({"question": query, "filter": metadata_filter}):
+                if "passages" in chunk:
+                    timings = {"queue_ms": queued_seconds * 1000, **getattr(retriever, "last_timings", {})}
+                    # Re-ranking is recorded as a stage of its own
+                    context_ms = (time.perf_counter() - admitted) * 1000
+                    timings["retrieve_ms"] = max(0.0, context_ms - timings.get("rerank_ms", 0.0))
+                    flight.publish("sources", (chunk["passages"], timings))
+                if token := chunk.get("answer"):
+                    answer += token
+                    flight.publish("delta", token)
+        await self.answer_cache.put(query, answer, version, scope)
+        flight.publish("end", answer)
+
+    def _slot(self) -> AsyncContextManager[float]:
+        """ Holds a scheduler slot for a chain run, or returns right away without a scheduler. """
+        if self.scheduler is None:
+            return nullcontext(0.0)
+        return self.scheduler.slot(self.priority)
+
+    @staticmethod
+    def _observe(timings: Dict[str, float]) -> None:
+        """
+        Records the stage durations of an answer.
+
+        Args:
+            timings (Dict[str, float]): Milliseconds from receiving the query until the context was
+                assembled, the first token arrived and the answer was complete, and spent retrieving
+                the context once admitted, without re-ranking. Waiting for a scheduler slot and
+                re-ranking are recorded by the scheduler and the re-ranker.
+        """
+        context_ms = timings.get("context_ms")
+        if context_ms is None:
+            return
+        STAGE_SECONDS.observe(timings["retrieve_ms"] / 1000, stage="retrieve")
+        if "first_token_ms" in timings:
+            STAGE_SECONDS.observe(timings["first_token_ms"] / 1000, stage="time_to_first_token")
+        STAGE_SECONDS.observe((timings["total_ms"] - context_ms) / 1000, stage="llm")
+
 
-def get_retriever_service() -> RetrieverService:
+def get_retriever_service(
+    websocket: WebSocket,
+    collection: Optional[str] = None,
+    priority: Optional[str] = None
+) -> Iterator[RetrieverService]:
     """
-    Factory function to get an instance of RetrieverService.
+    Factory function to get an instance of RetrieverService for a collection.
 
-    Returns:
+    The collection is loaded if needed and leased for the lifetime of the connection, so it is
+    not evicted while the session uses it. Chain runs of the session are admitted by the
+    application's LLM scheduler at the requested priority.
+
+    Args:
+        websocket (WebSocket): The WebSocket connection, used to reach the collections.
+        collection (Optional[str]): The collection to retrieve from, the default collection if omitted.
+        priority (Optional[str]): The priority class of the session, one of `LLM_PRIORITY_CLASSES`,
+            the first one if omitted.
+
+    Yields:
         RetrieverService: An instance of RetrieverService.
+
+    Raises:
+        WebSocketException: If the collection or priority class is invalid or unknown; the
+            connection is refused.
     """
-    return RetrieverService()
+    collections = websocket.app.state.collections
+    scheduler = websocket.app.state.llm_scheduler
+    try:
+        priority = scheduler.resolve(priority)
+        tenant = collections.acquire(collection)
+    except ValueError as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=str(e))
+    try:
+        yield RetrieverService(tenant.vector_store, tenant.answer_cache, tenant.flights, scheduler, priority)
+    finally:
+        collections.release(tenant)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Load test for the /retrieve WebSocket endpoint.
+
+Opens increasing numbers of concurrent sessions against a running server, sends
+one query per session and reports how time-to-first-token and total answer
+latency scale with concurrency, and how many queries admission control
+rejected. Latencies are of the answered queries. Sessions use the framed
+`rag.v1` protocol unless --protocol text is passed. Identical queries in flight
+share one answer, so pass --distinct to measure independent answers. Run it
+against two builds of the server to compare them, e.g.:
+
+    python benchmarks/retrieve_load_test.py --url ws://localhost:5000/retrieve --concurrency 1,8,32
+
+Append `?priority=batch` to the URL to send queries as a lower priority class.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import zlib
+from typing import Dict, List, Optional
+
+import websockets
+
+DEFAULT_QUERY = "How do I fix overheating on CNC Machine 01?"
+PROTOCOL = "rag.v1"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """ Returns the pct-th percentile of values using nearest-rank. """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_session(url: str, query: str, protocol: Optional[str] = PROTOCOL) -> Dict[str, float]:
+    """
+    Sends a single query and waits for the complete answer.
+
+    Args:
+        url (str): The /retrieve WebSocket URL.
+        query (str): The query to send.
+        protocol (Optional[str]): The subprotocol to negotiate, or None for the plain text protocol.
+
+    Returns:
+        Dict[str, float]: Time to first token and total time in seconds, the number of frames,
+            payload bytes and payload bytes after permessage-deflate received, and the retry
+            hint in seconds if the query was rejected by admission control.
+    """
+    started = time.perf_counter()
+    first_token = retry_after = None
+    frames = size = deflated = 0
+    # permessage-deflate compresses every message with one raw deflate stream per connection
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    async with websockets.connect(url, subprotocols=[protocol] if protocol else None) as websocket:
+        await websocket.send(query)
+        while True:
+            message = await websocket.recv()
+            payload = message.encode("utf8")
+            frames += 1
+            size += len(payload)
+            deflated += len(compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+            if protocol:
+                frame = json.loads(message)
+                if first_token is None and frame["type"] == "delta":
+                    first_token = time.perf_counter() - started
+                if frame["type"] in ("end", "error"):
+                    retry_after = frame.get("retry_after")
+                    break
+                continue
+            if message.startswith('{"error"'):
+                retry_after = json.loads(message).get("retry_after")
+                break
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            if message.startswith("Full response:"):
+                break
+    total = time.perf_counter() - started
+    return {
+        "ttft": first_token or total,
+        "total": total,
+        "frames": frames,
+        "bytes": size,
+        "deflated_bytes": deflated,
+        "retry_after": retry_after,
+    }
+
+
+def summarize_sessions(results: List[Dict[str, float]]) -> Dict[str, float]:
+    """ Returns the latency percentiles of the answered sessions and the number of rejected ones. """
+    answered = [result for result in results if result["retry_after"] is None] or [
+        {"ttft": float("nan"), "total": float("nan")}
+    ]
+    ttfts = [result["ttft"] for result in answered]
+    totals = [result["total"] for result in answered]
+    return {
+        "ttft_p50": statistics.median(ttfts),
+        "ttft_p95": percentile(ttfts, 95),
+        "total_p50": statistics.median(totals),
+        "total_p95": percentile(totals, 95),
+        "rejected": sum(1 for result in results if result["retry_after"] is not None),
+    }
+
+
+async def run_level(
+    url: str,
+    query: str,
+    concurrency: int,
+    protocol: Optional[str] = PROTOCOL,
+    distinct: bool = False
+) -> Dict[str, float]:
+    """
+    Runs `concurrency` sessions at once and summarizes their latencies.
+
+    Args:
+        url (str): The /retrieve WebSocket URL.
+        query (str): The query to send.
+        concurrency (int): The number of concurrent sessions.
+        protocol (Optional[str]): The subprotocol to negotiate, or None for the plain text protocol.
+        distinct (bool): Whether to number the query of every session, so no answers are shared.
+
+    Returns:
+        Dict[str, float]: Latency percentiles, rejected sessions and wall-clock time for the level.
+    """
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        run_session(url, f"{query} ({number})" if distinct else query, protocol) for number in range(concurrency)
+    ))
+    wall = time.perf_counter() - started
+    return {"concurrency": concurrency, **summarize_sessions(results), "wall": wall}
+
+
+async def main(args: argparse.Namespace) -> None:
+    levels = [int(level) for level in args.concurrency.split(",")]
+    report = []
+    print(f"{'sessions':>8} {'ttft p50':>9} {'ttft p95':>9} {'total p50':>10} {'total p95':>10} {'rejected':>9} {'wall':>7}")
+    for concurrency in levels:
+        protocol = None if args.protocol == "text" else args.protocol
+        summary = await run_level(args.url, args.query, concurrency, protocol, args.distinct)
+        report.append(summary)
+        print(
+            f"{concurrency:>8} {summary['ttft_p50']:>8.3f}s {summary['ttft_p95']:>8.3f}s "
+            f"{summary['total_p50']:>9.3f}s {summary['total_p95']:>9.3f}s {summary['rejected']:>9} "
+            f"{summary['wall']:>6.2f}s"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://localhost:5000/retrieve", help="The /retrieve WebSocket URL.")
+    parser.add_argument("--query", default=DEFAULT_QUERY, help="The query every session sends.")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels.")
+    parser.add_argument("--distinct", action="store_true", help="Number the query of every session, so no answers are shared.")
+    parser.add_argument("--protocol", default=PROTOCOL, help="Subprotocol to negotiate, or 'text' for the plain text protocol.")
+    parser.add_argument("--output", help="Optional path to write the results as JSON.")
+    asyncio.run(main(parser.parse_args()))
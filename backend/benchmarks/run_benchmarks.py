@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Offline benchmark suite for ingestion and retrieval.
+
+Runs the backend against deterministic fake LLM and embedding models (the
+`benchmark` environment) on a synthetic corpus scaled up from the
+`source_documents/maintenance_log_*.txt` samples, and measures:
+
+- ingest throughput (files/s, chunks/s) through /ingest,
+- retrieval latency percentiles of the retriever, for questions and for
+  keyword-only queries naming a machine, with the candidate retrieval and
+  re-ranking stages reported separately,
+- end-to-end /retrieve time-to-first-token and total time, and frames and
+  payload bytes per answer (also after permessage-deflate), for the framed
+  protocol and the plain text one,
+- latency under concurrent /retrieve sessions,
+- a burst of interactive and batch sessions beyond the LLM scheduler's slots
+  and queue: answer latency per priority class, rejected sessions and how
+  fast rejections arrive.
+
+Results are written as JSON. Passing a previous result file as --baseline
+compares against it and exits non-zero on regressions beyond --tolerance.
+Run from the backend directory:
+
+    python -m benchmarks.run_benchmarks --scale 20 --output results.json
+    python -m benchmarks.run_benchmarks --scale 20 --baseline results.json
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import websockets
+
+from benchmarks.retrieve_load_test import percentile, run_session
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SAMPLES_GLOB = os.path.join(BACKEND_DIR, "source_documents", "maintenance_log_*.txt")
+
+MACHINES = ["CNC Machine", "Hydraulic Pump", "Conveyor Belt", "Air Compressor", "Lathe", "Welding Robot"]
+ISSUES = ["overheating", "leakage", "vibration", "noise", "misalignment", "power loss"]
+
+# Metrics where a higher value is better; all others are latencies where lower is better
+HIGHER_IS_BETTER = {"files_per_second", "chunks_per_second"}
+
+
+def build_corpus(directory: str, scale: int) -> int:
+    """
+    Writes `scale` variants of every sample document into directory.
+
+    Machine numbers, IDs and years are shifted per copy, so every file has
+    distinct content and produces distinct chunks.
+
+    Args:
+        directory (str): The directory to write the corpus to.
+        scale (int): The number of copies per sample.
+
+    Returns:
+        int: The number of files written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    samples = sorted(glob.glob(SAMPLES_GLOB))
+    written = 0
+    for copy in range(scale):
+        for sample in samples:
+            with open(sample, "r", encoding="utf8") as f:
+                text = f.read()
+            text = re.sub(r"(?<=[A-Za-z] )(\d{2})\"", lambda m: f"{(int(m.group(1)) + copy) % 100:02d}\"", text)
+            text = re.sub(r"\"id\": (\d+)", lambda m: f"\"id\": {int(m.group(1)) + copy * 100}", text)
+            text = re.sub(r"\b20(\d{2})-", lambda m: f"{2000 + (int(m.group(1)) + copy) % 100}-", text)
+            name = f"{os.path.splitext(os.path.basename(sample))[0]}_{copy:05d}.txt"
+            with open(os.path.join(directory, name), "w", encoding="utf8") as f:
+                f.write(text)
+            written += 1
+    return written
+
+
+def make_queries(count: int) -> List[str]:
+    """ Returns `count` distinct questions about the synthetic fleet. """
+    return [
+        f"How do I fix {ISSUES[i % len(ISSUES)]} on {MACHINES[i % len(MACHINES)]} {i % 97:02d}?"
+        for i in range(count)
+    ]
+
+
+def make_keyword_queries(directory: str, count: int) -> List[str]:
+    """ Returns `count` keyword-only queries naming machines that occur in the corpus. """
+    machines = set()
+    for file_path in glob.glob(os.path.join(directory, "*.txt")):
+        with open(file_path, "r", encoding="utf8") as f:
+            machines.update(re.findall(r"\"machine\": \"([^\"]+)\"", f.read()))
+    machines = sorted(machines)
+    return [machines[i % len(machines)] for i in range(count)]
+
+
+def summarize(values: List[float], prefix: str) -> Dict[str, float]:
+    """ Returns p50/p95/p99 of values in milliseconds. """
+    return {
+        f"{prefix}_p50_ms": statistics.median(values) * 1000,
+        f"{prefix}_p95_ms": percentile(values, 95) * 1000,
+        f"{prefix}_p99_ms": percentile(values, 99) * 1000,
+    }
+
+
+def free_port() -> int:
+    """ Returns a free local TCP port. """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision() -> str:
+    """ Returns the current git commit, or 'unknown'. """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def bench_ingest(base_url: str, files: int, vector_store) -> Dict[str, float]:
+    """ Runs a full ingestion through /ingest and measures throughput. """
+    started = time.perf_counter()
+    async with websockets.connect(f"{base_url}/ingest") as websocket:
+        async for message in websocket:
+            if message.startswith("Error"):
+                raise RuntimeError(message)
+    seconds = time.perf_counter() - started
+    chunks = vector_store.get().count()
+    return {
+        "files": files,
+        "chunks": chunks,
+        "ingest_seconds": seconds,
+        "files_per_second": files / seconds,
+        "chunks_per_second": chunks / seconds,
+    }
+
+
+async def bench_retriever(
+    retriever,
+    queries: List[str],
+    prefix: str = "retrieval",
+    metadata_filter=None
+) -> Dict[str, float]:
+    """ Measures retriever latency for sequential queries, and per stage for re-ranking retrievers. """
+    latencies, stages = [], {}
+    for query in queries:
+        started = time.perf_counter()
+        await retriever.ainvoke(query, metadata_filter=metadata_filter)
+        latencies.append(time.perf_counter() - started)
+        for stage, milliseconds in getattr(retriever, "last_timings", {}).items():
+            stages.setdefault(stage.removesuffix("_ms"), []).append(milliseconds / 1000)
+    metrics = summarize(latencies, prefix)
+    for stage, values in stages.items():
+        metrics.update(summarize(values, f"{prefix}_{stage}"))
+    return metrics
+
+
+async def bench_end_to_end(url: str, queries: List[str]) -> Dict[str, float]:
+    """ Measures /retrieve time-to-first-token, total time and traffic for sequential sessions. """
+    results = [await run_session(url, query) for query in queries]
+    text_results = [await run_session(url, query, protocol=None) for query in queries]
+    return {
+        **summarize([result["ttft"] for result in results], "ttft"),
+        **summarize([result["total"] for result in results], "answer"),
+        "frames_per_answer": statistics.mean(result["frames"] for result in results),
+        "bytes_per_answer": statistics.mean(result["bytes"] for result in results),
+        "deflated_bytes_per_answer": statistics.mean(result["deflated_bytes"] for result in results),
+        "text_frames_per_answer": statistics.mean(result["frames"] for result in text_results),
+        "text_bytes_per_answer": statistics.mean(result["bytes"] for result in text_results),
+        "text_deflated_bytes_per_answer": statistics.mean(result["deflated_bytes"] for result in text_results),
+    }
+
+
+async def bench_concurrency(url: str, queries: List[str], levels: List[int]) -> Dict[str, float]:
+    """
+    Measures /retrieve latency with increasing numbers of concurrent sessions, asking distinct
+    queries and, as during an incident, all the same query.
+    """
+    metrics = {}
+    for level in levels:
+        for name, batch in (
+            ("concurrent", [queries[i % len(queries)] for i in range(level)]),
+            ("identical", [queries[0]] * level),
+        ):
+            started = time.perf_counter()
+            results = await asyncio.gather(*(run_session(url, query) for query in batch))
+            metrics[f"{name}_{level}_wall_ms"] = (time.perf_counter() - started) * 1000
+            metrics[f"{name}_{level}_ttft_p95_ms"] = percentile([r["ttft"] for r in results], 95) * 1000
+            metrics[f"{name}_{level}_answer_p95_ms"] = percentile([r["total"] for r in results], 95) * 1000
+    return metrics
+
+
+async def bench_overload(url: str, queries: List[str], sessions: int) -> Dict[str, float]:
+    """
+    Measures /retrieve under a burst of distinct queries beyond the LLM scheduler's capacity,
+    every other one sent as `batch` priority.
+    """
+    burst = [(f"{queries[i % len(queries)]} ({i})", "batch" if i % 2 else "interactive") for i in range(sessions)]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run_session(f"{url}?priority={priority}", query) for query, priority in burst))
+    metrics = {"overload_wall_ms": (time.perf_counter() - started) * 1000}
+    rejections = [result["total"] for result in results if result["retry_after"] is not None]
+    if rejections:
+        metrics["overload_rejection_p95_ms"] = percentile(rejections, 95) * 1000
+    for priority in ("interactive", "batch"):
+        answers = [
+            result["total"] for result, (_, session_priority) in zip(results, burst)
+            if session_priority == priority and result["retry_after"] is None
+        ]
+        if answers:
+            metrics[f"overload_{priority}_answer_p95_ms"] = percentile(answers, 95) * 1000
+        metrics[f"overload_{priority}_rejected"] = sum(
+            1 for result, (_, session_priority) in zip(results, burst)
+            if session_priority == priority and result["retry_after"] is not None
+        )
+    return metrics
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """
+    Compares results against a baseline.
+
+    Args:
+        results (Dict[str, float]): The current metrics.
+        baseline (Dict[str, float]): The baseline metrics.
+        tolerance (float): The allowed relative regression, e.g. 0.2 for 20%.
+
+    Returns:
+        List[str]: A description of every regressed metric.
+    """
+    regressions = []
+    print(f"\n{'metric':<34} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not isinstance(previous, (int, float)) or not previous or name in ("files", "chunks"):
+            continue
+        change = (current - previous) / previous
+        print(f"{name:<34} {previous:>12.2f} {current:>12.2f} {change:>+7.1%}")
+        worse = -change if name in HIGHER_IS_BETTER else change
+        if worse > tolerance:
+            regressions.append(f"{name}: {previous:.2f} -> {current:.2f} ({change:+.1%})")
+    return regressions
+
+
+def run(args: argparse.Namespace, workdir: str) -> Dict[str, object]:
+    """ Builds the corpus, starts the server and runs all benchmarks. """
+    os.environ.update({
+        "APP_ENV": "benchmark",
+        "PERSIST_DIRECTORY": os.path.join(workdir, "chroma_db"),
+        "VECTOR_INDEX_ENGINE": args.engine,
+        "RETRIEVAL_MODE": args.retrieval_mode,
+        "RERANKER": args.reranker,
+        "EMBEDDING_CACHE_MAX_ENTRIES": "0",
+        "ANSWER_CACHE_MAX_ENTRIES": "0",
+        "FAKE_LLM_FIRST_TOKEN_LATENCY": str(args.llm_first_token_latency),
+        "FAKE_LLM_TOKEN_LATENCY": str(args.llm_token_latency),
+        "LLM_MAX_CONCURRENCY": str(args.llm_max_concurrency),
+        "LLM_MAX_QUEUE": str(args.llm_max_queue),
+    })
+    files = build_corpus(os.path.join(workdir, "source_documents"), args.scale)
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+
+    import uvicorn
+    from app import create_app
+    from app.core.metadata import MetadataFilter
+    from app.services.retrieve_service import RetrieverService
+
+    app = create_app()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base_url = f"ws://127.0.0.1:{port}"
+    queries = make_queries(args.queries)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    collection = app.state.collections.acquire()
+    retriever_service = RetrieverService(collection.vector_store, collection.answer_cache)
+    retriever = retriever_service.create_retriever()
+    # One year of maintenance records; every corpus copy shifts the years by one
+    year_filter = MetadataFilter.parse(
+        {"date": {"gte": "2023-01-01", "lte": "2023-12-31"}}, retriever_service.metadata_fields
+    )
+
+    async def run_all() -> Dict[str, float]:
+        metrics = {}
+        metrics.update(await bench_ingest(base_url, files, collection.vector_store))
+        metrics.update(await bench_retriever(retriever, queries))
+        metrics.update(await bench_retriever(retriever, make_keyword_queries("source_documents", args.queries), "keyword_retrieval"))
+        metrics.update(await bench_retriever(retriever, queries, "filtered_retrieval", year_filter))
+        metrics.update(await bench_end_to_end(f"{base_url}/retrieve", queries[:args.sessions]))
+        metrics.update(await bench_concurrency(f"{base_url}/retrieve", queries, levels))
+        overload_sessions = args.overload_sessions or 2 * (args.llm_max_concurrency + args.llm_max_queue)
+        metrics.update(await bench_overload(f"{base_url}/retrieve", queries, overload_sessions))
+        return metrics
+
+    try:
+        metrics = asyncio.run(run_all())
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "scale": args.scale,
+            "engine": args.engine,
+            "retrieval_mode": args.retrieval_mode,
+            "reranker": args.reranker,
+            "llm_first_token_latency": args.llm_first_token_latency,
+            "llm_token_latency": args.llm_token_latency,
+            "llm_max_concurrency": args.llm_max_concurrency,
+            "llm_max_queue": args.llm_max_queue,
+        },
+        "results": metrics,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=20, help="Copies of every sample document.")
+    parser.add_argument("--queries", type=int, default=200, help="Queries for the retrieval benchmark.")
+    parser.add_argument("--sessions", type=int, default=20, help="Sequential /retrieve sessions.")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrent session counts.")
+    parser.add_argument("--engine", default="chroma", help="Vector index engine to benchmark.")
+    parser.add_argument("--retrieval-mode", default="hybrid", help="Retrieval mode to benchmark.")
+    parser.add_argument("--reranker", default="lexical", help="Re-ranker to benchmark.")
+    parser.add_argument("--llm-first-token-latency", type=float, default=0.2, help="Fake LLM latency before the first token.")
+    parser.add_argument("--llm-token-latency", type=float, default=0.01, help="Fake LLM latency between tokens.")
+    parser.add_argument("--llm-max-concurrency", type=int, default=16, help="Chain runs admitted at once.")
+    parser.add_argument("--llm-max-queue", type=int, default=64, help="Chain runs allowed to wait for a slot.")
+    parser.add_argument("--overload-sessions", type=int, default=0, help="Sessions of the overload burst, twice the slots and queue by default.")
+    parser.add_argument("--output", help="Path to write the results as JSON.")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression.")
+    parser.add_argument("--verbose", action="store_true", help="Keep the application's INFO logging.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    cwd = os.getcwd()
+    try:
+        report = run(args, workdir)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf8") as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline["results"], args.tolerance)
+        if regressions:
+            print("\nRegressions beyond tolerance:\n  " + "\n  ".join(regressions))
+            return 1
+        print("\nNo regressions beyond tolerance.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Startup and import-time profile of the backend.
+
+Starts fresh interpreters that import the application, create it and serve a
+single /status request, and reports for every stage the wall time, the peak
+resident memory and which heavy provider modules (LLM clients, vector store,
+document loaders) ended up imported. A second probe imports only the ingest
+service, as a loader worker process does. The slowest imports are taken from
+`python -X importtime`.
+
+Results are written as JSON. Passing a previous result file as --baseline
+compares against it, e.g. to show the effect of a change:
+
+    python -m benchmarks.startup_profile --output startup.json
+    python -m benchmarks.startup_profile --baseline startup.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+from benchmarks.run_benchmarks import BACKEND_DIR, compare, git_revision
+
+# Modules that are expensive to import and should only be loaded when needed
+HEAVY_MODULES = [
+    "langchain_openai", "openai", "chromadb", "langchain_community.vectorstores",
+    "langchain_community.document_loaders.pdf", "pdfminer", "unstructured", "tiktoken",
+]
+
+APP_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    client.get("/status").raise_for_status()
+served = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "create_app_seconds": created - imported,
+    "first_status_seconds": served - created,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+    "heavy_modules": [name for name in HEAVY if name in sys.modules],
+}))
+"""
+
+WORKER_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app.services.ingest_service
+imported = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+    "heavy_modules": [name for name in HEAVY if name in sys.modules],
+}))
+"""
+
+
+def run_probe(probe: str, env: Dict[str, str], importtime: bool = False) -> Dict[str, object]:
+    """
+    Runs a probe in a fresh interpreter.
+
+    Args:
+        probe (str): The probe source, which prints its measurements as JSON.
+        env (Dict[str, str]): The environment of the interpreter.
+        importtime (bool): Whether to collect `-X importtime` output.
+
+    Returns:
+        Dict[str, object]: The measurements, with the raw import times under "importtime".
+    """
+    command = [sys.executable] + (["-X", "importtime"] if importtime else [])
+    command += ["-c", f"HEAVY = {HEAVY_MODULES!r}\n{probe}"]
+    completed = subprocess.run(command, cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Probe failed:\n{completed.stderr[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["importtime"] = completed.stderr
+    return result
+
+
+def slowest_imports(importtime: str, top: int) -> List[Dict[str, object]]:
+    """
+    Returns the modules imported directly by application modules, slowest first.
+
+    `-X importtime` prints a module after everything it imports, indented one level
+    deeper, which is used to find the importer of every module.
+
+    Args:
+        importtime (str): The stderr of `python -X importtime`.
+        top (int): The number of imports to return.
+
+    Returns:
+        List[Dict[str, object]]: The module, its importer and cumulative milliseconds.
+    """
+    imports, pending = [], []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        module = name.strip()
+        while pending and pending[-1][0] > depth:
+            child_depth, child, child_cumulative = pending.pop()
+            if child_depth == depth + 1 and module.split(".")[0] == "app":
+                imports.append({"module": child, "imported_by": module, "cumulative_ms": child_cumulative / 1000})
+        pending.append((depth, module, int(cumulative)))
+    return sorted(imports, key=lambda entry: entry["cumulative_ms"], reverse=True)[:top]
+
+
+def summarize_runs(runs: List[Dict[str, object]], prefix: str) -> Dict[str, float]:
+    """ Returns the median of every numeric measurement across runs. """
+    keys = [key for key, value in runs[0].items() if isinstance(value, (int, float))]
+    return {f"{prefix}_{key}": statistics.median(run[key] for run in runs) for key in keys}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per probe.")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to report.")
+    parser.add_argument("--env", default="development", help="APP_ENV to start the application with.")
+    parser.add_argument("--output", help="Path to write the results as JSON.")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag-startup-")
+    env = {**os.environ, "APP_ENV": args.env, "PERSIST_DIRECTORY": workdir, "PYTHONDONTWRITEBYTECODE": "1"}
+    env.setdefault("OPENAI_API_KEY", "sk-startup-profile")
+    try:
+        app_runs = [run_probe(APP_PROBE, env) for _ in range(args.repeat)]
+        worker_runs = [run_probe(WORKER_PROBE, env) for _ in range(args.repeat)]
+        profiled = run_probe(APP_PROBE, env, importtime=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {"revision": git_revision(), "python": sys.version.split()[0], "env": args.env, "repeat": args.repeat},
+        "results": {**summarize_runs(app_runs, "app"), **summarize_runs(worker_runs, "worker")},
+        "heavy_modules": {"app": app_runs[0]["heavy_modules"], "worker": worker_runs[0]["heavy_modules"]},
+        "slowest_imports": slowest_imports(profiled["importtime"], args.top),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf8") as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline["results"], args.tolerance)
+        if regressions:
+            print("\nRegressions beyond tolerance:\n  " + "\n  ".join(regressions))
+            return 1
+        print("\nNo regressions beyond tolerance.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.collection_registry import CollectionRegistry
+
+
+class FakeVectorStore:
+    def __init__(self, persist_directory: str):
+        self.persist_directory = persist_directory
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def make_registry(tmp_path, max_loaded: int = 2) -> CollectionRegistry:
+    """ Returns a registry whose collections `a`, `b` and `c` have source directories. """
+    for name in ("a", "b", "c"):
+        os.makedirs(tmp_path / "sources" / name)
+    return CollectionRegistry(
+        persist_directory=str(tmp_path / "db"),
+        source_directory=str(tmp_path / "source_documents"),
+        collections_source_directory=str(tmp_path / "sources"),
+        create_vector_store=FakeVectorStore,
+        create_answer_cache=lambda: SimpleNamespace(hits=0, misses=0),
+        max_loaded=max_loaded
+    )
+
+
+def test_collections_are_laid_out_next_to_the_default_one(tmp_path):
+    registry = make_registry(tmp_path)
+
+    assert registry.resolve(None) == "default"
+    assert registry.persist_directory("default") == str(tmp_path / "db")
+    assert registry.persist_directory("a") == os.path.join(str(tmp_path / "db"), "collections", "a")
+    assert registry.source_directory("a") == str(tmp_path / "sources" / "a")
+    assert registry.get("a").vector_store.persist_directory == registry.persist_directory("a")
+
+
+def test_invalid_and_unknown_collections_are_rejected(tmp_path):
+    registry = make_registry(tmp_path)
+
+    for name in ("../a", "a b", "-a", "x" * 65):
+        with pytest.raises(ValueError):
+            registry.get(name)
+    with pytest.raises(ValueError):
+        registry.get("missing")
+    assert registry.loaded() == []
+
+
+def test_collection_is_loaded_once(tmp_path):
+    registry = make_registry(tmp_path)
+
+    assert registry.get("a") is registry.get("a")
+    assert registry.get() is registry.get("default")
+
+
+def test_least_recently_used_idle_collections_are_evicted(tmp_path):
+    registry = make_registry(tmp_path)
+    a = registry.get("a")
+    registry.get("b")
+    registry.get("a")
+
+    registry.get("c")
+
+    assert registry.loaded() == ["a", "c"]
+    assert not a.vector_store.closed
+    assert registry.get("b") is not None
+    assert registry.loaded() == ["c", "b"]
+    assert a.vector_store.closed
+
+
+def test_leased_collections_stay_loaded(tmp_path):
+    registry = make_registry(tmp_path, max_loaded=1)
+
+    with registry.lease("a") as a, registry.lease("b") as b:
+        c = registry.get("c")
+        assert sorted(registry.loaded()) == ["a", "b", "c"]
+        assert not a.vector_store.closed and not b.vector_store.closed
+
+    # Released last, `a` is the most recently used
+    assert registry.loaded() == ["a"]
+    assert b.vector_store.closed and c.vector_store.closed
+    assert not a.vector_store.closed
+
+
+def test_released_collection_is_kept_until_the_budget_is_exceeded(tmp_path):
+    registry = make_registry(tmp_path)
+    a = registry.acquire("a")
+    registry.release(a)
+
+    assert registry.loaded() == ["a"]
+    assert registry.get("a") is a
+
+
+def test_answer_cache_counts_include_evicted_collections(tmp_path):
+    registry = make_registry(tmp_path, max_loaded=1)
+    a = registry.get("a")
+    a.answer_cache.hits, a.answer_cache.misses = 2, 3
+
+    b = registry.get("b")
+    b.answer_cache.hits = 1
+
+    assert registry.loaded() == ["b"]
+    assert registry.answer_cache_counts() == (3, 3)
@@ -0,0 +1,63 @@
+import pytest
+
+from app.core.document_loaders import PDFPageLoader, count_pdf_pages
+
+pytest.importorskip("pdfminer")
+
+
+def write_pdf(path, pages: int) -> str:
+    """ Writes a PDF whose pages read "Page 1", "Page 2" and so on. """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i in range(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 300 300] /Contents {5 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 3 0 R >> >> >>".encode()
+        )
+        content = f"BT /F1 12 Tf 50 150 Td (Page {i + 1}) Tj ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+    pdf, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(pdf))
+    return str(path)
+
+
+def load(file_path: str, page_range=None) -> list:
+    """ Returns the page numbers and texts a loader yields. """
+    return [(doc.metadata["page"], doc.page_content.strip()) for doc in PDFPageLoader(file_path, page_range).lazy_load()]
+
+
+def test_all_pages_are_loaded_without_a_range(tmp_path):
+    file_path = write_pdf(tmp_path / "manual.pdf", 3)
+
+    assert count_pdf_pages(file_path) == 3
+    assert load(file_path) == [(1, "Page 1"), (2, "Page 2"), (3, "Page 3")]
+
+
+def test_page_range_loads_its_pages_only(tmp_path):
+    file_path = write_pdf(tmp_path / "manual.pdf", 5)
+
+    assert load(file_path, (1, 3)) == [(2, "Page 2"), (3, "Page 3")]
+    assert load(file_path, (4, 10)) == [(5, "Page 5")]
+
+
+def test_ranges_split_a_pdf_without_gaps_or_overlaps(tmp_path):
+    file_path = write_pdf(tmp_path / "manual.pdf", 5)
+
+    pages = [page for start in range(0, 5, 2) for page, _ in load(file_path, (start, start + 2))]
+
+    assert pages == [1, 2, 3, 4, 5]
+
+
+def test_empty_range_loads_nothing(tmp_path):
+    file_path = write_pdf(tmp_path / "manual.pdf", 3)
+
+    assert load(file_path, (2, 2)) == []
@@ -0,0 +1,88 @@
+import os
+import time
+
+from app.core import file_index
+from app.core.file_index import FileIndex, scan_directory, stat_files
+
+EXTENSIONS = {".txt", ".pdf"}
+
+
+def write(root, source: str, text: str = "text", age_seconds: float = 0) -> None:
+    """ Writes a file, backdating its modification time by age_seconds. """
+    path = root.joinpath(*source.split("/"))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf8")
+    if age_seconds:
+        modified = time.time() - age_seconds
+        os.utime(path, (modified, modified))
+
+
+def test_scan_directory_skips_hidden_files_and_directories(tmp_path):
+    for source in ["a.txt", "docs/b.PDF", "docs/c.md", ".hidden.txt", "docs/.cache/d.txt", ".git/e.txt"]:
+        write(tmp_path, source)
+
+    assert sorted(scan_directory(str(tmp_path), EXTENSIONS)) == ["a.txt", "docs/b.PDF"]
+
+
+def test_stat_files_skips_the_files_a_scan_skips(tmp_path):
+    sources = ["a.txt", "docs/c.md", "docs/.cache/d.txt", ".git/e.txt", "missing.txt", "docs"]
+    for source in sources[:4]:
+        write(tmp_path, source)
+
+    stats = stat_files(str(tmp_path), sources, EXTENSIONS)
+
+    assert sorted(stats) == ["a.txt"]
+    assert sorted(stats) == sorted(scan_directory(str(tmp_path), EXTENSIONS))
+
+
+def test_unchanged_files_reuse_their_hash(tmp_path, monkeypatch):
+    source_dir = tmp_path / "source"
+    write(source_dir, "a.txt", "old", age_seconds=60)
+    index = FileIndex(str(tmp_path))
+    first = index.hash_files(str(source_dir), scan_directory(str(source_dir), EXTENSIONS))
+    index.save()
+
+    hashed = []
+    monkeypatch.setattr(file_index, "hash_file", lambda path: hashed.append(path) or "rehashed")
+    reloaded = FileIndex(str(tmp_path))
+    second = reloaded.hash_files(str(source_dir), scan_directory(str(source_dir), EXTENSIONS))
+
+    assert second == first
+    assert hashed == []
+
+
+def test_modified_files_are_hashed_again(tmp_path):
+    write(tmp_path, "a.txt", "old", age_seconds=60)
+    index = FileIndex(str(tmp_path / "persist"))
+    first = index.hash_files(str(tmp_path), scan_directory(str(tmp_path), EXTENSIONS))
+
+    write(tmp_path, "a.txt", "new content", age_seconds=30)
+    second = index.hash_files(str(tmp_path), scan_directory(str(tmp_path), EXTENSIONS))
+
+    assert second["a.txt"] != first["a.txt"]
+
+
+def test_hashes_taken_right_after_a_write_are_not_reused(tmp_path):
+    write(tmp_path, "a.txt", "old")
+    index = FileIndex(str(tmp_path / "persist"))
+    first = index.hash_files(str(tmp_path), scan_directory(str(tmp_path), EXTENSIONS))
+    stat = os.stat(tmp_path / "a.txt")
+
+    # Same size and timestamp, different content: only detected by hashing again
+    (tmp_path / "a.txt").write_text("new", encoding="utf8")
+    os.utime(tmp_path / "a.txt", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    second = index.hash_files(str(tmp_path), scan_directory(str(tmp_path), EXTENSIONS))
+
+    assert second["a.txt"] != first["a.txt"]
+
+
+def test_retain_and_forget_drop_removed_files(tmp_path):
+    write(tmp_path, "a.txt")
+    write(tmp_path, "b.txt")
+    index = FileIndex(str(tmp_path / "persist"))
+    index.hash_files(str(tmp_path), scan_directory(str(tmp_path), EXTENSIONS))
+
+    index.retain(["a.txt"])
+    assert sorted(index.files) == ["a.txt"]
+    index.forget(["a.txt"])
+    assert index.files == {}
@@ -0,0 +1,97 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.schemas.job_schema import JobStatus
+from app.services.ingest_job_service import IngestJobService
+
+
+def make_service(tmp_path) -> IngestJobService:
+    """ Returns a job service recording its jobs in tmp_path, without a worker. """
+    return IngestJobService(SimpleNamespace(root_directory=str(tmp_path)))
+
+
+def start(service: IngestJobService, job_id: str) -> None:
+    """ Marks a queued job as running, as a worker claiming it would. """
+    with service._transaction() as jobs:
+        jobs[job_id].status = JobStatus.RUNNING
+
+
+def test_full_scans_coalesce_into_the_queued_job(tmp_path):
+    service = make_service(tmp_path)
+
+    first = service._submit("default", "/src", None)
+    second = service._submit("default", "/src", None)
+
+    assert second.job_id == first.job_id
+    assert len(asyncio.run(service.list_jobs())) == 1
+
+
+def test_paths_are_added_to_the_queued_job(tmp_path):
+    service = make_service(tmp_path)
+
+    first = service._submit("default", "/src", ["b.txt"])
+    second = service._submit("default", "/src", ["a.txt", "b.txt"])
+
+    assert second.job_id == first.job_id
+    assert asyncio.run(service.get(first.job_id)).paths == ["a.txt", "b.txt"]
+    assert service._submit("default", "/src", None).paths is None
+
+
+def test_full_scan_coalesces_into_a_running_full_scan(tmp_path):
+    service = make_service(tmp_path)
+    running = service._submit("default", "/src", None)
+    start(service, running.job_id)
+
+    assert service._submit("default", "/src", None).job_id == running.job_id
+
+
+def test_full_scan_is_queued_while_a_path_scoped_job_runs(tmp_path):
+    service = make_service(tmp_path)
+    running = service._submit("default", "/src", ["a.txt"])
+    start(service, running.job_id)
+
+    full_scan = service._submit("default", "/src", None)
+
+    assert full_scan.job_id != running.job_id
+    assert full_scan.paths is None
+    assert asyncio.run(service.get(full_scan.job_id)).status == JobStatus.QUEUED
+
+
+def test_changed_paths_are_queued_while_a_full_scan_runs(tmp_path):
+    service = make_service(tmp_path)
+    running = service._submit("default", "/src", None)
+    start(service, running.job_id)
+
+    queued = service._submit("default", "/src", ["a.txt"])
+
+    assert queued.job_id != running.job_id
+    assert queued.paths == ["a.txt"]
+
+
+def test_jobs_of_other_collections_are_separate(tmp_path):
+    service = make_service(tmp_path)
+
+    default = service._submit("default", "/src", None)
+    manuals = service._submit("manuals", "/collections/manuals", None)
+
+    assert default.job_id != manuals.job_id
+    assert [job.collection for job in asyncio.run(service.list_jobs())] == ["default", "manuals"]
+
+
+def test_job_records_are_shared_between_services(tmp_path):
+    submitted = make_service(tmp_path)._submit("default", "/src", None)
+
+    other_process = make_service(tmp_path)
+
+    assert asyncio.run(other_process.get(submitted.job_id)) == submitted
+
+
+def test_jobs_run_by_this_process_report_their_latest_state(tmp_path):
+    service = make_service(tmp_path)
+    service._submit("default", "/src", None)
+    claimed = service._claim()
+
+    claimed.progress = "Ingesting: 3 files"
+
+    assert asyncio.run(service.get(claimed.job_id)).progress == "Ingesting: 3 files"
+    assert make_service(tmp_path)._read()[claimed.job_id].progress is None
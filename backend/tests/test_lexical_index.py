@@ -0,0 +1,106 @@
+import os
+
+from app.core.lexical_index import BM25Index
+from app.core.metadata import MetadataFilter
+
+
+def make_index(tmp_path) -> BM25Index:
+    """ Returns an index of three chunks, persisted to the journal only. """
+    index = BM25Index(str(tmp_path))
+    index.upsert(
+        ["pump", "lathe", "press"],
+        ["Hydraulic pump leaks oil", "Lathe spindle noise", "Press leaks hydraulic fluid"],
+        [{"machine": "Pump 03"}, {"machine": "Lathe 02"}, {"machine": "Press 01"}]
+    )
+    index.persist()
+    return index
+
+
+def texts(index: BM25Index, query: str, metadata_filter: MetadataFilter = None) -> list:
+    """ Returns the texts of the chunks found for a query, best first. """
+    return [document.page_content for document, _ in index.search(query, 10, metadata_filter)]
+
+
+def test_search_ranks_chunks_by_matching_terms(tmp_path):
+    index = make_index(tmp_path)
+
+    assert texts(index, "hydraulic leaks oil") == ["Hydraulic pump leaks oil", "Press leaks hydraulic fluid"]
+    assert texts(index, "unknown") == []
+    assert index.contains_terms(["leaks", "hydraulic"])
+    assert not index.contains_terms(["leaks", "unknown"])
+
+
+def test_search_skips_chunks_outside_the_filter(tmp_path):
+    index = make_index(tmp_path)
+    metadata_filter = MetadataFilter.parse({"machine": "Press 01"}, ["machine"])
+
+    assert texts(index, "leaks", metadata_filter) == ["Press leaks hydraulic fluid"]
+
+
+def test_journal_is_replayed_on_load(tmp_path):
+    index = make_index(tmp_path)
+    index.delete(["lathe"])
+    index.upsert(["pump"], ["Hydraulic pump replaced"], [{"machine": "Pump 03"}])
+    index.persist()
+
+    reloaded = BM25Index(str(tmp_path))
+
+    assert not os.path.exists(reloaded.path)
+    assert reloaded.count() == 2
+    assert texts(reloaded, "pump") == ["Hydraulic pump replaced"]
+    assert texts(reloaded, "lathe") == []
+
+
+def test_compaction_moves_the_journal_into_the_snapshot(tmp_path):
+    index = make_index(tmp_path)
+    index.compact()
+    index.delete(["press"])
+    index.persist()
+
+    reloaded = BM25Index(str(tmp_path))
+
+    assert os.path.exists(reloaded.path)
+    assert reloaded.count() == 2
+    assert texts(reloaded, "leaks") == ["Hydraulic pump leaks oil"]
+
+
+def test_journal_entries_already_in_the_snapshot_are_skipped(tmp_path):
+    index = make_index(tmp_path)
+    with open(index.journal_path, "r", encoding="utf8") as f:
+        journal = f.read()
+    index.delete(["pump"])
+    index.compact()
+    # A crash between writing the snapshot and removing the journal leaves the old entries
+    with open(index.journal_path, "w", encoding="utf8") as f:
+        f.write(journal)
+
+    reloaded = BM25Index(str(tmp_path))
+
+    assert reloaded.count() == 2
+    assert texts(reloaded, "pump") == []
+
+
+def test_truncated_journal_entry_is_dropped_and_compacted(tmp_path):
+    index = make_index(tmp_path)
+    with open(index.journal_path, "a", encoding="utf8") as f:
+        f.write('{"generation": 0, "delete": ["pu')
+
+    reloaded = BM25Index(str(tmp_path))
+    reloaded.delete(["lathe"])
+    reloaded.persist()
+
+    assert reloaded.count() == 2
+    assert BM25Index(str(tmp_path)).count() == 2
+    assert texts(BM25Index(str(tmp_path)), "pump") == ["Hydraulic pump leaks oil"]
+
+
+def test_reset_deletes_the_persisted_index(tmp_path):
+    index = make_index(tmp_path)
+    index.compact()
+
+    index.reset()
+
+    assert index.count() == 0
+    assert not os.path.exists(index.path)
+    assert not os.path.exists(index.journal_path)
+    assert BM25Index(str(tmp_path)).count() == 0
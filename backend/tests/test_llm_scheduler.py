@@ -0,0 +1,234 @@
+import asyncio
+
+import pytest
+
+from app.core.llm_scheduler import AdmissionRejected, LLMScheduler
+
+
+async def hold(scheduler: LLMScheduler, release: asyncio.Event, order: list, name: str, priority: str = None) -> None:
+    """ Holds a slot until released, recording when it was admitted. """
+    async with scheduler.slot(priority):
+        order.append(name)
+        await release.wait()
+
+
+async def settle() -> None:
+    """ Lets scheduled tasks run until they block. """
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_runs_are_admitted_while_slots_are_free():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=2, max_queue=0)
+        async with scheduler.slot() as first_wait, scheduler.slot("batch") as second_wait:
+            running = scheduler.running
+        return first_wait, second_wait, running, scheduler.running
+
+    first_wait, second_wait, running, after = asyncio.run(scenario())
+
+    assert first_wait < 0.1 and second_wait < 0.1
+    assert running == 2
+    assert after == 0
+
+
+def test_full_queue_rejects_runs_of_the_same_priority():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+        release, order = asyncio.Event(), []
+        running = asyncio.create_task(hold(scheduler, release, order, "running"))
+        await settle()
+        waiting = asyncio.create_task(hold(scheduler, release, order, "waiting"))
+        await settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with scheduler.slot():
+                pass
+        release.set()
+        await asyncio.gather(running, waiting)
+        return rejected.value, order
+
+    rejected, order = asyncio.run(scenario())
+
+    assert rejected.reason == "queue_full"
+    assert rejected.priority == "interactive"
+    assert rejected.retry_after >= 1
+    assert order == ["running", "waiting"]
+
+
+def test_higher_priority_run_sheds_the_lowest_priority_waiter():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=2)
+        release, order = asyncio.Event(), []
+        running = asyncio.create_task(hold(scheduler, release, order, "running"))
+        await settle()
+        older_batch = asyncio.create_task(hold(scheduler, release, order, "older batch", "batch"))
+        newer_batch = asyncio.create_task(hold(scheduler, release, order, "newer batch", "batch"))
+        await settle()
+        interactive = asyncio.create_task(hold(scheduler, release, order, "interactive", "interactive"))
+        await settle()
+        release.set()
+        results = await asyncio.gather(running, older_batch, newer_batch, interactive, return_exceptions=True)
+        return results, order
+
+    results, order = asyncio.run(scenario())
+
+    shed = results[2]
+    assert isinstance(shed, AdmissionRejected)
+    assert shed.reason == "shed"
+    assert shed.priority == "batch"
+    assert order == ["running", "interactive", "older batch"]
+
+
+def test_low_priority_run_cannot_shed_a_higher_priority_waiter():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+        release, order = asyncio.Event(), []
+        running = asyncio.create_task(hold(scheduler, release, order, "running"))
+        await settle()
+        waiting = asyncio.create_task(hold(scheduler, release, order, "waiting", "interactive"))
+        await settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with scheduler.slot("batch"):
+                pass
+        release.set()
+        await asyncio.gather(running, waiting)
+        return rejected.value
+
+    assert asyncio.run(scenario()).reason == "queue_full"
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=4)
+        release, order = asyncio.Event(), []
+        tasks = [asyncio.create_task(hold(scheduler, release, order, "running"))]
+        await settle()
+        for name, priority in [("batch 1", "batch"), ("interactive 1", "interactive"),
+                               ("batch 2", "batch"), ("interactive 2", "interactive")]:
+            tasks.append(asyncio.create_task(hold(scheduler, release, order, name, priority)))
+            await settle()
+        release.set()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["running", "interactive 1", "interactive 2", "batch 1", "batch 2"]
+
+
+def test_waiting_longer_than_the_queue_timeout_is_rejected():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=4, queue_timeout=0.05)
+        release, order = asyncio.Event(), []
+        running = asyncio.create_task(hold(scheduler, release, order, "running"))
+        await settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with scheduler.slot():
+                pass
+        queued = scheduler.queued
+        release.set()
+        await running
+        return rejected.value, queued, scheduler.running
+
+    rejected, queued, running = asyncio.run(scenario())
+
+    assert rejected.reason == "timeout"
+    assert queued == 0
+    assert running == 0
+
+
+def test_runs_are_rejected_when_the_expected_wait_exceeds_the_timeout():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=4, queue_timeout=1.0)
+        scheduler._observe(5.0)
+        release, order = asyncio.Event(), []
+        running = asyncio.create_task(hold(scheduler, release, order, "running"))
+        await settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with scheduler.slot():
+                pass
+        release.set()
+        await running
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+
+    assert rejected.reason == "slo"
+    assert rejected.retry_after == 5
+
+
+def test_retry_after_follows_the_expected_wait():
+    scheduler = LLMScheduler(max_concurrency=2)
+    assert scheduler.retry_after() == 1
+
+    scheduler._observe(3.0)
+    assert scheduler.expected_wait(0) == 1.5
+    assert scheduler.expected_wait(3) == 6.0
+    assert scheduler.retry_after() == 2
+
+    scheduler._observe(13.0)
+    assert scheduler.retry_after() == 3
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=4)
+        release, order = asyncio.Event(), []
+        running = asyncio.create_task(hold(scheduler, release, order, "running"))
+        await settle()
+        cancelled = asyncio.create_task(hold(scheduler, release, order, "cancelled"))
+        waiting = asyncio.create_task(hold(scheduler, release, order, "waiting"))
+        await settle()
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        queued = scheduler.queued
+        release.set()
+        await asyncio.gather(running, waiting)
+        return queued, order, scheduler.running
+
+    queued, order, running = asyncio.run(scenario())
+
+    assert queued == 1
+    assert order == ["running", "waiting"]
+    assert running == 0
+
+
+def test_slot_handed_to_a_cancelled_waiter_is_passed_on():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=4)
+        release, order = asyncio.Event(), []
+        running = asyncio.create_task(hold(scheduler, release, order, "running"))
+        await settle()
+        cancelled = asyncio.create_task(hold(scheduler, release, order, "cancelled"))
+        waiting = asyncio.create_task(hold(scheduler, release, order, "waiting"))
+        await settle()
+        # The finishing run hands its slot over before the waiter sees its cancellation
+        release.set()
+        await running
+        cancelled.cancel()
+        await asyncio.gather(cancelled, waiting, return_exceptions=True)
+        return order, scheduler.running, scheduler.queued
+
+    order, running, queued = asyncio.run(scenario())
+
+    assert order == ["running", "waiting"]
+    assert running == 0
+    assert queued == 0
+
+
+def test_disabled_admission_control_admits_every_run():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=0, max_queue=0)
+        async with scheduler.slot(), scheduler.slot(), scheduler.slot() as wait:
+            return wait, scheduler.running
+
+    assert asyncio.run(scenario()) == (0.0, 0)
+
+
+def test_unknown_priority_is_rejected():
+    scheduler = LLMScheduler(priorities=("interactive", "batch"))
+
+    assert scheduler.resolve(None) == "interactive"
+    assert scheduler.resolve("batch") == "batch"
+    with pytest.raises(ValueError):
+        scheduler.resolve("urgent")
+    with pytest.raises(ValueError):
+        LLMScheduler(priorities=(" ",))
@@ -0,0 +1,106 @@
+from app.core.manifest import IngestManifest, make_chunk_ids
+
+
+def make_manifest(tmp_path) -> IngestManifest:
+    """ Returns a saved manifest of two ingested files. """
+    manifest = IngestManifest(str(tmp_path))
+    manifest.update("a.txt", "hash-a", make_chunk_ids("a.txt", ["one", "two"]), "chunking-1")
+    manifest.update("docs/b.txt", "hash-b", make_chunk_ids("docs/b.txt", ["three"]), "chunking-1")
+    manifest.save()
+    return manifest
+
+
+def test_diff_detects_added_modified_removed_and_unchanged_files(tmp_path):
+    manifest = IngestManifest(str(tmp_path))
+    manifest.update("a.txt", "hash-a", ["1"], "chunking-1")
+    manifest.update("b.txt", "hash-b", ["2"], "chunking-1")
+    manifest.update("c.txt", "hash-c", ["3"], "chunking-1")
+
+    changes = manifest.diff(
+        {"a.txt": "hash-a", "b.txt": "hash-b2", "d.txt": "hash-d"},
+        {"a.txt": "chunking-1", "b.txt": "chunking-1", "d.txt": "chunking-1"}
+    )
+
+    assert changes.added == {"d.txt": "hash-d"}
+    assert changes.modified == {"b.txt": "hash-b2"}
+    assert changes.removed == ["c.txt"]
+    assert changes.unchanged == ["a.txt"]
+    assert changes.changed == {"d.txt": "hash-d", "b.txt": "hash-b2"}
+
+
+def test_diff_treats_changed_chunking_settings_as_modified(tmp_path):
+    manifest = make_manifest(tmp_path)
+
+    changes = manifest.diff(
+        {"a.txt": "hash-a", "docs/b.txt": "hash-b"},
+        {"a.txt": "chunking-2", "docs/b.txt": "chunking-1"}
+    )
+
+    assert changes.modified == {"a.txt": "hash-a"}
+    assert changes.unchanged == ["docs/b.txt"]
+    assert changes.removed == []
+
+
+def test_diff_of_some_files_only_reports_those_as_removed(tmp_path):
+    manifest = make_manifest(tmp_path)
+
+    changes = manifest.diff({}, {}, sources=["a.txt", "missing.txt"])
+
+    assert changes.removed == ["a.txt"]
+    assert changes.added == {}
+
+
+def test_manifest_round_trips_through_disk(tmp_path):
+    manifest = make_manifest(tmp_path)
+
+    reloaded = IngestManifest(str(tmp_path))
+
+    assert reloaded.exists
+    assert reloaded.files == manifest.files
+    assert reloaded.chunk_ids("a.txt") == manifest.chunk_ids("a.txt")
+    assert reloaded.diff({"a.txt": "hash-a", "docs/b.txt": "hash-b"}, {
+        "a.txt": "chunking-1", "docs/b.txt": "chunking-1"
+    }).changed == {}
+
+
+def test_unreadable_manifest_starts_empty(tmp_path):
+    (tmp_path / "ingest_manifest.json").write_text("{not json", encoding="utf8")
+
+    manifest = IngestManifest(str(tmp_path))
+
+    assert manifest.files == {}
+    assert manifest.diff({"a.txt": "hash-a"}).added == {"a.txt": "hash-a"}
+
+
+def test_removed_file_forgets_its_chunks(tmp_path):
+    manifest = make_manifest(tmp_path)
+
+    manifest.remove("a.txt")
+
+    assert manifest.chunk_ids("a.txt") == []
+    assert manifest.diff({"docs/b.txt": "hash-b"}, {"docs/b.txt": "chunking-1"}).removed == []
+
+
+def test_chunk_ids_only_change_for_edited_chunks():
+    before = make_chunk_ids("a.txt", ["intro", "body", "outro"])
+    after = make_chunk_ids("a.txt", ["intro", "edited body", "outro"])
+
+    assert before[0] == after[0]
+    assert before[2] == after[2]
+    assert before[1] != after[1]
+    assert set(before).difference(after) == {before[1]}
+
+
+def test_chunk_ids_disambiguate_repeated_chunks_and_depend_on_source():
+    ids = make_chunk_ids("a.txt", ["same", "same"])
+
+    assert len(set(ids)) == 2
+    assert make_chunk_ids("b.txt", ["same"])[0] not in ids
+
+
+def test_chunk_ids_change_with_extracted_metadata():
+    plain = make_chunk_ids("a.txt", ["text"], [{}])
+    tagged = make_chunk_ids("a.txt", ["text"], [{"machine_id": "M-100"}])
+
+    assert plain == make_chunk_ids("a.txt", ["text"])
+    assert plain != tagged
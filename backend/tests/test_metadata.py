@@ -0,0 +1,148 @@
+import numpy as np
+import pytest
+
+from app.core.metadata import (
+    MetadataColumns, MetadataExtractor, MetadataFilter, max_key, normalize_value, value_key
+)
+
+FIELDS = ["machine", "date", "issue"]
+
+RECORD_1 = "date: 2023-01-15\nmachine: CNC Machine 01\nissue: Overheating"
+RECORD_2 = "date: 2023-02-20\nmachine: Hydraulic Pump 03\nissue: Leakage"
+
+
+def test_normalize_value_turns_iso_dates_into_numbers():
+    assert normalize_value("2023-01-15") == 20230115
+    assert normalize_value("2023-01-15T10:30:00") == 20230115
+    assert normalize_value("2023-02-30") == "2023-02-30"
+    assert normalize_value("  CNC Machine 01 ") == "CNC Machine 01"
+    assert normalize_value(7) == 7
+
+
+def test_extract_reads_field_lines_and_patterns():
+    extractor = MetadataExtractor(["Machine", "date"], {"part": r"part (P-\d+)"})
+
+    extracted = extractor.extract("Machine: CNC Machine 01\nDATE: 2023-01-15\nReplaced part P-12.")
+
+    assert extracted == {"machine": "CNC Machine 01", "date": 20230115, "part": "P-12"}
+    assert extractor.names == ["machine", "date", "part"]
+
+
+def test_invalid_pattern_is_rejected():
+    with pytest.raises(ValueError):
+        MetadataExtractor(patterns={"part": "("})
+
+
+def test_extract_records_every_value_of_packed_records():
+    extracted = MetadataExtractor(FIELDS).extract(f"{RECORD_1}\n\n{RECORD_2}")
+
+    assert extracted["date"] == 20230115
+    assert extracted[max_key("date")] == 20230220
+    assert extracted["machine"] == "CNC Machine 01"
+    assert extracted[value_key("machine", "Hydraulic Pump 03")] is True
+    assert extracted[value_key("date", 20230220)] is True
+    assert max_key("machine") not in extracted
+
+
+def test_select_keeps_the_extracted_entries_only():
+    extractor = MetadataExtractor(FIELDS)
+    metadata = {"source": "log.txt", "row": 3, **extractor.extract(f"{RECORD_1}\n\n{RECORD_2}")}
+
+    selected = extractor.select(metadata)
+
+    assert "source" not in selected and "row" not in selected
+    assert selected[value_key("issue", "Leakage")] is True
+
+
+def test_fingerprint_follows_the_configuration():
+    assert MetadataExtractor(FIELDS).fingerprint == MetadataExtractor(FIELDS).fingerprint
+    assert MetadataExtractor(FIELDS).fingerprint != MetadataExtractor(FIELDS, {"part": "P-\\d+"}).fingerprint
+
+
+def test_parse_builds_conditions():
+    metadata_filter = MetadataFilter.parse(
+        {"machine": "CNC Machine 01", "issue": ["Leakage", "Noise"], "date": {"gte": "2023-01-01", "lt": 20240101}},
+        FIELDS
+    )
+
+    assert metadata_filter.conditions == [
+        ("machine", "eq", "CNC Machine 01"),
+        ("issue", "in", ["Leakage", "Noise"]),
+        ("date", "gte", 20230101),
+        ("date", "lt", 20240101),
+    ]
+    assert MetadataFilter.parse({}, FIELDS) is None
+    assert MetadataFilter.parse(None, FIELDS) is None
+
+
+@pytest.mark.parametrize("filters", [
+    ["machine"],
+    {"operator": "x"},
+    {"machine": {"gte": "CNC"}},
+    {"date": {"between": [1, 2]}},
+    {"date": {}},
+    {"issue": []},
+    {"issue": [{"nested": 1}]},
+    {"machine": {"eq": None}},
+    {"machine": None},
+])
+def test_parse_rejects_malformed_filters(filters):
+    with pytest.raises(ValueError):
+        MetadataFilter.parse(filters, FIELDS)
+
+
+def test_key_is_canonical():
+    first = MetadataFilter.parse({"machine": "A", "date": {"gte": 1}}, FIELDS)
+    second = MetadataFilter.parse({"date": {"gte": 1}, "machine": "A"}, FIELDS)
+
+    assert first.key == second.key
+
+
+def test_to_chroma_covers_chunks_with_several_values():
+    metadata_filter = MetadataFilter.parse({"machine": "A", "date": {"gte": 20230101, "lte": 20231231}}, FIELDS)
+
+    assert metadata_filter.to_chroma() == {"$and": [
+        {"$or": [{"machine": {"$eq": "A"}}, {value_key("machine", "A"): {"$eq": True}}]},
+        {"$or": [{"date": {"$gte": 20230101}}, {max_key("date"): {"$gte": 20230101}}]},
+        {"date": {"$lte": 20231231}},
+    ]}
+
+
+def test_to_chroma_of_a_single_range_is_a_plain_clause():
+    assert MetadataFilter.parse({"date": {"lt": 5}}, FIELDS).to_chroma() == {"date": {"$lt": 5}}
+
+
+EXTRACTOR = MetadataExtractor(FIELDS)
+CHUNKS = [
+    EXTRACTOR.extract(RECORD_1),
+    EXTRACTOR.extract(RECORD_2),
+    EXTRACTOR.extract(f"{RECORD_1}\n\n{RECORD_2}"),
+    {},
+]
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({"machine": "CNC Machine 01"}, [True, False, True, False]),
+    ({"machine": "Hydraulic Pump 03"}, [False, True, True, False]),
+    ({"issue": ["Leakage", "Noise"]}, [False, True, True, False]),
+    ({"date": 20230220}, [False, True, True, False]),
+    ({"date": {"gte": "2023-02-01"}}, [False, True, True, False]),
+    ({"date": {"lt": "2023-02-01"}}, [True, False, True, False]),
+    ({"date": {"gt": "2023-01-20", "lt": "2023-02-10"}}, [False, False, True, False]),
+    ({"date": {"gt": "2023-03-01"}}, [False, False, False, False]),
+    ({"machine": "CNC Machine 01", "issue": "Overheating"}, [True, False, True, False]),
+])
+def test_matches_and_mask_agree(filters, expected):
+    metadata_filter = MetadataFilter.parse(filters, FIELDS)
+
+    assert [metadata_filter.matches(metadata) for metadata in CHUNKS] == expected
+    assert metadata_filter.mask(MetadataColumns(CHUNKS)).tolist() == expected
+
+
+def test_ranges_skip_non_numeric_values():
+    columns = MetadataColumns([{"date": "unknown"}, {"date": True}, {"date": 3}])
+    metadata_filter = MetadataFilter.parse({"date": {"gte": 1}}, FIELDS)
+
+    assert metadata_filter.mask(columns).tolist() == [False, False, True]
+    assert [metadata_filter.matches(metadata) for metadata in columns.metadatas] == [False, False, True]
+    assert np.isnan(columns.numbers("date")[0])
@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+
+from app.core import reranker as reranker_module
+from app.core.reranker import CrossEncoderReranker, LexicalReranker, create_reranker
+
+
+class FakeCrossEncoder:
+    """ Stands in for `sentence_transformers.CrossEncoder`, counting model loads. """
+
+    loads = 0
+
+    def __init__(self, model_name, device):
+        FakeCrossEncoder.loads += 1
+
+    def predict(self, pairs, batch_size):
+        return [len(document) for _, document in pairs]
+
+
+def test_rerankers_are_shared_per_settings():
+    assert create_reranker("lexical") is create_reranker("lexical")
+    assert create_reranker("cross-encoder", "model-a", 16) is create_reranker("cross-encoder", "model-a", 16)
+    assert create_reranker("cross-encoder", "model-a", 16) is not create_reranker("cross-encoder", "model-b", 16)
+    assert create_reranker("none") is None
+
+
+def test_cross_encoder_model_is_loaded_once(monkeypatch):
+    monkeypatch.setattr(reranker_module, "import_string", lambda path: FakeCrossEncoder)
+    FakeCrossEncoder.loads = 0
+    reranker = CrossEncoderReranker("model")
+    documents = [Document(page_content="short"), Document(page_content="much longer")]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        scores = list(pool.map(lambda _: reranker.score("query", documents), range(16)))
+
+    assert FakeCrossEncoder.loads == 1
+    assert all(score == [5.0, 11.0] for score in scores)
+
+
+def test_lexical_reranker_prefers_documents_covering_the_query():
+    documents = [
+        Document(page_content="The conveyor belt was replaced."),
+        Document(page_content="Hydraulic pump P-12 leaked oil; the pump seal was replaced."),
+        Document(page_content="Pump inspection scheduled."),
+    ]
+
+    scores = LexicalReranker().score("pump seal leak", documents)
+
+    assert max(range(len(documents)), key=scores.__getitem__) == 1
+    assert scores[0] < scores[2]
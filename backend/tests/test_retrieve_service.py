@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.llm_scheduler import AdmissionRejected, LLMScheduler
+from app.core.single_flight import SingleFlight
+from app.services.retrieve_service import RetrieverService
+
+
+class FakeChain:
+    """ Streams the passages and a one-token answer of a query. """
+
+    async def astream(self, inputs):
+        yield {"passages": []}
+        yield {"answer": f"Answer to {inputs['question']}"}
+
+
+class FakeAnswerCache:
+    async def put(self, query, answer, version, scope):
+        pass
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    monkeypatch.setenv("APP_ENV", "benchmark")
+    flights = SingleFlight()
+
+    def make(scheduler: LLMScheduler, priority: str) -> RetrieverService:
+        vector_store = SimpleNamespace(embeddings=object())
+        return RetrieverService(vector_store, FakeAnswerCache(), flights, scheduler, priority)
+
+    return make
+
+
+async def ask(service: RetrieverService, query: str) -> list:
+    """ Follows the flight answering a query, as a session does. """
+    key = service._flight_key(query, "", 1)
+    produce = lambda flight: service._produce(FakeChain(), None, query, None, 1, "", flight)
+    async with service.flights.join(key, produce) as (flight, _):
+        events = []
+        async for kind, value in flight.follow():
+            if kind == "error":
+                raise value
+            events.append(kind)
+        return events
+
+
+def test_identical_queries_of_one_priority_share_a_run(make_service):
+    scheduler = LLMScheduler(max_concurrency=1, max_queue=4)
+    first, second = make_service(scheduler, "batch"), make_service(scheduler, "batch")
+
+    assert first._flight_key("Why?", "", 1) == second._flight_key(" why? ", "", 1)
+
+
+def test_sessions_of_another_priority_do_not_wait_at_the_starting_priority(make_service):
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=1)
+        batch = make_service(scheduler, "batch")
+        interactive = make_service(scheduler, "interactive")
+        busy = asyncio.Event()
+
+        async def occupy():
+            async with scheduler.slot("interactive"):
+                await busy.wait()
+
+        occupying = asyncio.create_task(occupy())
+        await asyncio.sleep(0)
+        batch_session = asyncio.create_task(ask(batch, "pump leak"))
+        await asyncio.sleep(0)
+        interactive_session = asyncio.create_task(ask(interactive, "pump leak"))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        busy.set()
+        await occupying
+        return await asyncio.gather(batch_session, interactive_session, return_exceptions=True)
+
+    batch_result, interactive_result = asyncio.run(scenario())
+
+    # The interactive session starts its own run, which displaces the waiting batch run
+    assert isinstance(batch_result, AdmissionRejected)
+    assert batch_result.reason == "shed"
+    assert batch_result.priority == "batch"
+    assert interactive_result == ["sources", "delta", "end"]
+
+
+def test_retrieve_stage_leaves_out_the_rerank_time(make_service):
+    class SlowChain:
+        """ Takes 50 ms to assemble the context, 40 of them re-ranking. """
+
+        async def astream(self, inputs):
+            await asyncio.sleep(0.05)
+            yield {"passages": []}
+
+    async def scenario():
+        service = make_service(None, "interactive")
+        retriever = SimpleNamespace(last_timings={"retrieval_ms": 10.0, "rerank_ms": 40.0})
+        produce = lambda flight: service._produce(SlowChain(), retriever, "pump leak", None, 1, "", flight)
+        async with service.flights.join("key", produce) as (flight, _):
+            return [value async for kind, value in flight.follow() if kind == "sources"]
+
+    [(_, timings)] = asyncio.run(scenario())
+
+    assert timings["rerank_ms"] == 40.0
+    assert 10.0 <= timings["retrieve_ms"] < 40.0
@@ -0,0 +1,215 @@
+import asyncio
+
+from app.core.single_flight import Flight, SingleFlight
+
+
+async def collect(flight: Flight) -> list:
+    """ Returns every event of a flight. """
+    return [event async for event in flight.follow()]
+
+
+def test_identical_queries_share_one_producer():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+
+        async def produce(flight):
+            nonlocal calls
+            calls += 1
+            flight.publish("delta", "Hello")
+            await release.wait()
+            flight.publish("end", "Hello")
+
+        async def session():
+            async with flights.join("query", produce) as (flight, started):
+                return started, await collect(flight)
+
+        sessions = [asyncio.create_task(session()) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert len(flights) == 1
+        release.set()
+        results = await asyncio.gather(*sessions)
+        return calls, results, len(flights)
+
+    calls, results, in_flight = asyncio.run(scenario())
+
+    assert calls == 1
+    assert [started for started, _ in results] == [True, False, False]
+    assert all(events == [("delta", "Hello"), ("end", "Hello")] for _, events in results)
+    assert in_flight == 0
+
+
+def test_late_joiner_replays_missed_events():
+    async def scenario():
+        flights = SingleFlight()
+        published = asyncio.Event()
+        release = asyncio.Event()
+
+        async def produce(flight):
+            flight.publish("sources", ["a.txt"])
+            flight.publish("delta", "first")
+            published.set()
+            await release.wait()
+            flight.publish("delta", "second")
+
+        async def session():
+            async with flights.join("query", produce) as (flight, _):
+                return await collect(flight)
+
+        leader = asyncio.create_task(session())
+        await published.wait()
+        joiner = asyncio.create_task(session())
+        await asyncio.sleep(0)
+        release.set()
+        return await leader, await joiner
+
+    leader, joiner = asyncio.run(scenario())
+
+    assert joiner == leader == [("sources", ["a.txt"]), ("delta", "first"), ("delta", "second")]
+
+
+def test_producer_failure_reaches_every_waiting_session():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        fail = asyncio.Event()
+
+        async def produce(flight):
+            flight.publish("delta", "partial")
+            started.set()
+            await fail.wait()
+            raise ValueError("LLM unavailable")
+
+        async def session():
+            async with flights.join("query", produce) as (flight, _):
+                return await collect(flight)
+
+        sessions = [asyncio.create_task(session()) for _ in range(3)]
+        await started.wait()
+        fail.set()
+        results = await asyncio.gather(*sessions)
+        return results, len(flights)
+
+    results, in_flight = asyncio.run(scenario())
+
+    for events in results:
+        assert events[0] == ("delta", "partial")
+        kind, error = events[-1]
+        assert kind == "error"
+        assert isinstance(error, ValueError)
+    assert in_flight == 0
+
+
+def test_failed_flight_is_not_reused():
+    async def scenario():
+        flights = SingleFlight()
+        attempts = 0
+
+        async def produce(flight):
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise ValueError("transient")
+            flight.publish("end", "answer")
+
+        results = []
+        for _ in range(2):
+            async with flights.join("query", produce) as (flight, started):
+                results.append((started, await collect(flight)))
+        return attempts, results
+
+    attempts, results = asyncio.run(scenario())
+
+    assert attempts == 2
+    assert results[0][0] and results[1][0]
+    assert results[0][1][-1][0] == "error"
+    assert results[1][1] == [("end", "answer")]
+
+
+def test_cancelled_producer_publishes_an_error():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        producing = []
+
+        async def produce(flight):
+            producing.append(flight)
+            started.set()
+            await asyncio.Event().wait()
+
+        async def session():
+            async with flights.join("query", produce) as (flight, _):
+                return await collect(flight)
+
+        sessions = [asyncio.create_task(session()) for _ in range(2)]
+        await started.wait()
+        producing[0].task.cancel()
+        return await asyncio.gather(*sessions)
+
+    results = asyncio.run(scenario())
+
+    for events in results:
+        kind, error = events[-1]
+        assert kind == "error"
+        assert isinstance(error, RuntimeError)
+
+
+def test_leader_leaving_keeps_the_flight_for_other_sessions():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def produce(flight):
+            started.set()
+            await release.wait()
+            flight.publish("end", "answer")
+
+        async def leader():
+            async with flights.join("query", produce) as (flight, _):
+                await collect(flight)
+
+        async def follower():
+            async with flights.join("query", produce) as (flight, _):
+                return await collect(flight)
+
+        leading = asyncio.create_task(leader())
+        await started.wait()
+        following = asyncio.create_task(follower())
+        await asyncio.sleep(0)
+        leading.cancel()
+        await asyncio.gather(leading, return_exceptions=True)
+        release.set()
+        return await following
+
+    assert asyncio.run(scenario()) == [("end", "answer")]
+
+
+def test_producer_is_cancelled_once_every_session_left():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def produce(flight):
+            started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def session():
+            async with flights.join("query", produce) as (flight, _):
+                await collect(flight)
+
+        sessions = [asyncio.create_task(session()) for _ in range(2)]
+        await started.wait()
+        for task in sessions:
+            task.cancel()
+        await asyncio.gather(*sessions, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return len(flights)
+
+    assert asyncio.run(scenario()) == 0
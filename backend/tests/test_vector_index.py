@@ -0,0 +1,54 @@
+import pytest
+
+from app.core.metadata import MetadataExtractor, MetadataFilter
+from app.core.vector_index import create_vector_index
+
+EXTRACTOR = MetadataExtractor(["machine", "date"])
+TEXTS = [
+    "date: 2023-01-15\nmachine: CNC Machine 01",
+    "date: 2023-02-20\nmachine: Hydraulic Pump 03",
+    "date: 2023-01-15\nmachine: CNC Machine 01\n\ndate: 2023-03-02\nmachine: Lathe 02",
+    "No metadata here.",
+]
+
+
+def fill(index) -> None:
+    """ Stores the chunks with one-hot embeddings and the metadata the ingest gives them. """
+    embeddings = [[1.0 if i == j else 0.0 for j in range(len(TEXTS))] for i in range(len(TEXTS))]
+    metadatas = [{"source": "log.txt", **EXTRACTOR.extract(text)} for text in TEXTS]
+    index.upsert([f"chunk-{i}" for i in range(len(TEXTS))], embeddings, TEXTS, metadatas)
+
+
+@pytest.mark.parametrize("engine", ["numpy", "chroma"])
+@pytest.mark.parametrize("filters", [
+    {"machine": "CNC Machine 01"},
+    {"machine": ["Lathe 02", "Hydraulic Pump 03"]},
+    {"date": {"gte": "2023-02-01"}},
+    {"date": {"lt": "2023-02-01"}},
+    {"date": 20230302},
+    {"machine": "CNC Machine 01", "date": {"gt": "2023-02-01"}},
+])
+def test_filtered_search_returns_the_matching_chunks(tmp_path, engine, filters):
+    index = create_vector_index(engine, str(tmp_path))
+    fill(index)
+    metadata_filter = MetadataFilter.parse(filters, EXTRACTOR.names)
+
+    results = index.search([0.5] * len(TEXTS), len(TEXTS), metadata_filter)
+
+    expected = {text for text in TEXTS if metadata_filter.matches(EXTRACTOR.extract(text))}
+    assert expected
+    assert {document.page_content for document, _ in results} == expected
+
+
+def test_numpy_index_round_trips_through_disk(tmp_path):
+    index = create_vector_index("numpy", str(tmp_path))
+    fill(index)
+    index.delete(["chunk-1"])
+    index.persist()
+
+    reloaded = create_vector_index("numpy", str(tmp_path))
+
+    assert reloaded.count() == 3
+    document, _ = reloaded.search([0.0, 0.0, 1.0, 0.0], 1)[0]
+    assert document.page_content == TEXTS[2]
+    assert document.metadata["machine"] == "CNC Machine 01"
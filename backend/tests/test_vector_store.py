@@ -0,0 +1,51 @@
+from app.core.vector_store import VectorStoreHandle
+
+
+def make_handle(tmp_path) -> VectorStoreHandle:
+    """ Returns a handle on a NumPy index in tmp_path, as each worker process opens one. """
+    return VectorStoreHandle(str(tmp_path), embeddings=object(), engine="numpy")
+
+
+def ingest(handle: VectorStoreHandle, chunk_id: str, text: str) -> None:
+    """ Stores a chunk in both indexes and commits it, as an ingestion does. """
+    handle.get().upsert([chunk_id], [[1.0, 0.0]], [text], [{"source": "a.txt"}])
+    handle.get().persist()
+    handle.get_lexical_index().upsert([chunk_id], [text], [{"source": "a.txt"}])
+    handle.get_lexical_index().persist()
+    handle.refresh()
+
+
+def test_refresh_increments_the_version(tmp_path):
+    handle = make_handle(tmp_path)
+
+    assert handle.version == 0
+    ingest(handle, "chunk-1", "pump leak")
+    ingest(handle, "chunk-2", "lathe noise")
+
+    assert handle.version == 2
+    assert make_handle(tmp_path).version == 2
+
+
+def test_other_processes_reopen_both_indexes_after_an_ingestion(tmp_path):
+    writer, reader = make_handle(tmp_path), make_handle(tmp_path)
+    assert reader.get().count() == 0
+    assert reader.get_lexical_index().count() == 0
+    opened = reader.get()
+
+    ingest(writer, "chunk-1", "pump leak")
+
+    assert reader.version == writer.version == 1
+    assert reader.get() is not opened
+    assert reader.get().count() == 1
+    assert reader.get_lexical_index().search("leak", 1)[0][0].page_content == "pump leak"
+
+
+def test_unchanged_collection_keeps_its_indexes(tmp_path):
+    writer, reader = make_handle(tmp_path), make_handle(tmp_path)
+    ingest(writer, "chunk-1", "pump leak")
+    opened, lexical = reader.get(), reader.get_lexical_index()
+
+    assert reader.get() is opened
+    assert reader.get_lexical_index() is lexical
+    # The writer's own indexes are current and kept too
+    assert writer.get_lexical_index().count() == 1
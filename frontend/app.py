@@ -32,35 +32,30 @@ elif mode == "Retrieve":
     if st.button("Send Query"):
         async def connect_to_retrieve(query):
             uri = "ws://web:5000/retrieve"  # Use service name defined in docker-compose
-            async with websockets.connect(uri) as websocket:
+            # Versioned JSON frames; websockets negotiates per-message compression by default
+            async with websockets.connect(uri, subprotocols=["rag.v1"]) as websocket:
                 await websocket.send(query)
                 response_container = st.empty()
                 full_response = ""
+                sources = []
                 while True:
                     try:
-                        response = await websocket.recv()
-                        if response:
-                            if response.startswith("Full response:"):
-                                full_response = response[len("Full response: "):]
-                                response_container.markdown(full_response.strip())
-                            else:
-                                # Correctly concatenate tokens without adding unnecessary spaces
-                                if full_response and not full_response[-1].isspace() and not response[0].isspace():
-                                    if not response[0].isalnum() and not full_response[-1].isalnum():
-                                        full_response += response
-                                    else:
-                                        full_response += " " + response
-                                else:
-                                    full_response += response
-
-                                # Ensure there's a space after punctuation marks in the current response
-                                full_response = full_response.replace(" .", ". ").replace(" ,", ", ").replace(" !", "! ").replace(" ?", "? ").replace(" ;", "; ").replace(" :", ": ")
-                                
-                                response_container.markdown(full_response.strip())
-                        else:
-                            response_container.text("Received an empty response.")
+                        frame = json.loads(await websocket.recv())
                     except websockets.ConnectionClosed:
                         response_container.text("Connection closed by the server")
                         break
+                    if frame["type"] == "sources":
+                        sources = frame["sources"]
+                    elif frame["type"] == "delta":
+                        full_response += frame["text"]
+                        response_container.markdown(full_response)
+                    elif frame["type"] == "end":
+                        response_container.markdown(full_response or "Received an empty response.")
+                        if sources:
+                            st.caption("Sources: " + ", ".join(f"[{source['id']}] {source['source']}" for source in sources))
+                        break
+                    elif frame["type"] == "error":
+                        response_container.error(frame["message"])
+                        break
         
         asyncio.run(connect_to_retrieve(query))